@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+
+class AdminCache:
+    """Per-chat administrator rosters, fetched in bulk and expired by TTL.
+
+    One getChatAdministrators call answers every admin check in the chat
+    until the roster expires or a chat member update changes it. Concurrent
+    misses for the same chat share a single in-flight fetch.
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self._rosters: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.invalidations = 0
+
+    def get(self, chat_id: int) -> Optional[FrozenSet[int]]:
+        entry = self._rosters.get(chat_id)
+        if entry is None:
+            return None
+        expires_at, admins = entry
+        if time.monotonic() >= expires_at:
+            del self._rosters[chat_id]
+            return None
+        return admins
+
+    def set(self, chat_id: int, admin_ids: Iterable[int]) -> FrozenSet[int]:
+        admins = frozenset(admin_ids)
+        self._rosters[chat_id] = (time.monotonic() + self.ttl, admins)
+        return admins
+
+    async def get_or_fetch(self, chat_id: int,
+                           fetch: Callable[[int], Awaitable[Iterable[int]]]) -> FrozenSet[int]:
+        admins = self.get(chat_id)
+        if admins is not None:
+            self.hits += 1
+            return admins
+
+        self.misses += 1
+        pending = self._inflight.get(chat_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[chat_id] = future
+        try:
+            self.fetches += 1
+            admins = self.set(chat_id, await fetch(chat_id))
+            future.set_result(admins)
+            return admins
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._inflight[chat_id]
+
+    def apply_member_update(self, chat_id: int, user_id: int, is_admin: bool):
+        """Patch a cached roster from a chat member update."""
+        entry = self._rosters.get(chat_id)
+        if entry is None:
+            return
+        expires_at, admins = entry
+        if (user_id in admins) == is_admin:
+            return
+        admins = admins | {user_id} if is_admin else admins - {user_id}
+        self._rosters[chat_id] = (expires_at, admins)
+        self.invalidations += 1
+
+    def invalidate(self, chat_id: int):
+        if self._rosters.pop(chat_id, None) is not None:
+            self.invalidations += 1
+
+    def get_metrics(self) -> Dict:
+        return {
+            "chats": len(self._rosters),
+            "hits": self.hits,
+            "misses": self.misses,
+            "api_calls": self.fetches,
+            # Each check used to cost one getChatMember call
+            "api_calls_saved": self.hits + self.misses - self.fetches,
+            "invalidations": self.invalidations,
+        }
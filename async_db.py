@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry
+from profiling import record_span
+
+DB_CALL_SECONDS = registry.histogram(
+    "bot_db_call_seconds", "Time spent executing a database method", "method")
+DB_QUEUE_SECONDS = registry.histogram(
+    "bot_db_queue_seconds", "Time a database call waited for an executor thread", "executor")
+
+# Methods that write to the database. They all run on one dedicated thread so
+# SQLite sees a single writer and writes from one handler keep their order.
+WRITE_METHODS = frozenset({
+    "add_user_xp",
+    "flush_xp",
+    "refresh_leaderboards",
+    "add_warning",
+    "clear_warnings",
+    "add_mute",
+    "remove_mute",
+    "expire_mutes",
+    "record_moderation",
+    "cleanup_old_data",
+    "save_identity",
+    "save_media_file_id",
+    "forget_media_file_id",
+})
+
+
+class AsyncAnimeBotDatabase:
+    """Awaitable facade over AnimeBotDatabase for use inside async handlers.
+
+    Every public method of the wrapped database is available as a coroutine
+    that runs off the event loop, so a slow fsync never stalls other updates.
+    """
+
+    def __init__(self, db, read_workers: int = 2):
+        self.db = db
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-reader")
+
+    async def run(self, func, *args, write: bool = True, **kwargs):
+        """Run an arbitrary callable on the database executors."""
+        executor = self._write_executor if write else self._read_executor
+        loop = asyncio.get_running_loop()
+        # Written by the executor thread, read here once the call has finished
+        timing = [0.0, 0.0]
+
+        def call():
+            timing[0] = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timing[1] = time.perf_counter()
+
+        queued_at = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, call)
+        finally:
+            if timing[1]:
+                executor_name = "write" if write else "read"
+                method = getattr(func, "__name__", "call")
+                DB_QUEUE_SECONDS.observe(executor_name, timing[0] - queued_at)
+                DB_CALL_SECONDS.observe(method, timing[1] - timing[0])
+                record_span("db_wait", executor_name, timing[0] - queued_at)
+                record_span("db", method, timing[1] - timing[0])
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        write = name in WRITE_METHODS
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self.run(attr, *args, write=write, **kwargs)
+
+        # Cache so later lookups skip __getattr__
+        setattr(self, name, wrapper)
+        return wrapper
+
+    def shutdown(self, wait: bool = True):
+        self._read_executor.shutdown(wait=wait)
+        self._write_executor.shutdown(wait=wait)
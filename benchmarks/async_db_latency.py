@@ -0,0 +1,117 @@
+"""Handler latency under a concurrent update flood: blocking vs async DB access.
+
+Each simulated update awaits one database write that reaches SQLite: a
+warning (the /warn path, default) or an XP gain followed by a forced
+flush_xp(). Plain XP gains only touch the in-memory buffer, so they would not
+measure anything. With the blocking database every write stalls the event
+loop, so the latency of all other in-flight updates climbs with the flood
+size; "other-handler p99" is the number the executor facade is for. The
+writes themselves queue on its single writer thread, so their own latency
+does not improve.
+
+    python benchmarks/async_db_latency.py --messages 2000 --concurrency 200 [--operation warn|xp-flush]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import AnimeBotDatabase  # noqa: E402
+from async_db import AsyncAnimeBotDatabase  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def flood(write, messages: int, concurrency: int, users: int):
+    """Return write handler latencies, lightweight handler latencies and wall time."""
+    latencies = []
+    probe_latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+
+    async def handle(i):
+        arrived = time.perf_counter()
+        async with semaphore:
+            await write(i % users)
+            # Yield once like a real handler awaiting a Telegram reply
+            await asyncio.sleep(0)
+        latencies.append((time.perf_counter() - arrived) * 1000)
+
+    async def probe():
+        # A DB-free handler such as /quote arriving every millisecond
+        while not done.is_set():
+            arrived = time.perf_counter()
+            await asyncio.sleep(0.001)
+            probe_latencies.append((time.perf_counter() - arrived - 0.001) * 1000)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    return latencies, probe_latencies, elapsed
+
+
+def writer(operation: str, db: AnimeBotDatabase):
+    """One update's database work."""
+    if operation == "warn":
+        def write(user_id):
+            db.add_warning(user_id, 1, 0, "bench")
+    else:
+        def write(user_id):
+            db.add_user_xp(user_id, 1, f"user{user_id}", "Bench", 5)
+            db.flush_xp()
+    return write
+
+
+async def run(mode: str, operation: str, messages: int, concurrency: int, users: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AnimeBotDatabase(os.path.join(tmp, "bench.db"))
+        sync_write = writer(operation, db)
+        if mode == "async":
+            adb = AsyncAnimeBotDatabase(db)
+
+            async def write(user_id):
+                return await adb.run(sync_write, user_id)
+        else:
+            adb = None
+
+            async def write(user_id):
+                return sync_write(user_id)
+
+        latencies, probe_latencies, elapsed = await flood(write, messages, concurrency, users)
+        if adb:
+            adb.shutdown()
+        db.close()
+
+    print(f"{mode:>5} {operation}: {messages / elapsed:8.0f} updates/s  "
+          f"p50={statistics.median(latencies):7.2f}ms  "
+          f"p99={percentile(latencies, 99):7.2f}ms  "
+          f"max={max(latencies):7.2f}ms  "
+          f"other-handler p99={percentile(probe_latencies, 99):7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--operation", choices=["warn", "xp-flush"], default="warn")
+    args = parser.parse_args()
+
+    for mode in ("sync", "async"):
+        asyncio.run(run(mode, args.operation, args.messages, args.concurrency, args.users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Replay synthetic update streams through the real handlers against a fake Bot API.
+
+    python benchmarks/bot_harness.py --scenarios message_flood join_raid command_storm \
+        --updates 5000 --output results.json [--baseline previous.json]
+
+The fake Bot API is an in-process HTTP server that answers every method the
+bot uses and records the calls. Telegram's rate limits are lifted unless
+--telegram-limits is given, so the numbers measure the bot, not the queue.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config  # noqa: E402
+
+BOT_ID = 424242
+ADMIN_ID = 1
+FAKE_TOKEN = "424242:harness"
+
+
+# === FAKE BOT API ===
+class FakeBotAPI:
+    """Answers Bot API methods with plausible results and counts every call."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._message_ids = 0
+        self.app = Starlette(routes=[Route("/bot{token}/{method}", self.handle, methods=["POST", "GET"])])
+
+    def _message(self, chat_id, **extra):
+        self._message_ids += 1
+        message = {
+            "message_id": self._message_ids,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "supergroup" if int(chat_id) < 0 else "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "Harness"},
+        }
+        message.update(extra)
+        return message
+
+    async def handle(self, request: Request):
+        method = request.path_params["method"]
+        self.calls[method] += 1
+        # python-telegram-bot posts urlencoded parameters unless uploading files
+        form = {key: values[0] for key, values in parse_qs((await request.body()).decode()).items()}
+        chat_id = form.get("chat_id", "-1")
+
+        if method == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "Harness", "username": "harness_bot",
+                      "can_join_groups": True, "can_read_all_group_messages": True,
+                      "supports_inline_queries": False}
+        elif method == "getChatAdministrators":
+            result = [{"status": "creator", "is_anonymous": False,
+                       "user": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"}}]
+        elif method == "sendPhoto":
+            result = self._message(chat_id, photo=[{
+                "file_id": f"photo-{hash(form.get('photo')) & 0xffff}", "file_unique_id": "u",
+                "width": 512, "height": 512}], caption=form.get("caption"))
+        elif method.startswith("send"):
+            result = self._message(chat_id, text=form.get("text", ""))
+        else:
+            result = True
+        return JSONResponse({"ok": True, "result": result})
+
+
+# === SYNTHETIC UPDATES ===
+class UpdateFactory:
+    def __init__(self, chats: int, users: int):
+        self.chats = [-1000 - i for i in range(chats)]
+        self.users = users
+        self.update_id = 0
+        self.message_id = 0
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, chat_id, user_id, **fields):
+        self.update_id += 1
+        self.message_id += 1
+        message = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"},
+            "from": self._user(user_id),
+        }
+        message.update(fields)
+        return {"update_id": self.update_id, "message": message}
+
+    def text(self):
+        # Skewed: a few users do most of the talking
+        user_id = 2 + int(random.paretovariate(1.2)) % self.users
+        return self._message(random.choice(self.chats), user_id,
+                             text=random.choice(["hi", "best arc ever", "lol", "who is best girl"]))
+
+    def join(self, chat_id):
+        user_id = 2 + random.randrange(self.users * 10)
+        return self._message(chat_id, user_id, new_chat_members=[self._user(user_id)])
+
+    def command(self):
+        chat_id = random.choice(self.chats)
+        command, admin = random.choice([
+            ("/level", False), ("/leaderboard", False), ("/stats", False),
+            ("/userstats", False), ("/rules", False), ("/warnings", False),
+            (f"/warn @user{2 + random.randrange(self.users)} spam", True),
+        ])
+        user_id = ADMIN_ID if admin else 2 + random.randrange(self.users)
+        name = command.split()[0]
+        return self._message(chat_id, user_id, text=command,
+                             entities=[{"type": "bot_command", "offset": 0, "length": len(name)}])
+
+
+def scenario_updates(name: str, factory: UpdateFactory, count: int):
+    if name == "message_flood":
+        return [factory.text() for _ in range(count)]
+    if name == "join_raid":
+        chat_id = factory.chats[0]
+        return [factory.join(chat_id) for _ in range(count)]
+    if name == "command_storm":
+        return [factory.command() for _ in range(count)]
+    raise ValueError(f"Unknown scenario {name}")
+
+
+# === MEASUREMENT ===
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))] * 1000 if values else 0.0
+
+
+def handler_totals(histogram):
+    return {name: (histogram.count(name), histogram.total(name)) for name in histogram.labels()}
+
+
+async def run_scenario(name, bot_module, application, fake_api, factory, args):
+    from telegram import Update
+
+    updates = [Update.de_json(data, application.bot) for data in scenario_updates(name, factory, args.updates)]
+    manager = bot_module.bot_manager
+    db_writes_before = manager.db.get_connection_metrics()["write_queries"]
+    handlers_before = handler_totals(bot_module.HANDLER_SECONDS)
+    api_calls_before = Counter(fake_api.calls)
+    rss_before = rss_kb()
+
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def process(update):
+        async with semaphore:
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(process(update) for update in updates))
+    elapsed = time.perf_counter() - started
+
+    # Let batched work land before counting writes and API calls
+    await asyncio.sleep(config.WELCOME_BATCH_WINDOW + 0.2)
+    await manager.adb.flush_xp()
+
+    latencies.sort()
+    handlers = {}
+    for handler, (calls, spent) in handler_totals(bot_module.HANDLER_SECONDS).items():
+        calls_before, spent_before = handlers_before.get(handler, (0, 0.0))
+        if calls > calls_before:
+            handlers[handler] = {
+                "calls": calls - calls_before,
+                "mean_ms": round((spent - spent_before) / (calls - calls_before) * 1000, 3),
+            }
+
+    return {
+        "updates": len(updates),
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(updates) / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.5), 3),
+        "latency_p99_ms": round(percentile(latencies, 0.99), 3),
+        "latency_max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "db_write_transactions": manager.db.get_connection_metrics()["write_queries"] - db_writes_before,
+        "api_calls": dict(Counter(fake_api.calls) - api_calls_before),
+        "rss_growth_kb": rss_kb() - rss_before,
+        "handlers": handlers,
+    }
+
+
+async def run(args):
+    tmp = tempfile.mkdtemp(prefix="bot-harness-")
+    config.DATABASE_NAME = os.path.join(tmp, "harness.db")
+    config.BOT_TOKEN = FAKE_TOKEN
+    config.ADMIN_IDS = [ADMIN_ID]
+    config.WEB_CONFIG["WEBHOOK_URL"] = None
+    config.WELCOME_BATCH_WINDOW = args.welcome_window
+    if not args.telegram_limits:
+        for key in ("GLOBAL_RATE", "GLOBAL_BURST", "PRIVATE_RATE", "PRIVATE_BURST", "GROUP_BURST"):
+            config.OUTBOUND_CONFIG[key] = 1e9
+        config.OUTBOUND_CONFIG["GROUP_MESSAGES_PER_MINUTE"] = 1e9
+
+    import bot as bot_module
+
+    fake_api = FakeBotAPI()
+    server = uvicorn.Server(uvicorn.Config(fake_api.app, host="127.0.0.1", port=args.api_port,
+                                           log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    application = bot_module.build_application(base_url=f"http://127.0.0.1:{port}/bot")
+    factory = UpdateFactory(args.chats, args.users)
+    results = {"params": vars(args), "scenarios": {}}
+    async with application:
+        flush_task = asyncio.create_task(bot_module.bot_manager.run_xp_flush_task())
+        rss_start = rss_kb()
+        for name in args.scenarios:
+            results["scenarios"][name] = await run_scenario(name, bot_module, application, fake_api, factory, args)
+        results["rss_growth_total_kb"] = rss_kb() - rss_start
+        flush_task.cancel()
+
+    bot_module.bot_manager.adb.shutdown()
+    bot_module.bot_manager.db.close()
+    server.should_exit = True
+    await server_task
+    return results
+
+
+def report(results, baseline=None):
+    for name, result in results["scenarios"].items():
+        line = (f"{name:>14}: {result['updates_per_second']:>8.1f} updates/s  "
+                f"p50 {result['latency_p50_ms']:.2f}ms  p99 {result['latency_p99_ms']:.2f}ms  "
+                f"{result['db_write_transactions']} DB writes  "
+                f"{sum(result['api_calls'].values())} API calls  +{result['rss_growth_kb']}KB RSS")
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous:
+            line += (f"  [throughput x{result['updates_per_second'] / previous['updates_per_second']:.2f}, "
+                     f"p99 x{result['latency_p99_ms'] / max(previous['latency_p99_ms'], 1e-9):.2f}]")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=["message_flood", "join_raid", "command_storm"])
+    parser.add_argument("--updates", type=int, default=5_000, help="updates per scenario")
+    parser.add_argument("--concurrency", type=int, default=config.OUTBOUND_CONFIG["CONCURRENT_UPDATES"])
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--welcome-window", type=float, default=1.0)
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the real outbound rate limits")
+    parser.add_argument("--api-port", type=int, default=0, help="port for the fake Bot API (0 = any free port)")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
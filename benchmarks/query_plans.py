@@ -0,0 +1,91 @@
+"""EXPLAIN QUERY PLAN regression check for the hot SQLite storage queries.
+
+Builds a fresh database through the migration runner and fails if any hot
+query falls back to a full table scan. Run it after touching the schema or
+the SQL in sqlite_storage.py:
+
+    python benchmarks/query_plans.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_storage import SQLiteStorage  # noqa: E402
+from storage import utc_timestamp, warning_partition  # noqa: E402
+
+NOW = datetime.now()
+
+# (name, sql, params) — keep in sync with the queries in sqlite_storage.py
+# {partition} is replaced by the current month's warnings table
+HOT_QUERIES = [
+    ("count_warnings",
+     'SELECT active as count FROM warning_counts WHERE chat_id=? AND user_id=?', (1, 1)),
+    ("count_warnings.all_chats",
+     'SELECT SUM(active) as count FROM warning_counts WHERE user_id=?', (1,)),
+    ("list_warnings",
+     'SELECT * FROM {partition} WHERE chat_id=? AND user_id=? ORDER BY created_at DESC, id DESC', (1, 1)),
+    ("clear_warnings",
+     'DELETE FROM {partition} WHERE chat_id=? AND user_id=?', (1, 1)),
+    ("chat_warning_stats",
+     'SELECT users, warnings, lifetime FROM chat_warning_counts WHERE chat_id=?', (1,)),
+    ("remove_mute",
+     'DELETE FROM mutes WHERE user_id=? AND chat_id=?', (1, 1)),
+    ("expire_mutes",
+     'DELETE FROM mutes WHERE user_id=? AND chat_id=? AND unmute_time<=?', (1, 1, NOW)),
+    ("pending_mutes",
+     'SELECT chat_id, user_id, unmute_time FROM mutes WHERE unmute_time > ?', (NOW,)),
+    ("cleanup.warning_rollup",
+     'SELECT chat_id, user_id, COUNT(*) as n FROM {partition} GROUP BY chat_id, user_id', ()),
+    ("cleanup.mutes",
+     'DELETE FROM mutes WHERE unmute_time < ?', (NOW,)),
+    ("get_level",
+     'SELECT * FROM user_levels WHERE chat_id=? AND user_id=?', (1, 1)),
+    ("top_levels",
+     'SELECT user_id, username, first_name, level, xp, messages_count '
+     'FROM user_levels WHERE chat_id=? ORDER BY level DESC, xp DESC LIMIT ?', (1, 10)),
+    ("get_user_stats",
+     'SELECT * FROM user_stats WHERE chat_id=? AND user_id=?', (1, 1)),
+    ("list_moderation",
+     'SELECT * FROM moderation_events WHERE chat_id=? ORDER BY id DESC LIMIT ?', (1, 10)),
+    ("list_moderation.user",
+     'SELECT * FROM moderation_events WHERE chat_id=? AND user_id=? ORDER BY id DESC LIMIT ?', (1, 1, 10)),
+    ("find_identity",
+     'SELECT user_id, username, first_name FROM user_identities WHERE username_lc=?', ("name",)),
+    ("save_identity.release_username",
+     'UPDATE user_identities SET username=NULL, username_lc=NULL WHERE username_lc=? AND user_id!=?',
+     ("name", 1)),
+]
+
+
+def is_full_scan(detail: str) -> bool:
+    # "SCAN warnings USING COVERING INDEX ..." walks an index, not the table
+    return detail.startswith("SCAN") and "INDEX" not in detail
+
+
+def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "plans.db"))
+        # Creates this month's partition
+        storage.add_warning(1, 1, 1, "plan")
+        partition = warning_partition(utc_timestamp())
+        with storage.pool.reader() as conn:
+            for name, sql, params in HOT_QUERIES:
+                sql = sql.replace("{partition}", partition)
+                plan = [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+                scans = [detail for detail in plan if is_full_scan(detail)]
+                status = "FAIL" if scans else "ok"
+                print(f"[{status:>4}] {name}: {' | '.join(plan)}")
+                failures += bool(scans)
+        storage.close()
+
+    if failures:
+        print(f"{failures} hot queries use a full table scan")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Rank lookup latency: legacy full-table COUNT vs the in-memory RankIndex.
+
+    python benchmarks/rank_latency.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from levels import level_curve  # noqa: E402
+from migrations import apply_migrations  # noqa: E402
+from rank_index import RankIndex  # noqa: E402
+
+LEGACY_RANK_SQL = '''
+    SELECT COUNT(*) as rank FROM user_levels
+    WHERE (level * 1000000 + xp) >
+    (SELECT level * 1000000 + xp FROM user_levels WHERE user_id = ?)
+'''
+
+
+def timed(func, samples):
+    started = time.perf_counter()
+    for sample in samples:
+        func(sample)
+    return (time.perf_counter() - started) / len(samples) * 1e6
+
+
+def bench(size: int, sql_samples: int, index_samples: int):
+    scores = [(user_id, random.randrange(0, 200_000)) for user_id in range(size)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "rank.db"))
+        apply_migrations(conn)
+        conn.executemany(
+            'INSERT INTO user_levels (chat_id, user_id, xp, level) VALUES (1, ?, ?, ?)',
+            ((user_id, xp, level_curve.level_for_xp(xp)) for user_id, xp in scores)
+        )
+        conn.commit()
+        users = [random.randrange(size) for _ in range(sql_samples)]
+        sql_us = timed(lambda user_id: conn.execute(LEGACY_RANK_SQL, (user_id,)).fetchone(), users)
+        conn.close()
+
+    started = time.perf_counter()
+    index = RankIndex(scores)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    users = [random.randrange(size) for _ in range(index_samples)]
+    rank_us = timed(index.rank, users)
+    update_us = timed(lambda user_id: index.update(user_id, index.score(user_id) + 5), users)
+
+    print(f"{size:>9} users: SQL COUNT {sql_us:10.1f}us  "
+          f"RankIndex.rank {rank_us:6.2f}us  update {update_us:6.2f}us  build {build_ms:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--sql-samples", type=int, default=20)
+    parser.add_argument("--index-samples", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        bench(size, args.sql_samples, args.index_samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Measure how update throughput scales with the number of worker processes.
+
+    python benchmarks/scaling.py --workers 1 2 4 8 --updates 20000 [--output scaling.json]
+
+Each run starts a ChatRouter with N workers (the same processes scale-out
+mode runs in production) on a fresh database, routes one synthetic update
+stream through it and times how long the workers take to handle it all.
+The fake Bot API from bot_harness.py runs in its own process so it never
+competes with the front process for a core.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot_harness import ADMIN_ID, FAKE_TOKEN, FakeBotAPI, UpdateFactory, scenario_updates  # noqa: E402
+from workers import ChatRouter  # noqa: E402
+
+# Workers report how many updates they have handled this often
+REPORT_INTERVAL = 0.25
+
+
+def _serve_fake_api(port: int):
+    uvicorn.run(FakeBotAPI().app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until(predicate, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for {what}")
+        await asyncio.sleep(0.05)
+
+
+async def run_workers(workers: int, updates, api_url: str, args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bot-scaling-")
+    overrides = {
+        "DATABASE_NAME": os.path.join(tmp, "scaling.db"),
+        "BOT_TOKEN": FAKE_TOKEN,
+        "ADMIN_IDS": [ADMIN_ID],
+        "LOG_LEVEL": "WARNING",
+        "WEB_CONFIG": {"WEBHOOK_URL": None},
+        "STATS_CONFIG": {"REFRESH_INTERVAL": REPORT_INTERVAL},
+        "PROFILING_CONFIG": {"SLOW_UPDATE_MS": 0},
+        "OUTBOUND_CONFIG": {"GLOBAL_RATE": 1e9, "GLOBAL_BURST": 1e9, "GROUP_MESSAGES_PER_MINUTE": 1e9,
+                            "GROUP_BURST": 1e9, "PRIVATE_RATE": 1e9, "PRIVATE_BURST": 1e9,
+                            "CONCURRENT_UPDATES": args.concurrency},
+    }
+    router = ChatRouter(workers, queue_size=len(updates) + 1, base_url=api_url, overrides=overrides)
+    router.start()
+    collector = asyncio.create_task(router.run_report_collector(REPORT_INTERVAL))
+    try:
+        await wait_until(lambda: len(router.latest) == workers, 120, "workers to start")
+        processed_before = router.processed()
+
+        started = time.perf_counter()
+        for update in updates:
+            while not router.dispatch(update):
+                await asyncio.sleep(0.01)
+        await wait_until(lambda: router.processed() - processed_before >= len(updates),
+                         600, "workers to handle every update")
+        elapsed = time.perf_counter() - started
+    finally:
+        collector.cancel()
+        await asyncio.gather(collector, return_exceptions=True)
+        await asyncio.to_thread(router.stop)
+
+    per_worker = router.get_metrics()["routed"]
+    return {
+        "workers": workers,
+        "updates": len(updates),
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(updates) / elapsed, 1),
+        "routed_per_worker": {str(index): int(count) for index, count in per_worker.items()},
+    }
+
+
+async def run(args) -> dict:
+    port = free_port()
+    api = multiprocessing.get_context("spawn").Process(target=_serve_fake_api, args=(port,), daemon=True)
+    api.start()
+    try:
+        factory = UpdateFactory(args.chats, args.users)
+        updates = scenario_updates(args.scenario, factory, args.updates)
+        results = {"params": vars(args), "cpus": os.cpu_count(), "runs": []}
+        for workers in args.workers:
+            result = await run_workers(workers, updates, f"http://127.0.0.1:{port}/bot", args)
+            results["runs"].append(result)
+            print(f"{workers:>3} workers: {result['updates_per_second']:>9.1f} updates/s "
+                  f"({result['seconds']:.2f}s)", flush=True)
+        return results
+    finally:
+        api.terminate()
+        api.join(5)
+
+
+def report(results):
+    runs = results["runs"]
+    base = runs[0]["updates_per_second"] / runs[0]["workers"]
+    print(f"\nworkers  updates/s  speedup  efficiency   ({results['cpus']} CPUs)")
+    for run in runs:
+        speedup = run["updates_per_second"] / runs[0]["updates_per_second"]
+        efficiency = run["updates_per_second"] / (base * run["workers"])
+        print(f"{run['workers']:>7}  {run['updates_per_second']:>9.1f}  {speedup:>6.2f}x  {efficiency:>9.0%}")
+    if max(run["workers"] for run in runs) > (results["cpus"] or 1):
+        print("note: more workers than CPUs; scaling past the core count is not expected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenario", default="message_flood", choices=["message_flood", "command_storm"])
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--chats", type=int, default=64, help="more chats spread load more evenly")
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent updates per worker")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
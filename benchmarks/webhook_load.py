@@ -0,0 +1,80 @@
+"""Fire synthetic Telegram updates at the bot's webhook and report ingest latency.
+
+Start the bot in webhook mode (WEBHOOK_URL set), then:
+
+    python benchmarks/webhook_load.py --url http://127.0.0.1:8000/telegram --updates 20000 --concurrency 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+
+def make_update(update_id: int, chats: int, users: int) -> dict:
+    chat_id = -1000 - random.randrange(chats)
+    user_id = 1 + random.randrange(users)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"Load {chat_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}",
+                     "username": f"user{user_id}"},
+            "text": random.choice(["hello", "nice episode", "who is best girl", "lol"]),
+        },
+    }
+
+
+async def sender(client, url, headers, ids, args, latencies, failures):
+    for update_id in ids:
+        started = time.perf_counter()
+        try:
+            response = await client.post(url, json=make_update(update_id, args.chats, args.users),
+                                         headers=headers)
+            if response.status_code != 200:
+                failures.append(response.status_code)
+        except httpx.HTTPError as e:
+            failures.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    latencies, failures = [], []
+    # Shared iterator: each sender pulls the next update id until all are sent
+    ids = iter(range(1, args.updates + 1))
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            sender(client, args.url, headers, ids, args, latencies, failures)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    print(f"{len(latencies)} updates in {elapsed:.2f}s: {len(latencies) / elapsed:.0f} updates/s, "
+          f"p50 {percentile(0.5):.2f}ms, p99 {percentile(0.99):.2f}ms, max {latencies[-1] * 1000:.2f}ms, "
+          f"{len(failures)} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/telegram")
+    parser.add_argument("--secret", default=None, help="WEBHOOK_SECRET the bot was started with")
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users", type=int, default=5_000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,52 @@
 import logging
+import os
+import time
+import heapq
+import functools
+import hmac
 import random
 import asyncio
-import sqlite3
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from flask import Flask, render_template, jsonify
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+import contextlib
+import io
+import signal
 import threading
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Route
 
-from telegram import Update, ChatMember, ChatPermissions
+from telegram import Bot, Update, ChatMember, ChatPermissions, User
+from telegram.constants import ChatType, MessageEntityType
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters,
-    ContextTypes, CallbackContext, ChatMemberHandler
+    ContextTypes, CallbackContext, ChatMemberHandler, ApplicationHandlerStop, TypeHandler
 )
 
 from config import config
+from async_db import AsyncAnimeBotDatabase
+from xp_buffer import XPAccumulator
+from levels import level_curve
+from migrations import LEGACY_CHAT_ID
+from storage import ModerationEvent, StorageBackend, StorageError, open_storage
+from rank_index import RankIndex
+from leaderboard_cache import LeaderboardCache
+from rate_limit import TokenBucketLimiter
+from ttl_cache import ExpiringTimestamps
+from admin_cache import AdminCache
+from identity import IdentityIndex
+from mute_scheduler import MuteScheduler
+from outbound import OutboundDispatcher, PRIORITY_COSMETIC
+from join_batcher import JoinBatcher
+from update_order import PerChatUpdateProcessor
+from stats_snapshot import JSONSnapshot
+from metrics import registry, ErrorCountingHandler, LOG_ERRORS
+import profiling
+from profiling import TracingApplication, record_span
+from workers import ChatRouter, pump_inbox, shard_for
 
 # Set up logging
 logging.basicConfig(
@@ -21,53 +54,95 @@ logging.basicConfig(
     level=getattr(logging, config.LOG_LEVEL)
 )
 logger = logging.getLogger(__name__)
+logging.getLogger().addHandler(ErrorCountingHandler(LOG_ERRORS))
 
-# === FLASK WEB SERVER ===
-flask_app = Flask(__name__, template_folder="templates")
+HANDLER_SECONDS = registry.histogram("bot_handler_seconds", "Time spent in each update handler", "handler")
+HANDLER_ERRORS = registry.counter("bot_handler_errors_total", "Exceptions raised out of update handlers", "handler")
+UPDATES_TOTAL = registry.counter("bot_updates_total", "Updates received from Telegram")
 
-@flask_app.route("/")
-def index():
+# === WEB SERVER ===
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "index.html")
+# /stats fields that move on every refresh (the refresh's own queries count
+# too); they are served but kept out of the ETag so idle polls get a 304.
+# Uptime is not in the document at all; it goes in a header per request.
+STATS_VOLATILE_FIELDS = (
+    "database", "xp_buffer", "mute_scheduler", "xp_cooldowns", "anti_spam", "admin_cache",
+    "outbound", "update_processor", "welcome_batches",
+)
+# The one chat whose warning and mute counters /stats reports, labelled as
+# "counters_chat_id" in the document
+STATS_CHAT_ID = 1
+
+async def index(request: Request):
     """Main page for the bot"""
-    return render_template("index.html")
+    return FileResponse(INDEX_PATH)
 
-@flask_app.route("/health")
-def health():
+async def health(request: Request):
     """Health check endpoint"""
-    return jsonify({
+    return JSONResponse({
         "status": "ok", 
         "bot": "Anime Guardian Bot",
         "timestamp": datetime.now().isoformat()
     })
 
-@flask_app.route("/stats")
-def stats():
-    """Bot statistics endpoint"""
+async def stats(request: Request):
+    """Bot statistics endpoint, served from the snapshot run_stats_task keeps fresh"""
+    # In scale-out mode the router merges the snapshots its workers report
+    snapshot = (update_router or bot_manager).stats_snapshot
+    if not snapshot.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    
+    started = update_router.started_at if update_router else bot_manager.start_time.timestamp()
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache",
+        # Computed per request, so it stays current on a 304
+        "X-Uptime-Seconds": str(int(time.time() - started)),
+    }
+    if snapshot.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
+
+async def metrics(request: Request):
+    """Prometheus metrics endpoint"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+def _debug_allowed(request: Request) -> bool:
+    token = config.PROFILING_CONFIG["TOKEN"]
+    if not (config.PROFILING_CONFIG["ENABLED"] and token):
+        return False
+    # Constant-time, so response timing doesn't leak the token
+    return hmac.compare_digest(request.query_params.get("token", "").encode(), token.encode())
+
+async def debug_profile(request: Request):
+    """Profile the running bot: /debug/profile?token=...&seconds=10&mode=sample|cprofile"""
+    if not _debug_allowed(request):
+        return Response(status_code=404)
+    
     try:
-        db = AnimeBotDatabase(config.DATABASE_NAME)
-        leaderboard = db.get_leaderboard(5)
-        chat_stats = db.get_chat_stats(1)  # Default chat ID
-        
-        return jsonify({
-            "status": "ok",
-            "total_users": len(db.get_leaderboard(1000)),
-            "top_users": [
-                {
-                    "username": user['username'] or user['first_name'] or f"User{user['user_id']}",
-                    "level": user['level'],
-                    "xp": user['xp']
-                } for user in leaderboard
-            ],
-            "warnings_issued": chat_stats['total_warnings'],
-            "active_mutes": chat_stats['active_mutes'],
-            "uptime": str(datetime.now() - bot_manager.start_time) if hasattr(bot_manager, 'start_time') else "Unknown"
-        })
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)})
+        seconds = float(request.query_params.get("seconds", 10))
+        seconds = max(0.1, min(seconds, config.PROFILING_CONFIG["MAX_SECONDS"]))
+        dump = await profiling.profile(
+            seconds,
+            request.query_params.get("mode", "sample"),
+            config.PROFILING_CONFIG["SAMPLE_INTERVAL_MS"] / 1000
+        )
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    except RuntimeError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=409)
+    return Response(dump, media_type="text/plain")
+
+async def debug_slow_updates(request: Request):
+    """Span breakdowns of the most recent slow updates"""
+    if not _debug_allowed(request):
+        return Response(status_code=404)
+    return JSONResponse({"threshold_ms": config.PROFILING_CONFIG["SLOW_UPDATE_MS"],
+                         "updates": list(profiling.slow_updates)})
 
-@flask_app.route("/commands")
-def commands():
+async def commands(request: Request):
     """Available commands endpoint"""
-    return jsonify({
+    return JSONResponse({
         "commands": {
             "admin": [
                 "/warn @user [reason] - Warn a user",
@@ -75,7 +150,8 @@ def commands():
                 "/unmute @user - Unmute a user",
                 "/ban @user - Ban a user",
                 "/kick @user - Kick a user",
-                "/warnings [@user] - Check warnings"
+                "/warnings [@user] - Check warnings",
+                "/modlog [@user] - Recent moderation actions"
             ],
             "user": [
                 "/level - Check your level and XP",
@@ -89,325 +165,540 @@ def commands():
         }
     })
 
-def run_flask():
-    """Run Flask web server"""
-    logger.info("Starting Flask web server on port 8000...")
-    flask_app.run(host="0.0.0.0", port=8000, debug=False)
+async def telegram_webhook(request: Request):
+    """Receive updates pushed by Telegram in webhook mode."""
+    secret = config.WEB_CONFIG["WEBHOOK_SECRET"]
+    if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+        return Response(status_code=403)
+    
+    try:
+        data = await request.json()
+        if update_router is not None:
+            # Scale-out mode: the worker owning the chat handles it; a 503
+            # makes Telegram retry later instead of us dropping the update
+            return Response(status_code=200 if update_router.dispatch(data) else 503)
+        update = Update.de_json(data, application.bot)
+    except Exception as e:
+        logger.error(f"Invalid webhook payload: {e}")
+        return Response(status_code=400)
+    
+    # Handlers run in the background; Telegram only needs a quick 200
+    await application.update_queue.put(update)
+    return Response()
+
+web_app = Starlette(routes=[
+    Route("/", index),
+    Route("/health", health),
+    Route("/stats", stats),
+    Route("/commands", commands),
+    Route("/metrics", metrics),
+    Route("/debug/profile", debug_profile),
+    Route("/debug/slow-updates", debug_slow_updates),
+    Route(config.WEB_CONFIG["WEBHOOK_PATH"], telegram_webhook, methods=["POST"]),
+])
+
+class WebServer(uvicorn.Server):
+    """uvicorn server sharing the bot's event loop.
+    
+    uvicorn re-raises SIGINT/SIGTERM once it has shut down; swallow them so
+    the bot can stop cleanly after serve() returns.
+    """
+    
+    @contextlib.contextmanager
+    def capture_signals(self):
+        handled = (signal.SIGINT, signal.SIGTERM)
+        original_handlers = {sig: signal.signal(sig, self.handle_exit) for sig in handled}
+        try:
+            yield
+        finally:
+            for sig, handler in original_handlers.items():
+                signal.signal(sig, handler)
 
 # === DATABASE CLASS ===
+def recompute_stored_levels(storage: StorageBackend) -> int:
+    """Recalculate every stored level from XP with the current level curve."""
+    try:
+        total, changed = storage.recompute_levels(level_curve.levels_for_xp)
+        storage.set_setting('level_curve', level_curve.signature)
+        logger.info(f"Recomputed levels for {total} users ({changed} changed)")
+        return changed
+    except StorageError as e:
+        logger.error(f"Error recomputing levels: {e}")
+        return 0
+
+def ensure_level_curve(storage: StorageBackend):
+    """Recompute stored levels if the curve config changed since the last run."""
+    try:
+        signature = storage.get_setting('level_curve')
+    except StorageError as e:
+        logger.error(f"Error reading level curve setting: {e}")
+        return
+    if signature != level_curve.signature:
+        recompute_stored_levels(storage)
+
+class ChatLevelState:
+    """In-memory rank index and leaderboard cache for one chat."""
+    
+    __slots__ = ("rank_index", "leaderboard")
+    
+    def __init__(self, scores=()):
+        self.rank_index = RankIndex(scores)
+        self.leaderboard = LeaderboardCache(
+            config.LEADERBOARD_CONFIG["CACHE_SIZE"],
+            config.LEADERBOARD_CONFIG["CACHE_TTL"]
+        )
+
 class AnimeBotDatabase:
-    def __init__(self, db_name: str = "anime_bot.db"):
+    def __init__(self, db_name: str = "anime_bot.db", storage: Optional[StorageBackend] = None,
+                 owns: Optional[Callable[[int], bool]] = None):
         self.db_name = db_name
-        self._init_database()
+        self.storage = storage or open_storage(config, db_name)
+        self.xp_buffer = XPAccumulator(config.LEVEL_CONFIG["XP_FLUSH_MAX_PENDING"])
+        self._xp_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # A scale-out worker only loads the chats routed to it (owns), and
+        # leaves the level curve check to the front process, which runs it once
+        self._owns = owns or (lambda chat_id: True)
+        self._chats: Dict[int, ChatLevelState] = {}
+        if owns is None:
+            ensure_level_curve(self.storage)
+        self._load_chat_levels()
+        self.refresh_leaderboards(force=True)
+        self.mutes = MuteScheduler(self._load_pending_mutes())
     
-    def _get_connection(self):
-        try:
-            conn = sqlite3.connect(self.db_name, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            return conn
-        except sqlite3.Error as e:
-            logger.error(f"Database connection error: {e}")
-            raise
+    def _chat_state(self, chat_id: int) -> ChatLevelState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = ChatLevelState()
+            state.leaderboard.load([])
+        return state
     
-    def _init_database(self):
+    def _load_chat_levels(self):
+        """Build the rank index of every chat this process handles from one pass over the stored levels."""
+        scores: Dict[int, List] = {}
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_levels (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    xp INTEGER DEFAULT 0,
-                    level INTEGER DEFAULT 1,
-                    messages_count INTEGER DEFAULT 0,
-                    last_message_time TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS warnings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    chat_id INTEGER,
-                    warned_by INTEGER,
-                    reason TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS mutes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    chat_id INTEGER,
-                    muted_by INTEGER,
-                    duration_hours INTEGER,
-                    unmute_time TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    user_id INTEGER PRIMARY KEY,
-                    warnings_count INTEGER DEFAULT 0,
-                    mutes_count INTEGER DEFAULT 0,
-                    kicks_count INTEGER DEFAULT 0,
-                    bans_count INTEGER DEFAULT 0,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Database initialized successfully")
-        except sqlite3.Error as e:
-            logger.error(f"Database initialization error: {e}")
+            for chat_id, user_id, xp in self.storage.load_level_scores():
+                # Unclaimed pre-per-chat levels show in every chat, so every process keeps them
+                if chat_id == LEGACY_CHAT_ID or self._owns(chat_id):
+                    scores.setdefault(chat_id, []).append((user_id, xp))
+        except StorageError as e:
+            logger.error(f"Error loading rank scores: {e}")
+        self._chats = {chat_id: ChatLevelState(chat_scores) for chat_id, chat_scores in scores.items()}
+    
+    def get_connection_metrics(self) -> Dict:
+        """Storage driver statistics (connection reuse and lock waits for SQLite)."""
+        return self.storage.get_metrics()
+    
+    def get_xp_buffer_metrics(self) -> Dict:
+        with self._xp_lock:
+            return self.xp_buffer.get_metrics()
+    
+    def close(self):
+        self.flush_xp()
+        self.storage.close()
     
-    def get_user_level(self, user_id: int):
+    def get_user_level(self, user_id: int, chat_id: int):
+        with self._xp_lock:
+            pending = self.xp_buffer.get((chat_id, user_id))
+            if pending:
+                return pending.level, pending.xp
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT level, xp FROM user_levels WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            conn.close()
+            result = self._stored_level(chat_id, user_id)
             return (result['level'], result['xp']) if result else (1, 0)
-        except sqlite3.Error as e:
+        except StorageError as e:
             logger.error(f"Error getting user level: {e}")
             return (1, 0)
     
-    def add_user_xp(self, user_id: int, username: str, first_name: str, xp: int):
+    def _stored_level(self, chat_id: int, user_id: int) -> Optional[Dict]:
+        """The user's level row in a chat, falling back to their unclaimed pre-per-chat level.
+        
+        Levels migrated from the global table stay under LEGACY_CHAT_ID, and
+        show in every chat as they did before, until the user's first XP
+        after the upgrade moves the row to that chat (_claim_legacy_level).
+        """
+        result = self.storage.get_level(chat_id, user_id)
+        if result is None:
+            result = self.storage.get_level(LEGACY_CHAT_ID, user_id)
+        return result
+    
+    def _load_level_totals(self, key):
+        chat_id, user_id = key
+        result = self.storage.get_level(chat_id, user_id)
+        if result is None and self._claim_legacy_level(user_id, chat_id):
+            result = self.storage.get_level(chat_id, user_id)
+        return (result['level'], result['xp'], result['messages_count']) if result else (1, 0, 0)
+    
+    def _claim_legacy_level(self, user_id: int, chat_id: int) -> bool:
+        """Move a user's unclaimed pre-per-chat level to chat_id; called with _xp_lock held."""
+        legacy = self._chats.get(LEGACY_CHAT_ID)
+        if legacy is None or user_id not in legacy.rank_index:
+            return False
+        # False if another worker claimed it first; it is not unclaimed either way
+        moved = self.storage.move_level(user_id, LEGACY_CHAT_ID, chat_id)
+        legacy.rank_index.remove(user_id)
+        legacy.leaderboard.remove(user_id)
+        return moved
+    
+    def add_user_xp(self, user_id: int, chat_id: int, username: str, first_name: str, xp: int):
+        """Buffer an XP gain; totals reach storage on the next flush_xp()."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT level, xp FROM user_levels WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            current_time = datetime.now()
-            
-            if result:
-                current_level, current_xp = result['level'], result['xp']
-                new_xp = current_xp + xp
-                new_level = self._calculate_level(new_xp)
-                leveled_up = new_level > current_level
-                
-                cursor.execute('''
-                    UPDATE user_levels 
-                    SET xp=?, level=?, username=?, first_name=?, 
-                    messages_count=messages_count+1, last_message_time=? 
-                    WHERE user_id=?
-                ''', (new_xp, new_level, username, first_name, current_time, user_id))
-            else:
-                new_level, new_xp = 1, xp
-                leveled_up = False
-                cursor.execute('''
-                    INSERT INTO user_levels 
-                    (user_id, username, first_name, xp, level, messages_count, last_message_time)
-                    VALUES (?, ?, ?, ?, ?, 1, ?)
-                ''', (user_id, username, first_name, new_xp, new_level, current_time))
-            
-            conn.commit()
-            conn.close()
+            with self._xp_lock:
+                new_level, new_xp, leveled_up = self.xp_buffer.add(
+                    (chat_id, user_id), username, first_name, xp,
+                    self._load_level_totals, level_curve.level_for_xp
+                )
+                state = self._chat_state(chat_id)
+                state.rank_index.update(user_id, new_xp)
+                state.leaderboard.update(
+                    user_id, username, first_name, new_level, new_xp,
+                    self.xp_buffer.get((chat_id, user_id)).messages_count
+                )
+                should_flush = self.xp_buffer.is_full
+            
+            if should_flush:
+                self.flush_xp()
             return new_level, new_xp, leveled_up
-        except sqlite3.Error as e:
+        except StorageError as e:
             logger.error(f"Error adding user XP: {e}")
             return 1, 0, False
     
-    def _calculate_level(self, xp: int):
-        level, required_xp = 1, 100
-        while xp >= required_xp:
-            level += 1
-            xp -= required_xp
-            required_xp = int(required_xp * 1.5)
-        return level
+    def flush_xp(self):
+        """Write all buffered XP to storage in one batch.
+        
+        The buffer lock is only held to snapshot and to mark rows flushed, so
+        XP keeps accumulating while the rows are written.
+        """
+        with self._flush_lock:
+            with self._xp_lock:
+                rows, covered = self.xp_buffer.snapshot()
+            if not rows:
+                return 0
+            
+            try:
+                saved = self.storage.save_levels(rows)
+            except StorageError as e:
+                logger.error(f"Error flushing buffered XP for {len(rows)} users: {e}")
+                saved = []
+            flushed = {key: covered[key] for key in saved}
+            
+            with self._xp_lock:
+                self.xp_buffer.mark_flushed(flushed)
+            return len(flushed)
+    
+    def recompute_levels(self):
+        """Recalculate every stored level from XP with the current level curve."""
+        self.flush_xp()
+        return recompute_stored_levels(self.storage)
+    
+    def get_leaderboard(self, chat_id: int, limit: int = 10):
+        """A chat's top rows, including unclaimed pre-per-chat levels."""
+        boards = {}
+        with self._xp_lock:
+            for key in (chat_id, LEGACY_CHAT_ID):
+                state = self._chats.get(key)
+                boards[key] = state.leaderboard.top(limit) if state else []
+        return self._merge_leaderboards(self._fill_leaderboards(boards, limit), limit)
+    
+    def get_global_leaderboard(self, limit: int = 10):
+        """Top users across all chats, merged from the per-chat caches."""
+        with self._xp_lock:
+            boards = {chat_id: state.leaderboard.top(min(limit, state.leaderboard.size))
+                      for chat_id, state in self._chats.items()}
+        return self._merge_leaderboards(self._fill_leaderboards(boards, limit), limit)
+    
+    def _fill_leaderboards(self, boards: Dict[int, Optional[List[Dict]]], limit: int):
+        """Query storage for the boards whose cache could not serve them."""
+        return [rows if rows is not None else self._query_leaderboard(chat_id, limit)
+                for chat_id, rows in boards.items()]
     
-    def get_leaderboard(self, limit: int = 10):
+    @staticmethod
+    def _merge_leaderboards(boards: List[List[Dict]], limit: int) -> List[Dict]:
+        """Top rows of several boards, listing each user once with their best row."""
+        best: Dict[int, Dict] = {}
+        for rows in boards:
+            for row in rows:
+                current = best.get(row['user_id'])
+                if current is None or (row['level'], row['xp']) > (current['level'], current['xp']):
+                    best[row['user_id']] = row
+        return heapq.nlargest(limit, best.values(), key=lambda row: (row['level'], row['xp']))
+    
+    def _query_leaderboard(self, chat_id: int, limit: int):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT user_id, username, first_name, level, xp, messages_count 
-                FROM user_levels 
-                ORDER BY level DESC, xp DESC 
-                LIMIT ?
-            ''', (limit,))
-            results = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            return results
-        except sqlite3.Error as e:
+            return self.storage.top_levels(chat_id, limit)
+        except StorageError as e:
             logger.error(f"Error getting leaderboard: {e}")
             return []
     
-    def get_user_rank(self, user_id: int):
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT COUNT(*) as rank FROM user_levels 
-                WHERE (level * 1000000 + xp) > 
-                (SELECT level * 1000000 + xp FROM user_levels WHERE user_id = ?)
-            ''', (user_id,))
-            result = cursor.fetchone()
-            conn.close()
-            return result['rank'] + 1 if result else 1
-        except sqlite3.Error as e:
-            logger.error(f"Error getting user rank: {e}")
-            return 1
+    def refresh_leaderboards(self, force: bool = False):
+        """Reload stale per-chat leaderboard caches from storage after flushing buffered XP."""
+        self.flush_xp()
+        with self._xp_lock:
+            stale = [chat_id for chat_id, state in self._chats.items()
+                     if force or state.leaderboard.is_stale()]
+        
+        for chat_id in stale:
+            rows = self._query_leaderboard(chat_id, config.LEADERBOARD_CONFIG["CACHE_SIZE"])
+            with self._xp_lock:
+                # Re-apply anything buffered since the flush above
+                for row in rows:
+                    pending = self.xp_buffer.get((chat_id, row['user_id']))
+                    if pending:
+                        row.update(level=pending.level, xp=pending.xp, messages_count=pending.messages_count)
+                self._chat_state(chat_id).leaderboard.load(
+                    sorted(rows, key=lambda row: (row['level'], row['xp']), reverse=True)
+                )
+        return len(stale)
+    
+    def get_user_count(self, chat_id: Optional[int] = None) -> int:
+        """Number of users with XP in a chat (or in all chats), without a table scan.
+        
+        Unclaimed pre-per-chat levels count in every chat. Every scale-out
+        worker keeps them, so only the one owning LEGACY_CHAT_ID adds them
+        to its all-chats total.
+        """
+        with self._xp_lock:
+            if chat_id is None:
+                return sum(len(state.rank_index) for key, state in self._chats.items()
+                           if key != LEGACY_CHAT_ID or self._owns(LEGACY_CHAT_ID))
+            return sum(len(self._chats[key].rank_index) for key in (chat_id, LEGACY_CHAT_ID)
+                       if key in self._chats)
+    
+    def get_user_rank(self, user_id: int, chat_id: int):
+        """Rank by XP within a chat from the in-memory indexes.
+        
+        Levels are derived from XP by level_curve, so ordering by XP matches
+        ORDER BY level DESC, xp DESC without touching the table. Unclaimed
+        pre-per-chat levels rank alongside the chat's own rows.
+        """
+        with self._xp_lock:
+            indexes = [self._chats[key].rank_index for key in (chat_id, LEGACY_CHAT_ID) if key in self._chats]
+            score = next((index.score(user_id) for index in indexes if user_id in index), None)
+            if score is None:
+                return 1
+            return 1 + sum(index.count_greater(score) for index in indexes)
     
     def add_warning(self, user_id: int, chat_id: int, warned_by: int, reason: str = "No reason provided"):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO warnings (user_id, chat_id, warned_by, reason)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, chat_id, warned_by, reason))
-            conn.commit()
-            conn.close()
-        except sqlite3.Error as e:
+            self.storage.add_warning(user_id, chat_id, warned_by, reason)
+        except StorageError as e:
             logger.error(f"Error adding warning: {e}")
     
     def get_warning_count(self, user_id: int, chat_id: int):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) as count FROM warnings WHERE user_id=? AND chat_id=?', (user_id, chat_id))
-            result = cursor.fetchone()
-            conn.close()
-            return result['count'] if result else 0
-        except sqlite3.Error as e:
+            return self.storage.count_warnings(user_id, chat_id)
+        except StorageError as e:
             logger.error(f"Error getting warning count: {e}")
             return 0
     
     def get_user_warnings(self, user_id: int, chat_id: int):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM warnings WHERE user_id=? AND chat_id=? ORDER BY created_at DESC', (user_id, chat_id))
-            warnings = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            return warnings
-        except sqlite3.Error as e:
+            return self.storage.list_warnings(user_id, chat_id)
+        except StorageError as e:
             logger.error(f"Error getting user warnings: {e}")
             return []
     
     def clear_warnings(self, user_id: int, chat_id: int):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM warnings WHERE user_id=? AND chat_id=?', (user_id, chat_id))
-            conn.commit()
-            conn.close()
-        except sqlite3.Error as e:
+            self.storage.clear_warnings(user_id, chat_id)
+        except StorageError as e:
             logger.error(f"Error clearing warnings: {e}")
     
+    def _load_pending_mutes(self):
+        """(chat_id, user_id, unmute_at) for every mute in this process's chats that has not expired yet."""
+        try:
+            # A user muted twice keeps the later unmute time
+            pending: Dict[tuple, float] = {}
+            for chat_id, user_id, unmute_time in self.storage.pending_mutes(datetime.now()):
+                if not self._owns(chat_id):
+                    continue
+                unmute_at = unmute_time.timestamp()
+                if unmute_at > pending.get((chat_id, user_id), 0):
+                    pending[(chat_id, user_id)] = unmute_at
+            return [(chat_id, user_id, unmute_at) for (chat_id, user_id), unmute_at in pending.items()]
+        except StorageError as e:
+            logger.error(f"Error loading pending mutes: {e}")
+            return []
+    
     def add_mute(self, user_id: int, chat_id: int, muted_by: int, duration_hours: int):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
             unmute_time = datetime.now() + timedelta(hours=duration_hours)
-            cursor.execute('''
-                INSERT INTO mutes (user_id, chat_id, muted_by, duration_hours, unmute_time)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, chat_id, muted_by, duration_hours, unmute_time))
-            conn.commit()
-            conn.close()
-        except sqlite3.Error as e:
+            self.storage.add_mute(user_id, chat_id, muted_by, duration_hours, unmute_time)
+            self.mutes.schedule(chat_id, user_id, unmute_time.timestamp())
+        except StorageError as e:
             logger.error(f"Error adding mute: {e}")
     
     def remove_mute(self, user_id: int, chat_id: int):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM mutes WHERE user_id=? AND chat_id=?', (user_id, chat_id))
-            conn.commit()
-            conn.close()
-        except sqlite3.Error as e:
+            self.storage.remove_mute(user_id, chat_id)
+            self.mutes.cancel(chat_id, user_id)
+        except StorageError as e:
             logger.error(f"Error removing mute: {e}")
     
-    def get_user_stats(self, user_id: int):
+    def expire_mutes(self, now: Optional[float] = None):
+        """Delete the records of mutes whose unmute time has passed; returns (chat_id, user_id) pairs."""
+        if now is None:
+            now = datetime.now().timestamp()
+        due = self.mutes.pop_due(now)
+        if not due:
+            return []
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM user_levels WHERE user_id=?', (user_id,))
-            level_info = cursor.fetchone()
-            
-            cursor.execute('SELECT COUNT(*) as total_warnings FROM warnings WHERE user_id=?', (user_id,))
-            warning_stats = cursor.fetchone()
-            
-            cursor.execute('SELECT * FROM user_stats WHERE user_id=?', (user_id,))
-            user_stats = cursor.fetchone()
-            
-            conn.close()
+            self.storage.expire_mutes([(chat_id, user_id, datetime.fromtimestamp(unmute_at))
+                                       for chat_id, user_id, unmute_at in due])
+        except StorageError as e:
+            logger.error(f"Error expiring mutes: {e}")
+            # Nothing was deleted; cleanup_old_data removes the rows later
+        return [(chat_id, user_id) for chat_id, user_id, _ in due]
+    
+    def get_user_stats(self, user_id: int, chat_id: int):
+        try:
+            level_info = self._stored_level(chat_id, user_id)
+            user_stats = self.storage.get_user_stats(chat_id, user_id)
             
             stats = {}
             if level_info:
-                stats.update(dict(level_info))
-            if warning_stats:
-                stats['total_warnings'] = warning_stats['total_warnings']
+                stats.update(level_info)
+            with self._xp_lock:
+                pending = self.xp_buffer.get((chat_id, user_id))
+                if pending:
+                    stats['level'], stats['xp'] = pending.level, pending.xp
+                    stats['messages_count'] = pending.messages_count
             if user_stats:
-                stats.update(dict(user_stats))
+                stats.update(user_stats)
             
             return stats
-        except sqlite3.Error as e:
+        except StorageError as e:
             logger.error(f"Error getting user stats: {e}")
             return {}
     
+    def record_moderation(self, events: List[ModerationEvent]):
+        """Log kicks and bans and bump their user_stats counters in one transaction."""
+        try:
+            self.storage.record_moderation(events)
+        except StorageError as e:
+            logger.error(f"Error recording moderation events: {e}")
+    
+    def get_moderation_history(self, chat_id: int, user_id: Optional[int] = None, limit: int = 10):
+        try:
+            return self.storage.list_moderation(chat_id, user_id, limit)
+        except StorageError as e:
+            logger.error(f"Error getting moderation history: {e}")
+            return []
+    
+    def load_media_cache(self) -> Dict[str, str]:
+        """Source URL -> Telegram file_id for every image uploaded before."""
+        try:
+            return self.storage.load_media_cache()
+        except StorageError as e:
+            logger.error(f"Error loading media cache: {e}")
+            return {}
+    
+    def save_media_file_id(self, url: str, file_id: str):
+        try:
+            self.storage.save_media_file_id(url, file_id)
+        except StorageError as e:
+            logger.error(f"Error saving media file_id: {e}")
+    
+    def forget_media_file_id(self, url: str):
+        try:
+            self.storage.forget_media_file_id(url)
+        except StorageError as e:
+            logger.error(f"Error removing media file_id: {e}")
+    
+    def load_identities(self):
+        """(user_id, username, first_name) for every user the bot has seen."""
+        try:
+            return self.storage.load_identities()
+        except StorageError as e:
+            logger.error(f"Error loading user identities: {e}")
+            return []
+    
+    def save_identity(self, user_id: int, username: Optional[str], first_name: Optional[str]):
+        try:
+            self.storage.save_identity(user_id, username, first_name)
+        except StorageError as e:
+            logger.error(f"Error saving user identity: {e}")
+    
+    def find_user_by_username(self, username: str):
+        try:
+            return self.storage.find_identity(username.lstrip('@').lower())
+        except StorageError as e:
+            logger.error(f"Error finding user by username: {e}")
+            return None
+    
     def get_chat_stats(self, chat_id: int):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(DISTINCT user_id) as total_users FROM warnings WHERE chat_id=?', (chat_id,))
-            total_users = cursor.fetchone()['total_users']
-            
-            cursor.execute('SELECT COUNT(*) as total_warnings FROM warnings WHERE chat_id=?', (chat_id,))
-            total_warnings = cursor.fetchone()['total_warnings']
-            
-            cursor.execute('SELECT COUNT(*) as active_mutes FROM mutes WHERE chat_id=? AND unmute_time>?', 
-                          (chat_id, datetime.now()))
-            active_mutes = cursor.fetchone()['active_mutes']
-            
-            conn.close()
-            
-            return {
-                'total_users': total_users,
-                'total_warnings': total_warnings,
-                'active_mutes': active_mutes
-            }
-        except sqlite3.Error as e:
+            stats = self.storage.chat_warning_stats(chat_id)
+            stats['active_mutes'] = self.mutes.active_count(chat_id)
+            return stats
+        except StorageError as e:
             logger.error(f"Error getting chat stats: {e}")
-            return {'total_users': 0, 'total_warnings': 0, 'active_mutes': 0}
+            return {'total_users': 0, 'total_warnings': 0, 'lifetime_warnings': 0, 'active_mutes': 0}
     
     def cleanup_old_data(self, days: int = 30):
+        """Drop warning months that ended more than `days` ago and delete ended mutes."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cutoff_date = datetime.now() - timedelta(days=days)
-            cursor.execute('DELETE FROM warnings WHERE created_at < ?', (cutoff_date,))
-            cursor.execute('DELETE FROM mutes WHERE unmute_time < ?', (datetime.now(),))
-            conn.commit()
-            conn.close()
-            logger.info(f"Cleaned up data older than {days} days")
-        except sqlite3.Error as e:
+            # Partitions are named by UTC month; mute times are local
+            dropped = self.storage.cleanup(datetime.now(timezone.utc) - timedelta(days=days), datetime.now())
+            logger.info(f"Cleaned up data older than {days} days ({dropped} warning partitions dropped)")
+        except StorageError as e:
             logger.error(f"Error cleaning up old data: {e}")
 
 # === MAIN BOT CLASS ===
 class AnimeGroupManager:
-    def __init__(self):
-        self.db = AnimeBotDatabase(config.DATABASE_NAME)
-        self.last_xp_gain: Dict[int, datetime] = {}
+    def __init__(self, owns: Optional[Callable[[int], bool]] = None):
+        self.db = AnimeBotDatabase(config.DATABASE_NAME, owns=owns)
+        self.adb = AsyncAnimeBotDatabase(self.db)
+        self.last_xp_gain = ExpiringTimestamps(
+            ttl=config.LEVEL_CONFIG["XP_COOLDOWN"],
+            max_size=config.LEVEL_CONFIG["XP_COOLDOWN_MAX_TRACKED"]
+        )
+        self.spam_limiter = TokenBucketLimiter(
+            rate=1 / config.ANTI_SPAM_COOLDOWN,
+            burst=config.ANTI_SPAM_BURST
+        )
+        # At most one spam warning per user per minute
+        self.spam_warning_limiter = TokenBucketLimiter(rate=1 / 60, burst=1)
+        self.admin_cache = AdminCache(config.ADMIN_CACHE_TTL)
+        self.identities = IdentityIndex(self.db.load_identities())
+        self.outbound = OutboundDispatcher(
+            global_rate=config.OUTBOUND_CONFIG["GLOBAL_RATE"],
+            global_burst=config.OUTBOUND_CONFIG["GLOBAL_BURST"],
+            group_rate=config.OUTBOUND_CONFIG["GROUP_MESSAGES_PER_MINUTE"] / 60,
+            group_burst=config.OUTBOUND_CONFIG["GROUP_BURST"],
+            private_rate=config.OUTBOUND_CONFIG["PRIVATE_RATE"],
+            private_burst=config.OUTBOUND_CONFIG["PRIVATE_BURST"],
+            max_retries=config.OUTBOUND_CONFIG["MAX_RETRIES"]
+        )
+        self.update_processor = PerChatUpdateProcessor(config.OUTBOUND_CONFIG["CONCURRENT_UPDATES"])
+        self.welcome_batcher = JoinBatcher(config.WELCOME_BATCH_WINDOW, self._send_welcome_with_image)
+        # Source URL -> Telegram file_id of the first successful upload
+        self.media_file_ids: Dict[str, str] = self.db.load_media_cache()
+        self.stats_snapshot = JSONSnapshot()
+        self._register_gauges()
+        # Set when a mute is added so the scheduler re-reads its next deadline
+        self.mute_wakeup = asyncio.Event()
         self.start_time = datetime.now()
     
+    def _register_gauges(self):
+        registry.gauge("bot_uptime_seconds", "Seconds since the bot started",
+                       lambda: (datetime.now() - self.start_time).total_seconds())
+        registry.gauge("bot_outbound_queue_depth", "Bot API requests waiting for rate-limit tokens",
+                       lambda: self.outbound.queue_depth)
+        registry.gauge("bot_xp_pending_users", "Users with XP not yet flushed to the database",
+                       lambda: self.db.get_xp_buffer_metrics()["pending_users"])
+        registry.gauge("bot_active_mutes", "Mutes that have not expired yet", lambda: len(self.db.mutes))
+        registry.gauge("bot_xp_cooldowns_tracked", "Users currently on XP cooldown", lambda: len(self.last_xp_gain))
+        registry.gauge("bot_spam_buckets_tracked", "Anti-spam buckets holding state", lambda: len(self.spam_limiter))
+    
     # === ERROR HANDLER ===
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors in the bot."""
         logger.error(f"Exception while handling an update: {context.error}")
         
+        # Replying would only add to the flood that caused it
+        if isinstance(context.error, RetryAfter):
+            return
+        
         try:
             # Notify user about error
             if update and update.effective_message:
@@ -455,6 +746,7 @@ Use /help to see all commands!
 /ban @user - Ban a user
 /kick @user - Kick a user
 /warnings [@user] - Check warnings
+/modlog [@user] - Recent moderation actions
 
 *User Commands:*
 /level - Check your level and XP
@@ -486,6 +778,7 @@ Admin Commands:
 /ban @user - Ban a user
 /kick @user - Kick a user
 /warnings [@user] - Check warnings
+/modlog [@user] - Recent moderation actions
 
 User Commands:
 /level - Check your level and XP
@@ -551,19 +844,74 @@ Violations may result in warnings, mutes, or bans.
     async def welcome_new_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Welcome new members."""
         try:
+            members = []
             for member in update.message.new_chat_members:
+                await self._observe_user(member)
                 if member.id == context.bot.id:
                     await update.message.reply_text(config.RESPONSES["welcome_bot"])
                 else:
-                    await self._send_welcome_with_image(update, context, member)
+                    members.append(member)
+            # Everyone joining within the batch window shares one welcome
+            await self.welcome_batcher.add(update.effective_chat.id, members, context.bot)
         except Exception as e:
             logger.error(f"Error in welcome system: {e}")
     
-    async def _send_welcome_with_image(self, update: Update, context: ContextTypes.DEFAULT_TYPE, member):
-        """Send welcome message with anime image."""
+    @staticmethod
+    def _format_member_names(members) -> str:
+        names = [f"@{member.username}" if member.username else member.first_name for member in members]
+        max_names = config.WELCOME_BATCH_MAX_NAMES
+        if len(names) > max_names:
+            return f"{', '.join(names[:max_names])} and {len(names) - max_names} others"
+        if len(names) > 1:
+            return f"{', '.join(names[:-1])} and {names[-1]}"
+        return names[0]
+    
+    async def _send_cached_photo(self, bot, chat_id: int, url: str, **kwargs):
+        """Send a photo by URL, reusing Telegram's file_id after the first upload."""
+        file_id = self.media_file_ids.get(url)
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except BadRequest as e:
+                logger.warning(f"Cached file_id for {url} rejected, re-uploading: {e}")
+                self.media_file_ids.pop(url, None)
+                await self.adb.forget_media_file_id(url)
+        
+        message = await bot.send_photo(chat_id=chat_id, photo=url, **kwargs)
+        if message.photo:
+            file_id = message.photo[-1].file_id
+            self.media_file_ids[url] = file_id
+            await self.adb.save_media_file_id(url, file_id)
+        return message
+    
+    async def warm_media_cache(self, bot):
+        """Upload every configured image that has no cached file_id yet."""
+        chat_id = config.MEDIA_CACHE_CONFIG["WARMUP_CHAT_ID"]
+        urls = list(config.WELCOME_IMAGE_URLS) + [character['image'] for character in config.ANIME_CHARACTERS.values()]
+        uploaded = 0
+        for url in dict.fromkeys(urls):
+            if url in self.media_file_ids:
+                continue
+            try:
+                message = await self._send_cached_photo(
+                    bot, chat_id, url, disable_notification=True, rate_limit_args=PRIORITY_COSMETIC
+                )
+                await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+                uploaded += 1
+            except Exception as e:
+                logger.error(f"Failed to warm media cache for {url}: {e}")
+        logger.info(f"Media cache warm-up uploaded {uploaded} images ({len(self.media_file_ids)} cached)")
+    
+    async def post_init(self, application: Application):
+        """Runs once the bot is initialized and started."""
+        if config.MEDIA_CACHE_CONFIG["WARMUP_ON_STARTUP"] and config.MEDIA_CACHE_CONFIG["WARMUP_CHAT_ID"]:
+            application.create_task(self.warm_media_cache(application.bot))
+    
+    async def _send_welcome_with_image(self, chat_id: int, members, bot):
+        """Send one welcome message with anime image for a batch of new members."""
         try:
             welcome_msg = random.choice(config.ANIME_WELCOME_MESSAGES).replace(
-                "{user}", f"@{member.username}" if member.username else member.first_name
+                "{user}", self._format_member_names(members)
             )
             
             full_welcome_text = f"""
@@ -578,45 +926,48 @@ Violations may result in warnings, mutes, or bans.
 Enjoy your stay! 🎉
             """
             
-            # --- START FIX: Check for ENABLE and non-empty URL list ---
             if config.ENABLE_WELCOME_IMAGE and config.WELCOME_IMAGE_URLS:
                 image_url = random.choice(config.WELCOME_IMAGE_URLS)
                 try:
-                    
                     if config.WELCOME_IMAGE_CAPTION:
-                        await context.bot.send_photo(
-                            chat_id=update.effective_chat.id,
-                            photo=image_url,
+                        await self._send_cached_photo(
+                            bot, chat_id, image_url,
                             caption=full_welcome_text,
                             parse_mode='Markdown'
                         )
                     else:
-                        await context.bot.send_photo(
-                            chat_id=update.effective_chat.id,
-                            photo=image_url
-                        )
+                        await self._send_cached_photo(bot, chat_id, image_url)
                         # The text message needs to be sent separately if it's not the caption
-                        await update.message.reply_text(full_welcome_text, parse_mode='Markdown')
+                        await bot.send_message(chat_id=chat_id, text=full_welcome_text, parse_mode='Markdown')
                         
                 except Exception as e:
-                    # --- IMPROVED LOGGING: Include the failed URL ---
                     logger.error(f"Failed to send welcome image from URL: {image_url}. Error: {e}")
-                    await update.message.reply_text(
-                        f"{config.RESPONSES['image_send_failed']}\n\n{full_welcome_text}",
+                    await bot.send_message(
+                        chat_id=chat_id,
+                        text=f"{config.RESPONSES['image_send_failed']}\n\n{full_welcome_text}",
                         parse_mode='Markdown'
                     )
             else:
                 # If image feature is disabled or URL list is empty, send only the text message
-                await update.message.reply_text(full_welcome_text, parse_mode='Markdown')
-            # --- END FIX ---
+                await bot.send_message(chat_id=chat_id, text=full_welcome_text, parse_mode='Markdown')
 
         except Exception as e:
             logger.error(f"Error in welcome image system: {e}")
-            await update.message.reply_text(f"Welcome {member.first_name}! 🎉")
+            await bot.send_message(chat_id=chat_id, text=f"Welcome {self._format_member_names(members)}! 🎉")
     
     # === LEVEL SYSTEM ===
+    async def _observe_user(self, user):
+        """Keep the username index current; only changed users hit the database."""
+        if user and not user.is_bot and self.identities.observe(user.id, user.username, user.first_name):
+            await self.adb.save_identity(user.id, user.username, user.first_name)
+    
     async def handle_level_system(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle XP gain and level system."""
+        try:
+            await self._observe_user(update.effective_user)
+        except Exception as e:
+            logger.error(f"Error recording user identity: {e}")
+        
         if not config.LEVEL_CONFIG["ENABLE_LEVEL_SYSTEM"]:
             return
         
@@ -624,21 +975,19 @@ Enjoy your stay! 🎉
             user_id = update.effective_user.id
             username = update.effective_user.username or ""
             first_name = update.effective_user.first_name or ""
-            current_time = datetime.now()
+            key = (update.effective_chat.id, user_id)
             
-            # Check cooldown
-            if user_id in self.last_xp_gain:
-                time_diff = (current_time - self.last_xp_gain[user_id]).total_seconds()
-                if time_diff < config.LEVEL_CONFIG["XP_COOLDOWN"]:
-                    return
+            # Check cooldown (entries expire after XP_COOLDOWN)
+            if key in self.last_xp_gain:
+                return
+            self.last_xp_gain.touch(key)
             
             # Add XP to database
-            level, xp, leveled_up = self.db.add_user_xp(
-                user_id, username, first_name, config.LEVEL_CONFIG["XP_PER_MESSAGE"]
+            level, xp, leveled_up = await self.adb.add_user_xp(
+                user_id, update.effective_chat.id, username, first_name,
+                config.LEVEL_CONFIG["XP_PER_MESSAGE"]
             )
             
-            self.last_xp_gain[user_id] = current_time
-            
             # Send level up message
             if leveled_up:
                 level_up_msg = random.choice(config.LEVEL_CONFIG["LEVEL_UP_MESSAGES"]).format(
@@ -653,12 +1002,10 @@ Enjoy your stay! 🎉
         """Check user level."""
         try:
             user_id = update.effective_user.id
-            level, xp = self.db.get_user_level(user_id)
-            rank = self.db.get_user_rank(user_id)
-            
-            # Calculate XP for next level
-            next_level_xp = 100 * (level ** 2)
-            xp_needed = max(0, next_level_xp - xp)
+            chat_id = update.effective_chat.id
+            _, xp = await self.adb.get_user_level(user_id, chat_id)
+            rank = await self.adb.get_user_rank(user_id, chat_id)
+            level, _, xp_needed = level_curve.progress(xp)
             
             level_text = f"""
 🎯 *Level Info* 🎯
@@ -679,7 +1026,7 @@ Keep chatting to level up! 💪
     async def leaderboard_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show leaderboard."""
         try:
-            leaderboard = self.db.get_leaderboard(10)
+            leaderboard = await self.adb.get_leaderboard(update.effective_chat.id, 10)
             
             if not leaderboard:
                 await update.message.reply_text("📊 No users on leaderboard yet! Start chatting to appear here!")
@@ -725,9 +1072,8 @@ Keep chatting to level up! 💪
             """
             
             try:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=character['image'],
+                await self._send_cached_photo(
+                    context.bot, update.effective_chat.id, character['image'],
                     caption=character_text,
                     parse_mode='Markdown'
                 )
@@ -759,14 +1105,14 @@ Keep chatting to level up! 💪
             reason = " ".join(context.args[1:]) if len(context.args) > 1 else "No reason provided"
             
             # Add warning to database
-            self.db.add_warning(
+            await self.adb.add_warning(
                 user_id=target_user.id,
                 chat_id=update.effective_chat.id,
                 warned_by=update.effective_user.id,
                 reason=reason
             )
             
-            warning_count = self.db.get_warning_count(target_user.id, update.effective_chat.id)
+            warning_count = await self.adb.get_warning_count(target_user.id, update.effective_chat.id)
             
             warning_text = f"""
 ⚠️ *Warning Issued* ⚠️
@@ -788,7 +1134,7 @@ Keep chatting to level up! 💪
                     f"Automatically banned for reaching {config.MAX_WARNINGS} warnings"
                 )
                 # Clear warnings after ban
-                self.db.clear_warnings(target_user.id, update.effective_chat.id)
+                await self.adb.clear_warnings(target_user.id, update.effective_chat.id)
         except Exception as e:
             logger.error(f"Error in warn command: {e}")
             await update.message.reply_text("❌ Error warning user. Please try again.")
@@ -799,7 +1145,7 @@ Keep chatting to level up! 💪
             if not context.args:
                 # Show own warnings
                 user_id = update.effective_user.id
-                warnings = self.db.get_user_warnings(user_id, update.effective_chat.id)
+                warnings = await self.adb.get_user_warnings(user_id, update.effective_chat.id)
                 warning_count = len(warnings)
                 
                 warnings_text = f"""
@@ -822,7 +1168,7 @@ Keep chatting to level up! 💪
                 await update.message.reply_text(config.RESPONSES["user_not_found"])
                 return
             
-            warnings = self.db.get_user_warnings(target_user.id, update.effective_chat.id)
+            warnings = await self.adb.get_user_warnings(target_user.id, update.effective_chat.id)
             warning_count = len(warnings)
             
             warnings_text = f"""
@@ -861,14 +1207,6 @@ Keep chatting to level up! 💪
             mute_duration = timedelta(hours=config.MUTE_DURATION_HOURS)
             unmute_time = datetime.now() + mute_duration
             
-            # Add mute to database
-            self.db.add_mute(
-                user_id=user_id,
-                chat_id=update.effective_chat.id,
-                muted_by=update.effective_user.id,
-                duration_hours=config.MUTE_DURATION_HOURS
-            )
-            
             # Set permissions to restrict sending messages
             permissions = ChatPermissions(
                 can_send_messages=False,
@@ -884,6 +1222,15 @@ Keep chatting to level up! 💪
                 until_date=unmute_time
             )
             
+            # Record the mute only once Telegram applied it, like kicks and bans
+            await self.adb.add_mute(
+                user_id=user_id,
+                chat_id=update.effective_chat.id,
+                muted_by=update.effective_user.id,
+                duration_hours=config.MUTE_DURATION_HOURS
+            )
+            self.mute_wakeup.set()
+            
             mute_text = f"""
 🔇 *User Muted* 🔇
 
@@ -921,7 +1268,7 @@ Keep chatting to level up! 💪
             user_id = target_user.id
             
             # Remove from database
-            self.db.remove_mute(user_id, update.effective_chat.id)
+            await self.adb.remove_mute(user_id, update.effective_chat.id)
             
             # Restore normal permissions
             permissions = ChatPermissions(
@@ -993,6 +1340,9 @@ Keep chatting to level up! 💪
                 user_id=target_user.id,
                 until_date=datetime.now() + timedelta(seconds=30)
             )
+            await self.adb.record_moderation([
+                ModerationEvent("kick", update.effective_chat.id, target_user.id, update.effective_user.id)
+            ])
             
             await update.message.reply_text(
                 f"👢 {target_user.first_name} has been kicked from the group!"
@@ -1009,6 +1359,9 @@ Keep chatting to level up! 💪
                 chat_id=update.effective_chat.id,
                 user_id=target_user.id
             )
+            await self.adb.record_moderation([
+                ModerationEvent("ban", update.effective_chat.id, target_user.id, update.effective_user.id, reason)
+            ])
             
             ban_text = f"""
 🚫 *User Banned* 🚫
@@ -1026,19 +1379,56 @@ Keep chatting to level up! 💪
                 config.RESPONSES["command_failed"].replace("{error}", str(e))
             )
     
+    async def modlog_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show recent moderation actions in the chat, optionally for one user."""
+        try:
+            if not await self._is_admin(update, context):
+                await update.message.reply_text(config.RESPONSES["no_permission"])
+                return
+            
+            user_id = None
+            if context.args:
+                target_user = await self._get_mentioned_user(update, context)
+                if not target_user:
+                    await update.message.reply_text(config.RESPONSES["user_not_found"])
+                    return
+                user_id = target_user.id
+            
+            events = await self.adb.get_moderation_history(update.effective_chat.id, user_id)
+            if not events:
+                await update.message.reply_text("📜 No moderation actions recorded yet.")
+                return
+            
+            def name(uid):
+                identity = self.identities.get(uid) if uid else None
+                return (identity[2] or identity[1]) if identity else str(uid)
+            
+            icons = {"warn": "⚠️", "mute": "🔇", "kick": "👢", "ban": "🚫"}
+            lines = ["📜 Recent moderation actions:"]
+            for event in events:
+                line = (f"{icons.get(event['action'], '•')} {event['created_at'][:16]} {event['action']} "
+                        f"{name(event['user_id'])} by {name(event['actor_id'])}")
+                if event['reason']:
+                    line += f": {event['reason']}"
+                lines.append(line)
+            await update.message.reply_text("\n".join(lines))
+        except Exception as e:
+            logger.error(f"Error in modlog command: {e}")
+            await update.message.reply_text("❌ Error getting moderation history. Please try again.")
+    
     # === STATISTICS COMMANDS ===
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show group statistics."""
         try:
-            chat_stats = self.db.get_chat_stats(update.effective_chat.id)
-            leaderboard = self.db.get_leaderboard(1000)
-            total_users = len(leaderboard)
+            chat_stats = await self.adb.get_chat_stats(update.effective_chat.id)
+            total_users = await self.adb.get_user_count(update.effective_chat.id)
             
             stats_text = f"""
 📈 *Group Statistics* 📈
 
 *Total Members:* {total_users}
-*Total Warnings Issued:* {chat_stats['total_warnings']}
+*Total Warnings Issued:* {chat_stats['lifetime_warnings']}
+*Active Warnings:* {chat_stats['total_warnings']}
 *Active Mutes:* {chat_stats['active_mutes']}
 *Level System:* {'✅ Enabled' if config.LEVEL_CONFIG['ENABLE_LEVEL_SYSTEM'] else '❌ Disabled'}
 
@@ -1063,24 +1453,53 @@ Keep chatting to level up! 💪
                 user_id = update.effective_user.id
                 username = update.effective_user.first_name or update.effective_user.username or "User"
             
-            user_stats = self.db.get_user_stats(user_id)
-            level, xp = self.db.get_user_level(user_id)
-            rank = self.db.get_user_rank(user_id)
+            chat_id = update.effective_chat.id
+            user_stats = await self.adb.get_user_stats(user_id, chat_id)
+            _, xp = await self.adb.get_user_level(user_id, chat_id)
+            rank = await self.adb.get_user_rank(user_id, chat_id)
+            level, _, xp_needed = level_curve.progress(xp)
             
             stats_text = f"""
 📊 *User Statistics* 📊
 
 *User:* {username}
 *Level:* {level} (Rank: #{rank})
-*XP:* {xp}
+*XP:* {xp} ({xp_needed} to next level)
 *Messages:* {user_stats.get('messages_count', 0)}
-*Total Warnings:* {user_stats.get('total_warnings', 0)}
+*Warnings:* {user_stats.get('warnings_count', 0)} | *Mutes:* {user_stats.get('mutes_count', 0)}
+*Kicks:* {user_stats.get('kicks_count', 0)} | *Bans:* {user_stats.get('bans_count', 0)}
             """
             await update.message.reply_text(stats_text, parse_mode='Markdown')
         except Exception as e:
             logger.error(f"Error in userstats command: {e}")
             await update.message.reply_text("❌ Error getting user statistics. Please try again.")
     
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Profile the running bot: /profile [seconds] [sample|cprofile] (bot owners only)."""
+        try:
+            if not config.PROFILING_CONFIG["ENABLED"] or update.effective_user.id not in config.ADMIN_IDS:
+                await update.message.reply_text(config.RESPONSES["no_permission"])
+                return
+            
+            seconds = float(context.args[0]) if context.args else 10
+            seconds = max(0.1, min(seconds, config.PROFILING_CONFIG["MAX_SECONDS"]))
+            mode = context.args[1] if len(context.args) > 1 else "sample"
+            
+            await update.message.reply_text(f"⏱️ Profiling for {seconds:g}s ({mode})...")
+            dump = await profiling.profile(seconds, mode, config.PROFILING_CONFIG["SAMPLE_INTERVAL_MS"] / 1000)
+            extension = "folded" if mode == "sample" else "txt"
+            await update.message.reply_document(
+                document=io.BytesIO(dump.encode() or b"(no samples)\n"),
+                filename=f"profile-{int(time.time())}.{extension}"
+            )
+        except (ValueError, RuntimeError) as e:
+            await update.message.reply_text(f"❌ {e}")
+        except Exception as e:
+            logger.error(f"Error in profile command: {e}")
+            await update.message.reply_text(
+                config.RESPONSES["command_failed"].replace("{error}", str(e))
+            )
+    
     # === UTILITY METHODS ===
     async def _is_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Check if user is admin."""
@@ -1090,29 +1509,54 @@ Keep chatting to level up! 💪
             if user_id in config.ADMIN_IDS:
                 return True
             
-            chat_member = await context.bot.get_chat_member(
-                update.effective_chat.id,
-                user_id
-            )
-            return chat_member.status in [ChatMember.ADMINISTRATOR, ChatMember.OWNER]
+            if update.effective_chat.type == ChatType.PRIVATE:
+                return False
+            
+            async def fetch_admins(chat_id):
+                administrators = await context.bot.get_chat_administrators(chat_id)
+                return [member.user.id for member in administrators]
+            
+            admins = await self.admin_cache.get_or_fetch(update.effective_chat.id, fetch_admins)
+            return user_id in admins
         except Exception as e:
             logger.error(f"Error checking admin status: {e}")
             return False
     
+    async def track_chat_members(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Keep cached admin rosters in sync with promotions and demotions."""
+        try:
+            member_update = update.chat_member or update.my_chat_member
+            new_member = member_update.new_chat_member
+            self.admin_cache.apply_member_update(
+                member_update.chat.id,
+                new_member.user.id,
+                new_member.status in [ChatMember.ADMINISTRATOR, ChatMember.OWNER]
+            )
+        except Exception as e:
+            logger.error(f"Error tracking chat member update: {e}")
+    
     async def _get_mentioned_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Extract mentioned user."""
+        """Extract mentioned user from a reply, a text mention, @username or user id."""
         try:
-            if update.message.reply_to_message:
-                return update.message.reply_to_message.from_user
+            message = update.message
+            if message.reply_to_message:
+                return message.reply_to_message.from_user
+            
+            # Users without a username are mentioned by name and carry the full User
+            for entity in message.entities or ():
+                if entity.type == MessageEntityType.TEXT_MENTION and entity.user:
+                    return entity.user
             
             if context.args:
-                username = context.args[0].lstrip('@')
-                # Simple implementation for demo
-                return type('User', (), {
-                    'id': hash(username),
-                    'first_name': username,
-                    'username': username
-                })()
+                target = context.args[0]
+                if target.lstrip('-').isdigit():
+                    identity = self.identities.get(int(target)) or (int(target), None, target)
+                else:
+                    identity = self.identities.resolve(target) or await self.adb.find_user_by_username(target)
+                if identity:
+                    user_id, username, first_name = identity
+                    return User(id=user_id, first_name=first_name or username or str(user_id),
+                                is_bot=False, username=username)
         except Exception as e:
             logger.error(f"Error getting mentioned user: {e}")
         
@@ -1128,107 +1572,435 @@ Keep chatting to level up! 💪
     
     # === ANTI-SPAM ===
     async def anti_spam(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Anti-spam protection."""
+        """Anti-spam protection.
+        
+        Runs in an earlier handler group than the level system, so spam is
+        stopped before it can earn XP.
+        """
         try:
-            user_id = update.effective_user.id
-            current_time = datetime.now()
-            
-            if user_id in self.last_xp_gain:
-                time_diff = (current_time - self.last_xp_gain[user_id]).total_seconds()
-                if time_diff < config.ANTI_SPAM_COOLDOWN:
-                    await update.message.reply_text(
-                        config.RESPONSES["spam_warning"].replace("{user}", update.effective_user.first_name)
-                    )
-                    try:
-                        await update.message.delete()
-                    except:
-                        pass
-                    return
+            key = (update.effective_chat.id, update.effective_user.id)
+            if self.spam_limiter.consume(key):
+                return
             
-            self.last_xp_gain[user_id] = current_time
+            if self.spam_warning_limiter.consume(key):
+                await update.message.reply_text(
+                    config.RESPONSES["spam_warning"].replace("{user}", update.effective_user.first_name)
+                )
+            try:
+                await update.message.delete()
+            except:
+                pass
         except Exception as e:
             logger.error(f"Error in anti-spam: {e}")
+            return
+        
+        raise ApplicationHandlerStop
+    
+    async def run_xp_flush_task(self):
+        """Periodically flush buffered XP and reload leaderboard caches once their TTL expires."""
+        interval = config.LEVEL_CONFIG["XP_FLUSH_INTERVAL_MS"] / 1000
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                # Flushes buffered XP, then reloads caches past their TTL
+                await self.adb.refresh_leaderboards()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in XP flush task: {e}")
+    
+    async def run_mute_scheduler(self):
+        """Expire mute records exactly at their unmute time."""
+        while True:
+            try:
+                next_due = self.db.mutes.next_due()
+                timeout = None if next_due is None else max(0.0, next_due - datetime.now().timestamp())
+                self.mute_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.mute_wakeup.wait(), timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+                
+                for chat_id, user_id in await self.adb.expire_mutes():
+                    logger.info(f"Mute expired for user {user_id} in chat {chat_id}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in mute scheduler: {e}")
+                await asyncio.sleep(60)
+    
+    # === STATISTICS SNAPSHOT ===
+    async def build_stats(self) -> Dict:
+        """Everything /stats reports, gathered in one pass."""
+        db = self.db
+        leaderboard = await self.adb.get_global_leaderboard(5)
+        chat_stats = await self.adb.get_chat_stats(STATS_CHAT_ID)
+        
+        return {
+            "status": "ok",
+            "total_users": await self.adb.get_user_count(),
+            "top_users": [
+                {
+                    "user_id": user['user_id'],
+                    "username": user['username'] or user['first_name'] or f"User{user['user_id']}",
+                    "level": level_curve.level_for_xp(user['xp']),
+                    "xp": user['xp'],
+                    "xp_to_next_level": level_curve.progress(user['xp'])[2]
+                } for user in leaderboard
+            ],
+            "counters_chat_id": STATS_CHAT_ID,
+            "warnings_issued": chat_stats['lifetime_warnings'],
+            "active_warnings": chat_stats['total_warnings'],
+            "active_mutes": chat_stats['active_mutes'],
+            "database": db.get_connection_metrics(),
+            "xp_buffer": db.get_xp_buffer_metrics(),
+            "mute_scheduler": db.mutes.get_metrics(),
+            "xp_cooldowns": self.last_xp_gain.get_metrics(),
+            "anti_spam": self.spam_limiter.get_metrics(),
+            "admin_cache": self.admin_cache.get_metrics(),
+            "outbound": self.outbound.get_metrics(),
+            "update_processor": self.update_processor.get_metrics(),
+            "welcome_batches": self.welcome_batcher.get_metrics(),
+            "cached_media": len(self.media_file_ids)
+        }
+    
+    async def run_stats_task(self):
+        """Rebuild the /stats snapshot on an interval so requests never query the database."""
+        while True:
+            try:
+                self.stats_snapshot.update(await self.build_stats(), STATS_VOLATILE_FIELDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing stats snapshot: {e}")
+            await asyncio.sleep(config.STATS_CONFIG["REFRESH_INTERVAL"])
     
     async def run_cleanup_tasks(self):
         """Run periodic database cleanup."""
         while True:
             try:
-                self.db.cleanup_old_data(30)
+                await self.adb.cleanup_old_data(30)
                 await asyncio.sleep(24 * 3600)  # Run daily
             except Exception as e:
                 logger.error(f"Error in cleanup task: {e}")
                 await asyncio.sleep(3600)  # Wait 1 hour before retrying
 
-# Global bot manager instance
+# Global bot manager and application instances
 bot_manager = None
+application = None
+# Set in the front process of scale-out mode
+update_router = None
 
-def main():
-    """Start the bot and web server."""
-    global bot_manager
+def build_application(base_url: Optional[str] = None, polling: Optional[bool] = None,
+                      owns: Optional[Callable[[int], bool]] = None) -> Application:
+    """Create the bot manager and an Application with every handler registered.
     
-    try:
-        # Create bot application
-        application = Application.builder().token(config.BOT_TOKEN).build()
-        
-        # Initialize bot manager
-        bot_manager = AnimeGroupManager()
-        
-        # Add error handler
-        application.add_error_handler(bot_manager.error_handler)
-        
-        # Add handlers
-        application.add_handler(CommandHandler("start", bot_manager.start))
-        application.add_handler(CommandHandler("help", bot_manager.help_command))
-        application.add_handler(CommandHandler("quote", bot_manager.send_quote))
-        application.add_handler(CommandHandler("rules", bot_manager.show_rules))
-        application.add_handler(CommandHandler("level", bot_manager.level_command))
-        application.add_handler(CommandHandler("leaderboard", bot_manager.leaderboard_command))
-        application.add_handler(CommandHandler("character", bot_manager.character_command))
-        application.add_handler(CommandHandler("stats", bot_manager.stats_command))
-        application.add_handler(CommandHandler("userstats", bot_manager.userstats_command))
-        application.add_handler(CommandHandler("warn", bot_manager.warn_user))
-        application.add_handler(CommandHandler("warnings", bot_manager.warnings_command))
-        application.add_handler(CommandHandler("mute", bot_manager.mute_user))
-        application.add_handler(CommandHandler("unmute", bot_manager.unmute_user))
-        application.add_handler(CommandHandler("ban", bot_manager.ban_user))
-        application.add_handler(CommandHandler("kick", bot_manager.kick_user))
-        
-        # Message handlers
-        application.add_handler(MessageHandler(
-            filters.StatusUpdate.NEW_CHAT_MEMBERS, 
-            bot_manager.welcome_new_member
-        ))
-        
-        # Level system handler
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND, 
-            bot_manager.handle_level_system
-        ))
+    base_url overrides the Bot API endpoint, e.g. for benchmarks/bot_harness.py.
+    polling defaults to True unless a webhook URL is configured. owns limits
+    the chats a scale-out worker loads state for.
+    """
+    global bot_manager, application
+    
+    # Initialize bot manager
+    bot_manager = AnimeGroupManager(owns)
+    
+    # Create bot application; all Bot API calls go through the outbound queue
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .rate_limiter(bot_manager.outbound)
+        .concurrent_updates(bot_manager.update_processor)
+        .application_class(TracingApplication)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if polling is None:
+        polling = not config.WEB_CONFIG["WEBHOOK_URL"]
+    if not polling:
+        # Updates arrive through telegram_webhook or a worker inbox instead of the polling updater
+        builder = builder.updater(None)
+    application = builder.build()
+    application.slow_update_seconds = config.PROFILING_CONFIG["SLOW_UPDATE_MS"] / 1000
+    
+    # Add error handler
+    application.add_error_handler(bot_manager.error_handler)
+    
+    # Add handlers
+    application.add_handler(CommandHandler("start", bot_manager.start))
+    application.add_handler(CommandHandler("help", bot_manager.help_command))
+    application.add_handler(CommandHandler("quote", bot_manager.send_quote))
+    application.add_handler(CommandHandler("rules", bot_manager.show_rules))
+    application.add_handler(CommandHandler("level", bot_manager.level_command))
+    application.add_handler(CommandHandler("leaderboard", bot_manager.leaderboard_command))
+    application.add_handler(CommandHandler("character", bot_manager.character_command))
+    application.add_handler(CommandHandler("stats", bot_manager.stats_command))
+    application.add_handler(CommandHandler("userstats", bot_manager.userstats_command))
+    application.add_handler(CommandHandler("warn", bot_manager.warn_user))
+    application.add_handler(CommandHandler("warnings", bot_manager.warnings_command))
+    application.add_handler(CommandHandler("mute", bot_manager.mute_user))
+    application.add_handler(CommandHandler("unmute", bot_manager.unmute_user))
+    application.add_handler(CommandHandler("ban", bot_manager.ban_user))
+    application.add_handler(CommandHandler("kick", bot_manager.kick_user))
+    application.add_handler(CommandHandler("modlog", bot_manager.modlog_command))
+    application.add_handler(CommandHandler("profile", bot_manager.profile_command))
+    
+    # Admin roster cache invalidation
+    application.add_handler(ChatMemberHandler(
+        bot_manager.track_chat_members,
+        ChatMemberHandler.ANY_CHAT_MEMBER
+    ))
+    
+    # Message handlers
+    application.add_handler(MessageHandler(
+        filters.StatusUpdate.NEW_CHAT_MEMBERS, 
+        bot_manager.welcome_new_member
+    ))
+    
+    # Anti-spam handler (earlier group, stops spam before it earns XP)
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND, 
+        bot_manager.anti_spam
+    ), group=-1)
+    
+    # Level system handler
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND, 
+        bot_manager.handle_level_system
+    ))
+    
+    instrument_handlers(application)
+    return application
+
+def instrument_handlers(application: Application):
+    """Time every registered handler callback and count updates."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timed_handler(handler.callback)
+    
+    async def count_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        UPDATES_TOTAL.inc()
+    
+    # Runs before every other group, including anti-spam
+    application.add_handler(TypeHandler(Update, count_update), group=-100)
+
+def timed_handler(callback):
+    name = getattr(callback, "__name__", "handler")
+    observe = HANDLER_SECONDS.observe
+    
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            observe(name, elapsed)
+            record_span("handler", name, elapsed)
+    
+    return wrapper
+
+async def run_bot():
+    """Run the bot and the web server on one event loop until SIGINT/SIGTERM."""
+    build_application()
+    webhook_url = config.WEB_CONFIG["WEBHOOK_URL"]
+    webserver = WebServer(uvicorn.Config(
+        web_app,
+        host=config.WEB_CONFIG["HOST"],
+        port=config.WEB_CONFIG["PORT"],
+        log_level="warning",
+        use_colors=False
+    ))
+    
+    async with application:
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip("/") + config.WEB_CONFIG["WEBHOOK_PATH"],
+                secret_token=config.WEB_CONFIG["WEBHOOK_SECRET"],
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        await bot_manager.post_init(application)
         
-        # Anti-spam handler
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND, 
-            bot_manager.anti_spam
-        ))
+        # Start cleanup tasks (Application.stop() would wait forever on these)
+        background_tasks = [
+            asyncio.create_task(bot_manager.run_cleanup_tasks()),
+            asyncio.create_task(bot_manager.run_xp_flush_task()),
+            asyncio.create_task(bot_manager.run_mute_scheduler()),
+            asyncio.create_task(bot_manager.run_stats_task()),
+        ]
         
-        # Start cleanup tasks
-        asyncio.get_event_loop().create_task(bot_manager.run_cleanup_tasks())
+        address = f"http://{config.WEB_CONFIG['HOST']}:{config.WEB_CONFIG['PORT']}"
+        logger.info(f"🌸 Anime Guardian Bot is running ({'webhook' if webhook_url else 'polling'} mode)...")
+        logger.info(f"🌐 Web dashboard available at {address}")
+        logger.info(f"🔍 Health check at {address}/health")
+        logger.info(f"📊 Statistics at {address}/stats")
         
-        # Start Flask web server in a separate thread
-        flask_thread = threading.Thread(target=run_flask, daemon=True)
-        flask_thread.start()
+        try:
+            # Returns on SIGINT/SIGTERM
+            await webserver.serve()
+        finally:
+            for task in background_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            # Welcome members still waiting in a join window while the bot can send
+            await bot_manager.welcome_batcher.flush_all()
+    
+    # Flushes any XP still buffered in memory
+    bot_manager.adb.shutdown()
+    bot_manager.db.close()
+
+# === SCALE-OUT MODE ===
+async def run_worker(index: int, count: int, inbox, reports, base_url: Optional[str] = None):
+    """Handle the chats the front process routes to worker `index` of `count` until told to stop."""
+    # Telegram's global limit is per bot, so each worker gets an equal share
+    config.OUTBOUND_CONFIG["GLOBAL_RATE"] /= count
+    config.OUTBOUND_CONFIG["GLOBAL_BURST"] = max(1, config.OUTBOUND_CONFIG["GLOBAL_BURST"] / count)
+    build_application(base_url=base_url, polling=False,
+                      owns=lambda chat_id: shard_for(chat_id, count) == index)
+    
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    
+    def deliver(batch):
+        for data in batch:
+            application.update_queue.put_nowait(Update.de_json(data, application.bot))
+    
+    async def report_stats():
+        while True:
+            try:
+                reports.put({
+                    "worker": index,
+                    "processed": UPDATES_TOTAL.value(),
+                    "stats": await bot_manager.build_stats()
+                })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reporting worker stats: {e}")
+            await asyncio.sleep(config.STATS_CONFIG["REFRESH_INTERVAL"])
+    
+    async with application:
+        await application.start()
+        background_tasks = [
+            asyncio.create_task(bot_manager.run_xp_flush_task()),
+            asyncio.create_task(bot_manager.run_mute_scheduler()),
+            asyncio.create_task(report_stats()),
+        ]
+        if index == 0:
+            # Shared database housekeeping and media warm-up only need doing once
+            await bot_manager.post_init(application)
+            background_tasks.append(asyncio.create_task(bot_manager.run_cleanup_tasks()))
         
-        logger.info("🌸 Anime Guardian Bot with Flask Web Server is running...")
-        logger.info("🌐 Web dashboard available at http://0.0.0.0:8000")
-        logger.info("🔍 Health check at http://0.0.0.0:8000/health")
-        logger.info("📊 Statistics at http://0.0.0.0:8000/stats")
+        threading.Thread(
+            target=pump_inbox, args=(inbox, loop, deliver, stopped.set),
+            name="worker-inbox", daemon=True
+        ).start()
+        logger.info(f"Worker {index}/{count} ready")
         
-        # Start the bot
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        try:
+            await stopped.wait()
+            # Let updates already handed to the application finish
+            while application.update_queue.qsize():
+                await asyncio.sleep(0.05)
+        finally:
+            for task in background_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+            await application.stop()
+            await bot_manager.welcome_batcher.flush_all()
+    
+    bot_manager.adb.shutdown()
+    bot_manager.db.close()
+
+async def poll_updates(bot: Bot, router: ChatRouter):
+    """getUpdates loop for the front process when no webhook is configured."""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching updates: {e}")
+            await asyncio.sleep(5)
+            continue
         
+        for update in updates:
+            data = update.to_dict()
+            while not router.dispatch(data):
+                await asyncio.sleep(0.1)
+            offset = update.update_id + 1
+
+async def run_front(workers: int):
+    """Receive updates and route them by chat to worker processes; serves the web dashboard."""
+    global update_router
+    if config.STORAGE_CONFIG["BACKEND"] == "memory":
+        raise ValueError("The memory storage backend cannot be shared by several worker processes")
+    # Create the schema and bring stored levels up to the current curve once
+    # here rather than letting every worker race for it
+    storage = open_storage(config)
+    try:
+        ensure_level_curve(storage)
+    finally:
+        storage.close()
+    
+    update_router = ChatRouter(workers, config.SCALE_CONFIG["QUEUE_SIZE"])
+    update_router.start()
+    webhook_url = config.WEB_CONFIG["WEBHOOK_URL"]
+    webserver = WebServer(uvicorn.Config(
+        web_app,
+        host=config.WEB_CONFIG["HOST"],
+        port=config.WEB_CONFIG["PORT"],
+        log_level="warning",
+        use_colors=False
+    ))
+    
+    try:
+        async with Bot(config.BOT_TOKEN) as bot:
+            if webhook_url:
+                await bot.set_webhook(
+                    url=webhook_url.rstrip("/") + config.WEB_CONFIG["WEBHOOK_PATH"],
+                    secret_token=config.WEB_CONFIG["WEBHOOK_SECRET"],
+                    allowed_updates=Update.ALL_TYPES
+                )
+            else:
+                await bot.delete_webhook()
+            
+            background_tasks = [
+                asyncio.create_task(update_router.run_report_collector(config.STATS_CONFIG["REFRESH_INTERVAL"]))
+            ]
+            if not webhook_url:
+                background_tasks.append(asyncio.create_task(poll_updates(bot, update_router)))
+            
+            logger.info(f"🌸 Anime Guardian Bot is running with {workers} workers "
+                        f"({'webhook' if webhook_url else 'polling'} mode)...")
+            try:
+                await webserver.serve()
+            finally:
+                for task in background_tasks:
+                    task.cancel()
+                await asyncio.gather(*background_tasks, return_exceptions=True)
+    finally:
+        await asyncio.to_thread(update_router.stop)
+
+def main():
+    """Start the bot and web server."""
+    try:
+        workers = config.SCALE_CONFIG["WORKERS"]
+        asyncio.run(run_front(workers) if workers > 1 else run_bot())
     except Exception as e:
         logger.error(f"Failed to start bot: {e}")
 
 if __name__ == '__main__':
     main()
-
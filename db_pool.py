@@ -0,0 +1,130 @@
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteConnectionManager:
+    """Reusable SQLite connections: one shared writer plus one reader per thread.
+
+    The writer is guarded by a lock so the bot loop and the web thread never
+    interleave transactions. Readers are created lazily per thread and kept
+    open for the life of the manager; in WAL mode they never block the writer.
+    """
+
+    def __init__(self, db_name: str, cache_size_kb: int = 8192,
+                 busy_timeout_ms: int = 5000, mmap_size: int = 0):
+        self.db_name = db_name
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        # In-memory databases are private to their connection, so readers
+        # must share the writer to see any data at all.
+        self._shared_only = db_name == ":memory:" or db_name.startswith("file::memory:")
+
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._closed = False
+
+        self._connections_opened = 0
+        self._queries = 0
+        self._write_queries = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+        self._writer = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        try:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                                   timeout=self.busy_timeout_ms / 1000)
+            conn.row_factory = sqlite3.Row
+            if not self._shared_only:
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            if self.mmap_size:
+                conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        except sqlite3.Error as e:
+            logger.error(f"Database connection error: {e}")
+            raise
+
+        with self._stats_lock:
+            self._connections_opened += 1
+        return conn
+
+    def _record(self, wait: float, write: bool):
+        with self._stats_lock:
+            self._queries += 1
+            if write:
+                self._write_queries += 1
+            self._total_wait += wait
+            if wait > self._max_wait:
+                self._max_wait = wait
+
+    @contextmanager
+    def writer(self):
+        """Yield the shared writer; commits on success, rolls back on error."""
+        started = time.perf_counter()
+        with self._write_lock:
+            self._record(time.perf_counter() - started, write=True)
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Yield this thread's read-only connection."""
+        if self._shared_only:
+            started = time.perf_counter()
+            with self._write_lock:
+                self._record(time.perf_counter() - started, write=False)
+                yield self._writer
+            return
+
+        started = time.perf_counter()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._stats_lock:
+                self._readers.append(conn)
+        self._record(time.perf_counter() - started, write=False)
+        yield conn
+
+    def get_metrics(self) -> Dict:
+        """Connection count and per-query wait time since startup."""
+        with self._stats_lock:
+            queries = self._queries
+            return {
+                "connections_opened": self._connections_opened,
+                "open_connections": (0 if self._closed else 1) + len(self._readers),
+                "queries": queries,
+                "write_queries": self._write_queries,
+                "avg_wait_ms": round(self._total_wait / queries * 1000, 4) if queries else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 4),
+            }
+
+    def close(self):
+        with self._stats_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        with self._write_lock:
+            if not self._closed:
+                self._writer.close()
+                self._closed = True
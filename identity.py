@@ -0,0 +1,54 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class IdentityIndex:
+    """Case-insensitive username -> user lookup built from updates the bot sees.
+
+    Holds the latest (username, first_name) per user id and the reverse
+    mapping from lower-cased username, so both directions are O(1).
+    """
+
+    def __init__(self, identities: Iterable[Tuple[int, Optional[str], Optional[str]]] = ()):
+        self._by_id: Dict[int, Tuple[Optional[str], str]] = {}
+        self._by_username: Dict[str, int] = {}
+        for user_id, username, first_name in identities:
+            self._store(user_id, username, first_name)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    @staticmethod
+    def normalize(username: str) -> str:
+        return username.lstrip('@').lower()
+
+    def _store(self, user_id: int, username: Optional[str], first_name: Optional[str]):
+        previous = self._by_id.get(user_id)
+        if previous and previous[0]:
+            old_key = self.normalize(previous[0])
+            if self._by_username.get(old_key) == user_id:
+                del self._by_username[old_key]
+        self._by_id[user_id] = (username or None, first_name or "")
+        if username:
+            # A username belongs to whoever was seen with it most recently
+            self._by_username[self.normalize(username)] = user_id
+
+    def observe(self, user_id: int, username: Optional[str], first_name: Optional[str]) -> bool:
+        """Record a user; returns True if anything changed and should be persisted."""
+        if self._by_id.get(user_id) == (username or None, first_name or ""):
+            return False
+        self._store(user_id, username, first_name)
+        return True
+
+    def resolve(self, username: str) -> Optional[Tuple[int, Optional[str], str]]:
+        """(user_id, username, first_name) for a username, with or without the @."""
+        user_id = self._by_username.get(self.normalize(username))
+        if user_id is None:
+            return None
+        username, first_name = self._by_id[user_id]
+        return user_id, username, first_name
+
+    def get(self, user_id: int) -> Optional[Tuple[int, Optional[str], str]]:
+        entry = self._by_id.get(user_id)
+        if entry is None:
+            return None
+        return user_id, entry[0], entry[1]
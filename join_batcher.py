@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class JoinBatcher:
+    """Collects members who join a chat within ``window`` seconds into one batch.
+
+    The first join in a quiet chat starts the window; everyone who joins
+    before it closes is handed to ``flush`` together, so a raid of any size
+    costs one welcome. ``context`` is whatever ``flush`` needs to send (the
+    latest one seen for the chat wins). A window of 0 flushes every join
+    immediately. ``flush_all`` closes every open window at shutdown.
+    """
+
+    def __init__(self, window: float,
+                 flush: Callable[[int, List[Any], Any], Awaitable[None]]):
+        self.window = window
+        self._flush = flush
+        self._pending: Dict[int, List[Any]] = {}
+        self._contexts: Dict[int, Any] = {}
+        # chat_id -> its window's task while the window is open
+        self._timers: Dict[int, asyncio.Task] = {}
+        # Every window task until its batch is sent
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = asyncio.Event()
+        self.joins = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    async def add(self, chat_id: int, members: List[Any], context: Any = None):
+        if not members:
+            return
+        self.joins += len(members)
+        if self.window <= 0:
+            await self._send(chat_id, list(members), context)
+            return
+
+        self._pending.setdefault(chat_id, []).extend(members)
+        self._contexts[chat_id] = context
+        if chat_id not in self._timers:
+            task = asyncio.get_running_loop().create_task(self._flush_later(chat_id))
+            self._timers[chat_id] = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _flush_later(self, chat_id: int):
+        try:
+            await asyncio.wait_for(self._closing.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        del self._timers[chat_id]
+        members = self._pending.pop(chat_id, [])
+        context = self._contexts.pop(chat_id, None)
+        await self._send(chat_id, members, context)
+
+    async def flush_all(self):
+        """Close every open window and wait until its batch is sent; called at shutdown."""
+        self._closing.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _send(self, chat_id: int, members: List[Any], context: Any):
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(members))
+        try:
+            await self._flush(chat_id, members, context)
+        except Exception as e:
+            logger.error(f"Error flushing {len(members)} joins for chat {chat_id}: {e}")
+
+    def get_metrics(self) -> Dict:
+        return {
+            "pending_chats": len(self._pending),
+            "pending_members": sum(len(members) for members in self._pending.values()),
+            "joins": self.joins,
+            "batches": self.batches,
+            "largest_batch": self.largest_batch,
+        }
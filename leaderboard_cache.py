@@ -0,0 +1,82 @@
+import time
+from typing import Dict, List, Optional
+
+
+class LeaderboardCache:
+    """Top-K leaderboard rows held in memory and patched on every XP change.
+
+    XP only ever grows, so a user can enter the top K but never silently fall
+    out of it except by being pushed past the K-th place; applying every XP
+    update therefore keeps the cache exact. A full reload after ``ttl``
+    seconds bounds any drift from writes that bypass the cache.
+    """
+
+    def __init__(self, size: int = 100, ttl: float = 300):
+        self.size = size
+        self.ttl = ttl
+        self._rows: List[Dict] = []
+        self._by_user: Dict[int, Dict] = {}
+        self._loaded_at: Optional[float] = None
+        self.hits = 0
+        self.reloads = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def load(self, rows: List[Dict]):
+        """Replace the cache with rows already ordered by level and XP."""
+        self._rows = [dict(row) for row in rows[:self.size]]
+        self._by_user = {row['user_id']: row for row in self._rows}
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+
+    def update(self, user_id: int, username: str, first_name: str,
+               level: int, xp: int, messages_count: int):
+        if not self.is_loaded:
+            return
+
+        row = self._by_user.get(user_id)
+        if row is None:
+            full = len(self._rows) >= self.size
+            if full and xp <= self._rows[-1]['xp']:
+                return
+            row = {'user_id': user_id}
+            self._rows.append(row)
+            self._by_user[user_id] = row
+
+        row.update(username=username, first_name=first_name, level=level,
+                   xp=xp, messages_count=messages_count)
+        # Stable sort of at most size + 1 nearly sorted rows
+        self._rows.sort(key=lambda r: (r['level'], r['xp']), reverse=True)
+        if len(self._rows) > self.size:
+            evicted = self._rows.pop()
+            del self._by_user[evicted['user_id']]
+
+    def remove(self, user_id: int):
+        """Forget a user who left this board.
+
+        The cache cannot tell who moves up into the freed place, so it stops
+        serving until the next load.
+        """
+        if user_id in self._by_user:
+            self._loaded_at = None
+
+    def top(self, limit: int) -> Optional[List[Dict]]:
+        """Copies of the first ``limit`` rows, or None if the cache cannot serve it."""
+        if not self.is_loaded or limit > self.size:
+            return None
+        self.hits += 1
+        return [dict(row) for row in self._rows[:limit]]
+
+    def get_metrics(self) -> Dict:
+        return {
+            "size": len(self._rows),
+            "capacity": self.size,
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+        }
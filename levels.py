@@ -0,0 +1,86 @@
+from bisect import bisect_right
+from typing import Iterable, List, Tuple
+
+from config import config
+
+# Thresholds past this would never be reached by chatting
+MAX_THRESHOLD_XP = 10 ** 18
+
+
+class LevelCurve:
+    """Geometric XP curve with a precomputed cumulative threshold table.
+
+    Reaching level 2 costs ``base_xp``; every following level costs
+    ``growth`` times the previous one (rounded down). ``thresholds[i]`` is the
+    total XP needed to be at level ``i + 1``, so a level lookup is a single
+    bisect over the table.
+    """
+
+    def __init__(self, base_xp: int = 100, growth: float = 1.5):
+        if base_xp <= 0 or growth < 1:
+            raise ValueError("Level curve needs base_xp > 0 and growth >= 1")
+        # Once base_xp * growth rounds above base_xp every later step grows
+        # too; otherwise the table would need ~10**16 equal-cost levels
+        if int(base_xp * growth) <= base_xp:
+            raise ValueError(
+                f"Level curve growth {growth} does not increase the cost of level 3 "
+                f"over level 2 at base_xp {base_xp}; use a larger growth or base_xp"
+            )
+        self.base_xp = base_xp
+        self.growth = growth
+
+        thresholds = [0]
+        required = base_xp
+        while thresholds[-1] + required <= MAX_THRESHOLD_XP:
+            thresholds.append(thresholds[-1] + required)
+            required = max(1, int(required * growth))
+        self.thresholds: List[int] = thresholds
+
+    @property
+    def max_level(self) -> int:
+        return len(self.thresholds)
+
+    @property
+    def signature(self) -> str:
+        """Identifies the curve so stored levels can be recomputed when it changes."""
+        return f"geometric:{self.base_xp}:{self.growth}"
+
+    def level_for_xp(self, xp: int) -> int:
+        return max(1, bisect_right(self.thresholds, xp))
+
+    def xp_for_level(self, level: int) -> int:
+        """Total XP needed to reach ``level``."""
+        level = min(max(level, 1), self.max_level)
+        return self.thresholds[level - 1]
+
+    def progress(self, xp: int) -> Tuple[int, int, int]:
+        """Return (level, xp earned within the level, xp still needed for the next)."""
+        level = self.level_for_xp(xp)
+        into_level = xp - self.thresholds[level - 1]
+        if level >= self.max_level:
+            return level, into_level, 0
+        return level, into_level, self.thresholds[level] - xp
+
+    def levels_for_xp(self, xps: Iterable[int]) -> List[int]:
+        """Bulk variant of level_for_xp for recomputing a whole table.
+
+        Sorts the input once and walks the threshold table alongside it, so a
+        batch costs one sort plus a single linear merge pass.
+        """
+        xps = list(xps)
+        order = sorted(range(len(xps)), key=xps.__getitem__)
+        levels = [1] * len(xps)
+        thresholds = self.thresholds
+        level = 1
+        for index in order:
+            xp = xps[index]
+            while level < len(thresholds) and thresholds[level] <= xp:
+                level += 1
+            levels[index] = level
+        return levels
+
+
+level_curve = LevelCurve(
+    config.LEVEL_CONFIG["LEVEL_BASE_XP"],
+    config.LEVEL_CONFIG["LEVEL_GROWTH"]
+)
@@ -0,0 +1,175 @@
+import logging
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds; covers an in-memory handler (~0.1ms) up to a slow Bot API call
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(label: Optional[str], value, extra: str = "") -> str:
+    parts = [f'{label}="{_escape(str(value))}"'] if label else []
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by one label.
+
+    Incremented from the event loop and from the database executor threads,
+    so updates take a lock.
+    """
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._values: Dict[object, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value=None, amount: float = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value=None) -> float:
+        return self._values.get(label_value, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for label_value, value in sorted(values, key=lambda item: str(item[0])):
+            lines.append(f"{self.name}{_labels(self.label, label_value)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, optionally split by one label.
+
+    ``observe`` is a dict lookup, a bisect and two list updates under a lock
+    (it runs on executor threads too); buckets are stored per bucket and
+    only made cumulative when rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label value -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[object, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds: float):
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += seconds
+
+    def labels(self) -> List:
+        with self._lock:
+            return list(self._series)
+
+    def count(self, label_value=None) -> int:
+        with self._lock:
+            series = self._series.get(label_value)
+            return sum(series[:-1]) if series else 0
+
+    def total(self, label_value=None) -> float:
+        with self._lock:
+            series = self._series.get(label_value)
+            return series[-1] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(label_value, list(series)) for label_value, series in self._series.items()]
+        for label_value, series in sorted(snapshot, key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                labels = _labels(self.label, label_value, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label, label_value)
+            lines.append(f"{self.name}_sum{labels} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_number(value)}"]
+
+
+class MetricsRegistry:
+    """Named metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        # Re-registering a name returns the existing metric (module reloads,
+        # several bot managers in one benchmark process); gauges are replaced
+        existing = self._metrics.get(metric.name)
+        if existing is not None and not isinstance(metric, Gauge):
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label: Optional[str] = None) -> Counter:
+        return self._register(Counter(name, documentation, label))
+
+    def histogram(self, name: str, documentation: str, label: Optional[str] = None,
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class ErrorCountingHandler(logging.Handler):
+    """Counts ERROR and worse log records per logger, since handlers log rather than raise."""
+
+    def __init__(self, counter: Counter):
+        super().__init__(level=logging.ERROR)
+        self.counter = counter
+
+    def emit(self, record: logging.LogRecord):
+        self.counter.inc(record.name)
+
+
+registry = MetricsRegistry()
+
+LOG_ERRORS = registry.counter("bot_log_errors_total", "Log records at ERROR or above", "logger")
@@ -0,0 +1,302 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+def warning_partition_ddl(name: str) -> List[str]:
+    """Statements creating one month's warnings table, e.g. warnings_202610."""
+    return [
+        f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            warned_by INTEGER,
+            reason TEXT,
+            created_at TIMESTAMP NOT NULL
+        )
+        ''',
+        # list_warnings, clear_warnings, rollups when the partition is dropped
+        f'CREATE INDEX IF NOT EXISTS idx_{name}_chat_user ON {name} (chat_id, user_id, created_at)',
+    ]
+
+
+def _partition_warnings(conn: sqlite3.Connection):
+    """Move the single warnings table into monthly partitions and build the counters."""
+    # created_at was only defaulted, never required; file undated warnings
+    # under the month of the upgrade rather than losing them
+    conn.execute('UPDATE warnings SET created_at=CURRENT_TIMESTAMP WHERE created_at IS NULL')
+    months = [row[0] for row in conn.execute("SELECT DISTINCT strftime('%Y%m', created_at) FROM warnings")]
+    for month in months:
+        name = f"warnings_{month}"
+        for statement in warning_partition_ddl(name):
+            conn.execute(statement)
+        conn.execute(f'''
+            INSERT INTO {name} (id, user_id, chat_id, warned_by, reason, created_at)
+            SELECT id, user_id, chat_id, warned_by, reason, created_at
+            FROM warnings WHERE strftime('%Y%m', created_at) = ?
+        ''', (month,))
+        conn.execute('INSERT INTO warning_partitions (name) VALUES (?)', (name,))
+    conn.execute('''
+        INSERT INTO warning_counts (chat_id, user_id, active, lifetime)
+        SELECT chat_id, user_id, COUNT(*), COUNT(*) FROM warnings GROUP BY chat_id, user_id
+    ''')
+    conn.execute('''
+        INSERT INTO chat_warning_counts (chat_id, users, warnings, lifetime)
+        SELECT chat_id, COUNT(*), SUM(active), SUM(lifetime) FROM warning_counts GROUP BY chat_id
+    ''')
+    conn.execute('INSERT INTO warning_ids (last_id) SELECT COALESCE(MAX(id), 0) FROM warnings')
+    conn.execute('DROP TABLE warnings')
+
+
+# Ordered (version, description, statements). A statement is SQL or a
+# callable taking the connection, for steps that need data-dependent DDL.
+# Never edit a released migration; append a new one instead so deployed
+# databases pick it up.
+MIGRATIONS: List[Tuple[int, str, List[Union[str, Callable[[sqlite3.Connection], None]]]]] = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_levels (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            messages_count INTEGER DEFAULT 0,
+            last_message_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS warnings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_id INTEGER,
+            warned_by INTEGER,
+            reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS mutes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_id INTEGER,
+            muted_by INTEGER,
+            duration_hours INTEGER,
+            unmute_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            warnings_count INTEGER DEFAULT 0,
+            mutes_count INTEGER DEFAULT 0,
+            kicks_count INTEGER DEFAULT 0,
+            bans_count INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''',
+    ]),
+    (2, "indexes for warning, mute and leaderboard queries", [
+        # get_warning_count, get_user_warnings, get_chat_stats (covering)
+        'CREATE INDEX IF NOT EXISTS idx_warnings_chat_user ON warnings (chat_id, user_id, created_at)',
+        # get_user_stats
+        'CREATE INDEX IF NOT EXISTS idx_warnings_user ON warnings (user_id)',
+        # cleanup_old_data
+        'CREATE INDEX IF NOT EXISTS idx_warnings_created ON warnings (created_at)',
+        # remove_mute
+        'CREATE INDEX IF NOT EXISTS idx_mutes_chat_user ON mutes (chat_id, user_id)',
+        # get_chat_stats active mutes (covering)
+        'CREATE INDEX IF NOT EXISTS idx_mutes_chat_unmute ON mutes (chat_id, unmute_time)',
+        # cleanup_old_data
+        'CREATE INDEX IF NOT EXISTS idx_mutes_unmute ON mutes (unmute_time)',
+        # get_leaderboard
+        'CREATE INDEX IF NOT EXISTS idx_user_levels_rank ON user_levels (level DESC, xp DESC)',
+    ]),
+    (3, "per-chat levels keyed by (chat_id, user_id)", [
+        '''
+        CREATE TABLE user_levels_v3 (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            messages_count INTEGER DEFAULT 0,
+            last_message_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, user_id)
+        )
+        ''',
+        # Levels from before per-chat tracking can't be attributed to a chat,
+        # so they are kept under LEGACY_CHAT_ID
+        '''
+        INSERT INTO user_levels_v3
+        (chat_id, user_id, username, first_name, xp, level, messages_count, last_message_time, created_at)
+        SELECT 0, user_id, username, first_name, xp, level, messages_count, last_message_time, created_at
+        FROM user_levels
+        ''',
+        'DROP TABLE user_levels',
+        'ALTER TABLE user_levels_v3 RENAME TO user_levels',
+        # get_leaderboard per chat
+        'CREATE INDEX IF NOT EXISTS idx_user_levels_chat_rank ON user_levels (chat_id, level DESC, xp DESC)',
+    ]),
+    (4, "username to user_id identity index", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_identities (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            username_lc TEXT,
+            first_name TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # find_user_by_username
+        'CREATE INDEX IF NOT EXISTS idx_user_identities_username ON user_identities (username_lc)',
+    ]),
+    (5, "Telegram file_id cache for image URLs", [
+        '''
+        CREATE TABLE IF NOT EXISTS media_cache (
+            url TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (6, "monthly warning partitions with per-user and per-chat counters", [
+        # Every warnings_YYYYMM table; cleanup drops whole partitions
+        'CREATE TABLE IF NOT EXISTS warning_partitions (name TEXT PRIMARY KEY)',
+        # Last warning id handed out, shared by every partition; an
+        # AUTOINCREMENT per partition would restart ids each month
+        'CREATE TABLE IF NOT EXISTS warning_ids (last_id INTEGER NOT NULL)',
+        # Warnings per (chat, user): still stored, and ever issued
+        '''
+        CREATE TABLE IF NOT EXISTS warning_counts (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            active INTEGER NOT NULL DEFAULT 0,
+            lifetime INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+        ''',
+        # count_warnings across chats
+        'CREATE INDEX IF NOT EXISTS idx_warning_counts_user ON warning_counts (user_id, active)',
+        # Users with stored warnings, stored warnings and warnings ever issued per chat
+        '''
+        CREATE TABLE IF NOT EXISTS chat_warning_counts (
+            chat_id INTEGER PRIMARY KEY,
+            users INTEGER NOT NULL DEFAULT 0,
+            warnings INTEGER NOT NULL DEFAULT 0,
+            lifetime INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        _partition_warnings,
+    ]),
+    (7, "moderation event log feeding per-chat user_stats", [
+        '''
+        CREATE TABLE IF NOT EXISTS moderation_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            actor_id INTEGER,
+            reason TEXT,
+            duration_hours INTEGER,
+            created_at TIMESTAMP NOT NULL
+        )
+        ''',
+        # list_moderation for a chat, and for one user in it
+        'CREATE INDEX IF NOT EXISTS idx_moderation_events_chat ON moderation_events (chat_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_moderation_events_chat_user ON moderation_events (chat_id, user_id, id)',
+        # Nothing wrote user_stats before, and it was keyed by user alone;
+        # rebuild it per chat from the warnings and mutes still on record
+        '''
+        CREATE TABLE user_stats_v7 (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            warnings_count INTEGER NOT NULL DEFAULT 0,
+            mutes_count INTEGER NOT NULL DEFAULT 0,
+            kicks_count INTEGER NOT NULL DEFAULT 0,
+            bans_count INTEGER NOT NULL DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, user_id)
+        )
+        ''',
+        '''
+        INSERT INTO user_stats_v7 (chat_id, user_id, warnings_count, mutes_count)
+        SELECT chat_id, user_id, SUM(warnings), SUM(mutes) FROM (
+            SELECT chat_id, user_id, lifetime AS warnings, 0 AS mutes FROM warning_counts
+            UNION ALL
+            SELECT chat_id, user_id, 0, 1 FROM mutes WHERE chat_id IS NOT NULL AND user_id IS NOT NULL
+        ) GROUP BY chat_id, user_id
+        ''',
+        'DROP TABLE user_stats',
+        'ALTER TABLE user_stats_v7 RENAME TO user_stats',
+    ]),
+]
+
+# chat_id given to user_levels rows migrated from the global (pre-v3) table;
+# each row moves to the first chat its user earns XP in after the upgrade
+LEGACY_CHAT_ID = 0
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Apply every pending migration, each in its own transaction.
+
+    Safe to run on every startup and from several processes at once: the
+    version is re-read after taking the write lock. Returns the number of
+    migrations applied.
+    """
+    applied = 0
+    for version, description, statements in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+        applied += 1
+        logger.info(f"Applied database migration {version}: {description}")
+
+    if applied:
+        conn.execute('PRAGMA optimize')
+    return applied
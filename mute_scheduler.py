@@ -0,0 +1,104 @@
+import heapq
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MuteKey = Tuple[int, int]  # (chat_id, user_id)
+
+
+class MuteScheduler:
+    """Pending mute expiries ordered by unmute time.
+
+    A min-heap of ``(unmute_at, chat_id, user_id)`` gives the next expiry in
+    O(1) and each schedule/expire in O(log n). Re-muting or unmuting a user
+    leaves the old heap entry behind; it is recognised as stale and skipped
+    when it reaches the top. Active mutes per chat are counted as they are
+    scheduled and expire, so reading the count never touches the database.
+    Times are POSIX timestamps.
+    """
+
+    def __init__(self, pending: Iterable[Tuple[int, int, float]] = ()):
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int, int]] = []
+        self._due: Dict[MuteKey, float] = {}
+        self._active: Counter = Counter()
+        self.scheduled = 0
+        self.expired = 0
+        self.cancelled = 0
+        for chat_id, user_id, unmute_at in pending:
+            self._schedule((chat_id, user_id), unmute_at)
+        self.scheduled = 0
+
+    def __len__(self):
+        return len(self._due)
+
+    def _schedule(self, key: MuteKey, unmute_at: float):
+        if key not in self._due:
+            self._active[key[0]] += 1
+        self._due[key] = unmute_at
+        heapq.heappush(self._heap, (unmute_at, key[0], key[1]))
+        self.scheduled += 1
+
+    def _discard(self, key: MuteKey):
+        del self._due[key]
+        chat_id = key[0]
+        self._active[chat_id] -= 1
+        if not self._active[chat_id]:
+            del self._active[chat_id]
+
+    def schedule(self, chat_id: int, user_id: int, unmute_at: float):
+        """Track a mute; a later mute of the same user replaces the earlier one."""
+        with self._lock:
+            self._schedule((chat_id, user_id), unmute_at)
+
+    def cancel(self, chat_id: int, user_id: int) -> bool:
+        with self._lock:
+            if (chat_id, user_id) not in self._due:
+                return False
+            self._discard((chat_id, user_id))
+            self.cancelled += 1
+            return True
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap:
+            unmute_at, chat_id, user_id = heap[0]
+            if self._due.get((chat_id, user_id)) == unmute_at:
+                return
+            heapq.heappop(heap)
+
+    def next_due(self) -> Optional[float]:
+        """Timestamp of the earliest pending expiry, or None if nothing is muted."""
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[Tuple[int, int, float]]:
+        """Remove and return ``(chat_id, user_id, unmute_at)`` for every mute due by ``now``."""
+        due = []
+        with self._lock:
+            heap = self._heap
+            while True:
+                self._drop_stale()
+                if not heap or heap[0][0] > now:
+                    break
+                unmute_at, chat_id, user_id = heapq.heappop(heap)
+                self._discard((chat_id, user_id))
+                due.append((chat_id, user_id, unmute_at))
+            self.expired += len(due)
+        return due
+
+    def active_count(self, chat_id: int) -> int:
+        return self._active.get(chat_id, 0)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            self._drop_stale()
+            return {
+                "active_mutes": len(self._due),
+                "heap_size": len(self._heap),
+                "next_due": self._heap[0][0] if self._heap else None,
+                "scheduled": self.scheduled,
+                "expired": self.expired,
+                "cancelled": self.cancelled,
+            }
@@ -0,0 +1,302 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from collections import Counter, deque
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import registry
+from profiling import record_span
+from rate_limit import TokenBucketLimiter
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_REQUEST_SECONDS = registry.histogram(
+    "bot_telegram_request_seconds", "Bot API request latency, excluding time queued", "endpoint")
+TELEGRAM_ERRORS = registry.counter(
+    "bot_telegram_errors_total", "Bot API requests that raised, including 429s", "endpoint")
+OUTBOUND_QUEUE_SECONDS = registry.histogram(
+    "bot_outbound_queue_seconds", "Time a Bot API request waited for rate-limit tokens", "priority")
+
+# Lower runs first
+PRIORITY_MODERATION = 0
+PRIORITY_REPLY = 1
+PRIORITY_COSMETIC = 2
+
+MODERATION_ENDPOINTS = frozenset({
+    "banChatMember",
+    "unbanChatMember",
+    "restrictChatMember",
+    "banChatSenderChat",
+    "deleteMessage",
+    "deleteMessages",
+    "declineChatJoinRequest",
+    "approveChatJoinRequest",
+})
+COSMETIC_ENDPOINTS = frozenset({
+    "sendPhoto",
+    "sendAnimation",
+    "sendSticker",
+    "sendVideo",
+    "sendMediaGroup",
+    "sendChatAction",
+})
+# Not subject to Telegram's flood limits in practice, or must never wait
+UNLIMITED_ENDPOINTS = frozenset({
+    "getUpdates",
+    "setWebhook",
+    "deleteWebhook",
+    "answerCallbackQuery",
+    "answerInlineQuery",
+    "close",
+    "logOut",
+})
+# Only these count towards a chat's messages-per-minute allowance
+PER_CHAT_PREFIXES = ("send", "forward", "copy")
+
+_GLOBAL = 0
+
+
+class _Pending:
+    __slots__ = ("chat_id", "per_chat", "future", "enqueued_at")
+
+    def __init__(self, chat_id, per_chat: bool, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.per_chat = per_chat
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundDispatcher(BaseRateLimiter[int]):
+    """Queue outgoing Bot API calls behind global and per-chat token buckets.
+
+    Installed with ``ApplicationBuilder.rate_limiter``, so every request made
+    through ``context.bot`` or a message shortcut like ``reply_text`` passes
+    through it. Waiting requests are released in priority order (moderation,
+    then replies, then cosmetic media) as soon as the global bucket and the
+    target chat's bucket both have a token. A 429 pauses the chat it came
+    from, or everything if it had no chat, for ``retry_after`` seconds and
+    the request is queued again. Pass ``rate_limit_args=<priority>`` to a
+    bot method to override the priority of a single call.
+    """
+
+    def __init__(self, global_rate: float = 30, global_burst: float = 30,
+                 group_rate: float = 20 / 60, group_burst: float = 5,
+                 private_rate: float = 1, private_burst: float = 3,
+                 max_retries: int = 3, latency_samples: int = 1000):
+        self.global_bucket = TokenBucketLimiter(global_rate, global_burst)
+        self.group_buckets = TokenBucketLimiter(group_rate, group_burst)
+        self.private_buckets = TokenBucketLimiter(private_rate, private_burst)
+        self.max_retries = max_retries
+        # Sorted by (priority, arrival); released front to back
+        self._queue: List[Tuple[int, int, _Pending]] = []
+        self._seq = itertools.count()
+        # chat_id -> monotonic time its flood wait ends; None pauses every chat
+        self._paused_until: Dict[Any, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._waits: Deque[float] = deque(maxlen=latency_samples)
+        self.sent = 0
+        self.retried = 0
+        self.flood_waits = 0
+        self.failed = 0
+        self.max_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        # Not __len__: ExtBot skips a rate limiter that is falsy
+        return len(self._queue)
+
+    async def initialize(self) -> None:
+        self._ensure_worker()
+
+    async def shutdown(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for _, _, pending in self._queue:
+            pending.future.cancel()
+        self._queue.clear()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._release_loop())
+
+    @staticmethod
+    def _priority(endpoint: str) -> int:
+        if endpoint in MODERATION_ENDPOINTS:
+            return PRIORITY_MODERATION
+        if endpoint in COSMETIC_ENDPOINTS:
+            return PRIORITY_COSMETIC
+        return PRIORITY_REPLY
+
+    @staticmethod
+    def _chat_key(chat_id) -> Optional[Union[int, str]]:
+        if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+            return int(chat_id)
+        return chat_id
+
+    def _chat_bucket(self, chat_id) -> TokenBucketLimiter:
+        # Positive ids are private chats; groups, channels and @usernames are not
+        if isinstance(chat_id, int) and chat_id > 0:
+            return self.private_buckets
+        return self.group_buckets
+
+    def _paused_for(self, key, now: float) -> float:
+        until = self._paused_until.get(key)
+        if until is None:
+            return 0.0
+        if until <= now:
+            del self._paused_until[key]
+            return 0.0
+        return until - now
+
+    def _release_ready(self) -> Optional[float]:
+        """Release every request that may go now; seconds until the next one could."""
+        now = time.monotonic()
+        global_pause = self._paused_for(None, now)
+        if global_pause:
+            return global_pause
+
+        wait = None
+        global_blocked = False
+        remaining = []
+        for entry in self._queue:
+            pending = entry[2]
+            if pending.future.done():
+                # The caller gave up waiting
+                continue
+            if global_blocked:
+                remaining.append(entry)
+                continue
+
+            chat_id = pending.chat_id
+            chat_wait = self._paused_for(chat_id, now) if chat_id is not None else 0.0
+            if not chat_wait and pending.per_chat:
+                chat_wait = self._chat_bucket(chat_id).retry_after(chat_id, 1.0, now)
+            if chat_wait:
+                # Other chats may still go ahead of this one
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+                remaining.append(entry)
+                continue
+
+            global_wait = self.global_bucket.retry_after(_GLOBAL, 1.0, now)
+            if global_wait:
+                # Nothing behind this request may overtake it
+                wait = global_wait if wait is None else min(wait, global_wait)
+                global_blocked = True
+                remaining.append(entry)
+                continue
+
+            self.global_bucket.consume(_GLOBAL, 1.0, now)
+            if pending.per_chat:
+                self._chat_bucket(chat_id).consume(chat_id, 1.0, now)
+            pending.future.set_result(None)
+
+        self._queue = remaining
+        return wait
+
+    async def _release_loop(self):
+        while True:
+            try:
+                wait = self._release_ready()
+            except Exception as e:
+                logger.error(f"Error releasing outbound requests: {e}")
+                wait = 1.0
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _acquire(self, priority: int, chat_id, per_chat: bool):
+        self._ensure_worker()
+        pending = _Pending(chat_id, per_chat, asyncio.get_running_loop().create_future())
+        bisect.insort(self._queue, (priority, next(self._seq), pending))
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        self._wakeup.set()
+        await pending.future
+        waited = time.monotonic() - pending.enqueued_at
+        self._waits.append(waited)
+        OUTBOUND_QUEUE_SECONDS.observe(priority, waited)
+        record_span("api_wait", "rate_limit", waited)
+
+    @staticmethod
+    async def _timed(callback, args, kwargs, endpoint: str):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.inc(endpoint)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            TELEGRAM_REQUEST_SECONDS.observe(endpoint, elapsed)
+            record_span("api", endpoint, elapsed)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], None]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], None]:
+        if endpoint in UNLIMITED_ENDPOINTS or endpoint.startswith("get"):
+            return await self._timed(callback, args, kwargs, endpoint)
+
+        priority = self._priority(endpoint) if rate_limit_args is None else rate_limit_args
+        chat_id = self._chat_key(data.get("chat_id"))
+        per_chat = chat_id is not None and endpoint.startswith(PER_CHAT_PREFIXES)
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, chat_id, per_chat)
+            try:
+                result = await self._timed(callback, args, kwargs, endpoint)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                self.flood_waits += 1
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                until = time.monotonic() + retry_after
+                self._paused_until[chat_id] = max(until, self._paused_until.get(chat_id, 0.0))
+                logger.warning(f"Flood control on {endpoint} for chat {chat_id}: retry in {retry_after}s")
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+
+    def get_metrics(self) -> Dict:
+        queue = list(self._queue)
+        waits = sorted(self._waits)
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2) if waits else 0.0
+
+        return {
+            "queue_depth": len(queue),
+            "queue_depth_by_priority": dict(Counter(priority for priority, _, _ in queue)),
+            "max_depth": self.max_depth,
+            "paused_chats": len(self._paused_until),
+            "sent": self.sent,
+            "retried": self.retried,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p99_ms": percentile(0.99),
+            "wait_max_ms": round(waits[-1] * 1000, 2) if waits else 0.0,
+        }
@@ -0,0 +1,528 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from storage import (StorageBackend, StorageError, ModerationEvent, partition_end, user_stats_deltas,
+                     utc_timestamp, warning_partition)
+
+try:
+    import asyncpg
+except ImportError:  # only needed when STORAGE_CONFIG["BACKEND"] == "postgres"
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+# Mirrors migrations.py at its current version; ids are BIGINT because
+# supergroup ids do not fit in 32 bits
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_levels (
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        xp BIGINT NOT NULL DEFAULT 0,
+        level INTEGER NOT NULL DEFAULT 1,
+        messages_count BIGINT NOT NULL DEFAULT 0,
+        last_message_time TIMESTAMP,
+        created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+        PRIMARY KEY (chat_id, user_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_user_levels_chat_rank ON user_levels (chat_id, level DESC, xp DESC)',
+    # Warnings live in monthly tables (partition_ddl) listed here
+    'CREATE TABLE IF NOT EXISTS warning_partitions (name TEXT PRIMARY KEY)',
+    # One id sequence for every partition, so ids never repeat across months
+    'CREATE SEQUENCE IF NOT EXISTS warning_ids',
+    '''
+    CREATE TABLE IF NOT EXISTS warning_counts (
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        active INTEGER NOT NULL DEFAULT 0,
+        lifetime INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (chat_id, user_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_warning_counts_user ON warning_counts (user_id, active)',
+    '''
+    CREATE TABLE IF NOT EXISTS chat_warning_counts (
+        chat_id BIGINT PRIMARY KEY,
+        users INTEGER NOT NULL DEFAULT 0,
+        warnings INTEGER NOT NULL DEFAULT 0,
+        lifetime INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS mutes (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        chat_id BIGINT NOT NULL,
+        muted_by BIGINT,
+        duration_hours INTEGER,
+        unmute_time TIMESTAMP NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_mutes_chat_user ON mutes (chat_id, user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_mutes_chat_unmute ON mutes (chat_id, unmute_time)',
+    'CREATE INDEX IF NOT EXISTS idx_mutes_unmute ON mutes (unmute_time)',
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        warnings_count INTEGER NOT NULL DEFAULT 0,
+        mutes_count INTEGER NOT NULL DEFAULT 0,
+        kicks_count INTEGER NOT NULL DEFAULT 0,
+        bans_count INTEGER NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+        PRIMARY KEY (chat_id, user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS moderation_events (
+        id BIGSERIAL PRIMARY KEY,
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        action TEXT NOT NULL,
+        actor_id BIGINT,
+        reason TEXT,
+        duration_hours INTEGER,
+        created_at TIMESTAMP NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_moderation_events_chat ON moderation_events (chat_id, id)',
+    'CREATE INDEX IF NOT EXISTS idx_moderation_events_chat_user ON moderation_events (chat_id, user_id, id)',
+    '''
+    CREATE TABLE IF NOT EXISTS user_identities (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        username_lc TEXT,
+        first_name TEXT,
+        updated_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_user_identities_username ON user_identities (username_lc)',
+    '''
+    CREATE TABLE IF NOT EXISTS media_cache (
+        url TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        updated_at TIMESTAMP
+    )
+    ''',
+    'CREATE TABLE IF NOT EXISTS bot_settings (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at TIMESTAMP)',
+]
+
+
+def partition_ddl(name: str):
+    """Statements creating one month's warnings table."""
+    return [
+        f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id BIGINT PRIMARY KEY DEFAULT nextval('warning_ids'),
+            user_id BIGINT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            warned_by BIGINT,
+            reason TEXT,
+            created_at TIMESTAMP NOT NULL
+        )
+        ''',
+        f'CREATE INDEX IF NOT EXISTS idx_{name}_chat_user ON {name} (chat_id, user_id, created_at)',
+    ]
+
+
+def _text(value) -> Optional[str]:
+    """Timestamps as the 'YYYY-MM-DD HH:MM:SS' strings the SQLite driver returns."""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+def _row(record) -> Dict:
+    return {key: _text(value) for key, value in record.items()}
+
+
+class PostgresStorage(StorageBackend):
+    """Driver for PostgreSQL and wire-compatible servers (CockroachDB, YugabyteDB).
+
+    Queries run on an asyncpg connection pool owned by a private event loop
+    thread; the synchronous methods AnimeBotDatabase calls from its executor
+    threads submit to that loop and wait, so up to ``max_size`` of them run
+    concurrently on the server. Schema creation is idempotent and runs under
+    an advisory lock, so several bot processes can start at once.
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10, command_timeout: float = 30):
+        if asyncpg is None:
+            raise StorageError("The postgres storage backend needs the asyncpg package")
+        if not dsn:
+            raise StorageError("STORAGE_CONFIG['POSTGRES_DSN'] is not set")
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="postgres-loop", daemon=True)
+        self._thread.start()
+        self._stats_lock = threading.Lock()
+        # Warning partitions this process has created or seen created
+        self._known_partitions = set()
+        self._queries = 0
+        self._write_queries = 0
+        self._total_time = 0.0
+        try:
+            self._pool = self._submit(self._create_pool(dsn, min_size, max_size, command_timeout))
+            self._submit(self._create_schema())
+        except Exception:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            raise
+
+    @staticmethod
+    async def _create_pool(dsn, min_size, max_size, command_timeout):
+        # create_pool returns an awaitable Pool, not a coroutine run_coroutine_threadsafe accepts
+        return await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size,
+                                         command_timeout=command_timeout)
+
+    def _submit(self, coro):
+        try:
+            return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError) as e:
+            raise StorageError(str(e)) from e
+
+    def _call(self, method: str, *args, write: bool = False):
+        """Run one pool method (fetch, fetchrow, fetchval, execute, executemany)."""
+        started = time.perf_counter()
+        try:
+            return self._submit(getattr(self._pool, method)(*args))
+        finally:
+            with self._stats_lock:
+                self._queries += 1
+                if write:
+                    self._write_queries += 1
+                self._total_time += time.perf_counter() - started
+
+    def _transaction(self, work):
+        """Run ``work(conn)`` (a coroutine function) inside one transaction."""
+        async def run():
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    return await work(conn)
+
+        started = time.perf_counter()
+        try:
+            return self._submit(run())
+        finally:
+            with self._stats_lock:
+                self._queries += 1
+                self._write_queries += 1
+                self._total_time += time.perf_counter() - started
+
+    async def _create_schema(self):
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('SELECT pg_advisory_xact_lock(8675309)')
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+                await conn.execute('''
+                    INSERT INTO schema_version (version, applied_at) VALUES ($1, now() AT TIME ZONE 'utc')
+                    ON CONFLICT (version) DO NOTHING
+                ''', SCHEMA_VERSION)
+
+    # === LEVELS ===
+    def load_level_scores(self):
+        return [tuple(record) for record in self._call('fetch', 'SELECT chat_id, user_id, xp FROM user_levels')]
+
+    def get_level(self, chat_id, user_id):
+        record = self._call('fetchrow', 'SELECT * FROM user_levels WHERE chat_id=$1 AND user_id=$2',
+                            chat_id, user_id)
+        return _row(record) if record else None
+
+    def save_levels(self, rows):
+        self._call('executemany', '''
+            INSERT INTO user_levels AS l
+            (chat_id, user_id, username, first_name, xp, level, messages_count, last_message_time)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET
+            xp=excluded.xp, level=excluded.level, username=excluded.username,
+            first_name=excluded.first_name,
+            messages_count=l.messages_count+excluded.messages_count,
+            last_message_time=excluded.last_message_time
+        ''', rows, write=True)
+        return [(row[0], row[1]) for row in rows]
+
+    def move_level(self, user_id, from_chat_id, to_chat_id):
+        # A concurrent move of the same row waits for this one, then matches nothing
+        status = self._call('execute', '''
+            UPDATE user_levels SET chat_id=$3 WHERE chat_id=$2 AND user_id=$1
+            AND NOT EXISTS (SELECT 1 FROM user_levels WHERE chat_id=$3 AND user_id=$1)
+        ''', user_id, from_chat_id, to_chat_id, write=True)
+        return status == "UPDATE 1"
+
+    def top_levels(self, chat_id, limit):
+        records = self._call('fetch', '''
+            SELECT user_id, username, first_name, level, xp, messages_count
+            FROM user_levels
+            WHERE chat_id=$1
+            ORDER BY level DESC, xp DESC
+            LIMIT $2
+        ''', chat_id, limit)
+        return [dict(record) for record in records]
+
+    def recompute_levels(self, levels_for_xp):
+        async def work(conn):
+            records = await conn.fetch('SELECT chat_id, user_id, level, xp FROM user_levels FOR UPDATE')
+            levels = levels_for_xp(record['xp'] for record in records)
+            changed = [
+                (level, record['chat_id'], record['user_id'])
+                for record, level in zip(records, levels) if level != record['level']
+            ]
+            await conn.executemany('UPDATE user_levels SET level=$1 WHERE chat_id=$2 AND user_id=$3', changed)
+            return len(records), len(changed)
+
+        return self._transaction(work)
+
+    def get_setting(self, key):
+        return self._call('fetchval', 'SELECT value FROM bot_settings WHERE key=$1', key)
+
+    def set_setting(self, key, value):
+        self._call('execute', '''
+            INSERT INTO bot_settings (key, value) VALUES ($1, $2)
+            ON CONFLICT (key) DO UPDATE SET value=excluded.value
+        ''', key, value, write=True)
+
+    # === WARNINGS ===
+    def _partition_names(self):
+        """Warning partitions, newest first."""
+        return [record['name'] for record in
+                self._call('fetch', 'SELECT name FROM warning_partitions ORDER BY name DESC')]
+
+    def add_warning(self, user_id, chat_id, warned_by, reason):
+        created_at = utc_timestamp()
+        partition = warning_partition(created_at)
+        create = partition not in self._known_partitions
+
+        async def work(conn):
+            if create:
+                # Concurrent CREATE TABLE IF NOT EXISTS can still collide on the catalog
+                await conn.execute('SELECT pg_advisory_xact_lock(hashtext($1))', partition)
+                for statement in partition_ddl(partition):
+                    await conn.execute(statement)
+                await conn.execute('INSERT INTO warning_partitions (name) VALUES ($1) ON CONFLICT DO NOTHING',
+                                   partition)
+            await conn.execute(f'''
+                INSERT INTO {partition} (user_id, chat_id, warned_by, reason, created_at)
+                VALUES ($1, $2, $3, $4, $5)
+            ''', user_id, chat_id, warned_by, reason, datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S"))
+            active = await conn.fetchval('''
+                INSERT INTO warning_counts AS w (chat_id, user_id, active, lifetime) VALUES ($1, $2, 1, 1)
+                ON CONFLICT (chat_id, user_id) DO UPDATE SET active=w.active+1, lifetime=w.lifetime+1
+                RETURNING active
+            ''', chat_id, user_id)
+            await conn.execute('''
+                INSERT INTO chat_warning_counts AS c (chat_id, users, warnings, lifetime) VALUES ($1, $2, 1, 1)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                users=c.users+excluded.users, warnings=c.warnings+1, lifetime=c.lifetime+1
+            ''', chat_id, 1 if active == 1 else 0)
+            await self._write_moderation(conn, [ModerationEvent("warn", chat_id, user_id, warned_by, reason)])
+
+        self._transaction(work)
+        self._known_partitions.add(partition)
+
+    def count_warnings(self, user_id, chat_id=None):
+        if chat_id is None:
+            count = self._call('fetchval', 'SELECT SUM(active) FROM warning_counts WHERE user_id=$1', user_id)
+        else:
+            count = self._call('fetchval', 'SELECT active FROM warning_counts WHERE chat_id=$1 AND user_id=$2',
+                               chat_id, user_id)
+        return count or 0
+
+    def list_warnings(self, user_id, chat_id):
+        if not self.count_warnings(user_id, chat_id):
+            return []
+        partitions = self._partition_names()
+        if not partitions:
+            return []
+        union = ' UNION ALL '.join(
+            f'SELECT * FROM {name} WHERE chat_id=$1 AND user_id=$2' for name in partitions
+        )
+        records = self._call('fetch', f'{union} ORDER BY created_at DESC, id DESC', chat_id, user_id)
+        return [_row(record) for record in records]
+
+    def clear_warnings(self, user_id, chat_id):
+        partitions = self._partition_names()
+
+        async def work(conn):
+            for name in partitions:
+                await conn.execute(f'DELETE FROM {name} WHERE chat_id=$1 AND user_id=$2', chat_id, user_id)
+            active = await conn.fetchval(
+                'SELECT active FROM warning_counts WHERE chat_id=$1 AND user_id=$2 FOR UPDATE', chat_id, user_id)
+            if active:
+                await conn.execute('UPDATE warning_counts SET active=0 WHERE chat_id=$1 AND user_id=$2',
+                                   chat_id, user_id)
+                await conn.execute(
+                    'UPDATE chat_warning_counts SET users=users-1, warnings=warnings-$1 WHERE chat_id=$2',
+                    active, chat_id)
+
+        self._transaction(work)
+
+    def chat_warning_stats(self, chat_id):
+        record = self._call('fetchrow', 'SELECT users, warnings, lifetime FROM chat_warning_counts WHERE chat_id=$1',
+                            chat_id)
+        users, warnings, lifetime = tuple(record) if record else (0, 0, 0)
+        return {"total_users": users, "total_warnings": warnings, "lifetime_warnings": lifetime}
+
+    @staticmethod
+    async def _drop_partition(conn, name: str):
+        """Take a partition's rows out of the stored counters, then drop the table."""
+        records = await conn.fetch(f'SELECT chat_id, user_id, COUNT(*) AS n FROM {name} GROUP BY chat_id, user_id')
+        await conn.executemany(
+            'UPDATE warning_counts SET active=GREATEST(active-$1, 0) WHERE chat_id=$2 AND user_id=$3',
+            [(record['n'], record['chat_id'], record['user_id']) for record in records])
+        await conn.executemany('''
+            UPDATE chat_warning_counts c SET
+            users=(SELECT COUNT(*) FROM warning_counts w WHERE w.chat_id=c.chat_id AND w.active>0),
+            warnings=(SELECT COALESCE(SUM(active), 0) FROM warning_counts w WHERE w.chat_id=c.chat_id)
+            WHERE chat_id=$1
+        ''', [(chat_id,) for chat_id in {record['chat_id'] for record in records}])
+        await conn.execute(f'DROP TABLE IF EXISTS {name}')
+        await conn.execute('DELETE FROM warning_partitions WHERE name=$1', name)
+
+    # === MUTES ===
+    def add_mute(self, user_id, chat_id, muted_by, duration_hours, unmute_time):
+        async def work(conn):
+            await conn.execute('''
+                INSERT INTO mutes (user_id, chat_id, muted_by, duration_hours, unmute_time)
+                VALUES ($1, $2, $3, $4, $5)
+            ''', user_id, chat_id, muted_by, duration_hours, unmute_time)
+            await self._write_moderation(conn, [
+                ModerationEvent("mute", chat_id, user_id, muted_by, None, duration_hours)
+            ])
+
+        self._transaction(work)
+
+    def remove_mute(self, user_id, chat_id):
+        self._call('execute', 'DELETE FROM mutes WHERE user_id=$1 AND chat_id=$2', user_id, chat_id, write=True)
+
+    def pending_mutes(self, now):
+        records = self._call('fetch', 'SELECT chat_id, user_id, unmute_time FROM mutes WHERE unmute_time > $1', now)
+        return [tuple(record) for record in records]
+
+    def expire_mutes(self, due):
+        self._call('executemany', 'DELETE FROM mutes WHERE user_id=$1 AND chat_id=$2 AND unmute_time<=$3',
+                   [(user_id, chat_id, unmute_time) for chat_id, user_id, unmute_time in due], write=True)
+
+    # === MODERATION ===
+    @staticmethod
+    async def _write_moderation(conn, events):
+        """Log events and UPSERT each user's counters once, on the caller's transaction."""
+        now = datetime.strptime(utc_timestamp(), "%Y-%m-%d %H:%M:%S")
+        await conn.executemany('''
+            INSERT INTO moderation_events (chat_id, user_id, action, actor_id, reason, duration_hours, created_at)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ''', [(e.chat_id, e.user_id, e.action, e.actor_id, e.reason, e.duration_hours, now) for e in events])
+        await conn.executemany('''
+            INSERT INTO user_stats AS s
+            (chat_id, user_id, warnings_count, mutes_count, kicks_count, bans_count, last_updated)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET
+            warnings_count=s.warnings_count+excluded.warnings_count,
+            mutes_count=s.mutes_count+excluded.mutes_count,
+            kicks_count=s.kicks_count+excluded.kicks_count,
+            bans_count=s.bans_count+excluded.bans_count,
+            last_updated=excluded.last_updated
+        ''', user_stats_deltas(events, now))
+
+    def record_moderation(self, events):
+        self._transaction(lambda conn: self._write_moderation(conn, events))
+
+    def list_moderation(self, chat_id, user_id=None, limit=20):
+        if user_id is None:
+            records = self._call('fetch', '''
+                SELECT * FROM moderation_events WHERE chat_id=$1 ORDER BY id DESC LIMIT $2
+            ''', chat_id, limit)
+        else:
+            records = self._call('fetch', '''
+                SELECT * FROM moderation_events WHERE chat_id=$1 AND user_id=$2 ORDER BY id DESC LIMIT $3
+            ''', chat_id, user_id, limit)
+        return [_row(record) for record in records]
+
+    def get_user_stats(self, chat_id, user_id):
+        record = self._call('fetchrow', 'SELECT * FROM user_stats WHERE chat_id=$1 AND user_id=$2',
+                            chat_id, user_id)
+        return _row(record) if record else None
+
+    # === IDENTITIES AND MEDIA ===
+    def load_identities(self):
+        return [tuple(record) for record in
+                self._call('fetch', 'SELECT user_id, username, first_name FROM user_identities')]
+
+    def save_identity(self, user_id, username, first_name):
+        username_lc = username.lower() if username else None
+
+        async def work(conn):
+            if username_lc:
+                # Usernames are unique on Telegram; whoever had it before gave it up
+                await conn.execute('''
+                    UPDATE user_identities SET username=NULL, username_lc=NULL
+                    WHERE username_lc=$1 AND user_id<>$2
+                ''', username_lc, user_id)
+            await conn.execute('''
+                INSERT INTO user_identities (user_id, username, username_lc, first_name, updated_at)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (user_id) DO UPDATE SET
+                username=excluded.username, username_lc=excluded.username_lc,
+                first_name=excluded.first_name, updated_at=excluded.updated_at
+            ''', user_id, username, username_lc, first_name, datetime.now())
+
+        self._transaction(work)
+
+    def find_identity(self, username_lc):
+        record = self._call('fetchrow', '''
+            SELECT user_id, username, first_name FROM user_identities WHERE username_lc=$1 LIMIT 1
+        ''', username_lc)
+        return tuple(record) if record else None
+
+    def load_media_cache(self):
+        return {record['url']: record['file_id']
+                for record in self._call('fetch', 'SELECT url, file_id FROM media_cache')}
+
+    def save_media_file_id(self, url, file_id):
+        self._call('execute', '''
+            INSERT INTO media_cache (url, file_id, updated_at) VALUES ($1, $2, $3)
+            ON CONFLICT (url) DO UPDATE SET file_id=excluded.file_id, updated_at=excluded.updated_at
+        ''', url, file_id, datetime.now(), write=True)
+
+    def forget_media_file_id(self, url):
+        self._call('execute', 'DELETE FROM media_cache WHERE url=$1', url, write=True)
+
+    # === MAINTENANCE ===
+    def cleanup(self, warnings_before, mutes_before):
+        expired = [name for name in self._partition_names() if partition_end(name) <= warnings_before]
+        for name in expired:
+            self._transaction(lambda conn, name=name: self._drop_partition(conn, name))
+            self._known_partitions.discard(name)
+            logger.info(f"Dropped warning partition {name}")
+        self._call('execute', 'DELETE FROM mutes WHERE unmute_time < $1', mutes_before, write=True)
+        return len(expired)
+
+    def get_metrics(self):
+        with self._stats_lock:
+            queries = self._queries
+            return {
+                "queries": queries,
+                "write_queries": self._write_queries,
+                "avg_query_ms": round(self._total_time / queries * 1000, 4) if queries else 0.0,
+                "pool_size": self._pool.get_size(),
+                "pool_idle": self._pool.get_idle_size(),
+            }
+
+    def close(self):
+        try:
+            self._submit(self._pool.close())
+        except StorageError as e:
+            logger.error(f"Error closing the postgres pool: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
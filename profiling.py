@@ -0,0 +1,161 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+
+# === SLOW-UPDATE TRACING ===
+class UpdateTrace:
+    """Time spent per (kind, name) while one update is being handled.
+
+    Kinds are ``handler``, ``db`` (method execution), ``db_wait`` (queued
+    for an executor thread), ``api`` (Bot API request) and ``api_wait``
+    (queued for rate-limit tokens).
+    """
+
+    __slots__ = ("update_id", "chat_id", "started", "spans")
+
+    def __init__(self, update_id: Optional[int], chat_id: Optional[int]):
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.started = time.perf_counter()
+        self.spans: Dict[Tuple[str, str], list] = {}
+
+    def add(self, kind: str, name: str, seconds: float):
+        span = self.spans.get((kind, name))
+        if span is None:
+            self.spans[(kind, name)] = [1, seconds]
+        else:
+            span[0] += 1
+            span[1] += seconds
+
+    def to_dict(self, total: float) -> Dict:
+        return {
+            "update_id": self.update_id,
+            "chat_id": self.chat_id,
+            "total_ms": round(total * 1000, 2),
+            "spans": [
+                {"kind": kind, "name": name, "calls": calls, "ms": round(seconds * 1000, 2)}
+                for (kind, name), (calls, seconds) in sorted(self.spans.items(), key=lambda item: -item[1][1])
+            ],
+        }
+
+    def describe(self, total: float) -> str:
+        spans = ", ".join(
+            f"{kind} {name}{f' x{calls}' if calls > 1 else ''} {seconds * 1000:.1f}ms"
+            for (kind, name), (calls, seconds) in sorted(self.spans.items(), key=lambda item: -item[1][1])
+        )
+        return f"Slow update {self.update_id} (chat {self.chat_id}): {total * 1000:.0f}ms total; {spans}"
+
+
+current_trace: ContextVar[Optional[UpdateTrace]] = ContextVar("current_trace", default=None)
+# Most recent slow updates, newest last
+slow_updates: Deque[Dict] = deque(maxlen=50)
+
+
+def record_span(kind: str, name: str, seconds: float):
+    """Attribute time to the update being handled in this context, if any."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(kind, name, seconds)
+
+
+class TracingApplication(Application):
+    """Application that traces each update and logs a span breakdown for slow ones.
+
+    Install with ``ApplicationBuilder.application_class``. Handlers, database
+    calls and Bot API requests made while an update is processed report into
+    its trace through ``record_span``; set ``slow_update_seconds`` to 0 to
+    switch tracing off.
+    """
+
+    slow_update_seconds = 1.0
+
+    async def process_update(self, update: object) -> None:
+        if not self.slow_update_seconds or not isinstance(update, Update):
+            return await super().process_update(update)
+
+        trace = UpdateTrace(update.update_id, update.effective_chat.id if update.effective_chat else None)
+        token = current_trace.set(trace)
+        try:
+            await super().process_update(update)
+        finally:
+            current_trace.reset(token)
+            total = time.perf_counter() - trace.started
+            if total >= self.slow_update_seconds:
+                slow_updates.append(trace.to_dict(total))
+                logger.warning(trace.describe(total))
+
+
+# === PROFILING SESSIONS ===
+_session_lock = asyncio.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample_stacks(seconds: float, interval: float) -> Counter:
+    """Collapsed stacks of every other thread, sampled every ``interval`` seconds."""
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+async def profile(seconds: float, mode: str = "sample", interval: float = 0.005) -> str:
+    """Profile the running process for ``seconds`` and return a text dump.
+
+    ``sample`` walks every thread's stack on a timer and returns collapsed
+    stacks (one ``frame;frame;... count`` line each, ready for flamegraph
+    tools); it sees SQLite time on the database threads. ``cprofile``
+    instruments the event loop thread and returns pstats sorted by
+    cumulative time.
+    """
+    if mode not in ("sample", "cprofile"):
+        raise ValueError("mode must be 'sample' or 'cprofile'")
+    if _session_lock.locked():
+        raise RuntimeError("A profiling session is already running")
+
+    async with _session_lock:
+        logger.info(f"Starting {seconds}s {mode} profiling session")
+        if mode == "sample":
+            loop = asyncio.get_running_loop()
+            stacks = await loop.run_in_executor(None, _sample_stacks, seconds, interval)
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(80)
+        return out.getvalue()
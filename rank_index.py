@@ -0,0 +1,120 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class RankIndex:
+    """In-memory order-statistic index answering rank queries in O(log n).
+
+    Scores are kept in sorted blocks of at most ``2 * load`` entries with a
+    Fenwick tree over the block sizes, so counting the scores above a value
+    is a bisect over block maxima, a tree prefix sum and one in-block bisect.
+    Updates cost O(log n + load).
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, int]] = (), load: int = 512):
+        self.load = load
+        self._scores: Dict[int, int] = dict(items)
+        ordered = sorted(self._scores.values())
+        self._blocks: List[List[int]] = [ordered[i:i + load] for i in range(0, len(ordered), load)]
+        self._maxes: List[int] = [block[-1] for block in self._blocks]
+        self._rebuild_tree()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._scores
+
+    def score(self, user_id: int) -> Optional[int]:
+        return self._scores.get(user_id)
+
+    # --- Fenwick tree over block sizes ---
+    def _rebuild_tree(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, block_index: int, delta: int):
+        i = block_index + 1
+        tree = self._tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, block_count: int) -> int:
+        total, i = 0, block_count
+        tree = self._tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    # --- Updates ---
+    def _insert(self, score: int):
+        if not self._blocks:
+            self._blocks.append([score])
+            self._maxes.append(score)
+            self._rebuild_tree()
+            return
+
+        index = bisect_left(self._maxes, score)
+        if index == len(self._blocks):
+            index -= 1
+        block = self._blocks[index]
+        insort(block, score)
+        self._maxes[index] = block[-1]
+
+        if len(block) > 2 * self.load:
+            self._blocks[index:index + 1] = [block[:self.load], block[self.load:]]
+            self._maxes[index:index + 1] = [block[self.load - 1], block[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(index, 1)
+
+    def _delete(self, score: int):
+        index = bisect_left(self._maxes, score)
+        block = self._blocks[index]
+        del block[bisect_left(block, score)]
+
+        if block:
+            self._maxes[index] = block[-1]
+            self._tree_add(index, -1)
+        else:
+            del self._blocks[index]
+            del self._maxes[index]
+            self._rebuild_tree()
+
+    def update(self, user_id: int, score: int):
+        """Insert a user or move them to a new score."""
+        previous = self._scores.get(user_id)
+        if previous == score:
+            return
+        if previous is not None:
+            self._delete(previous)
+        self._scores[user_id] = score
+        self._insert(score)
+
+    def remove(self, user_id: int):
+        previous = self._scores.pop(user_id, None)
+        if previous is not None:
+            self._delete(previous)
+
+    # --- Queries ---
+    def count_greater(self, score: int) -> int:
+        """Number of users with a strictly higher score."""
+        index = bisect_right(self._maxes, score)
+        not_greater = self._tree_prefix(index)
+        if index < len(self._blocks):
+            not_greater += bisect_right(self._blocks[index], score)
+        return len(self._scores) - not_greater
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank with ties sharing the best position, or None if unknown."""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self.count_greater(score) + 1
@@ -0,0 +1,110 @@
+import time
+from array import array
+from typing import Dict, Hashable, List, Optional
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets held in compact parallel arrays.
+
+    Each key gets a slot in two ``array('d')`` columns (tokens, last refill),
+    so a check is one dict lookup plus a little float arithmetic. Buckets
+    that have sat idle long enough to refill completely carry no state and
+    their slots are recycled by a periodic sweep.
+    """
+
+    def __init__(self, rate: float, burst: float, sweep_interval: float = 60.0):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Token bucket needs rate > 0 and burst >= 1")
+        self.rate = rate
+        self.burst = burst
+        self.sweep_interval = sweep_interval
+        self._slots: Dict[Hashable, int] = {}
+        self._keys: List[Optional[Hashable]] = []
+        self._tokens = array('d')
+        self._stamps = array('d')
+        self._free: List[int] = []
+        self._last_sweep: Optional[float] = None
+        self.allowed = 0
+        self.limited = 0
+        self.reclaimed = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _slot(self, key: Hashable, now: float) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+
+        if self._last_sweep is None:
+            self._last_sweep = now
+        elif now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+            self._tokens[slot] = self.burst
+            self._stamps[slot] = now
+        else:
+            slot = len(self._keys)
+            self._keys.append(key)
+            self._tokens.append(self.burst)
+            self._stamps.append(now)
+        self._slots[key] = slot
+        return slot
+
+    def _refill(self, slot: int, now: float) -> float:
+        tokens = self._tokens[slot] + (now - self._stamps[slot]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self._tokens[slot] = tokens
+        self._stamps[slot] = now
+        return tokens
+
+    def consume(self, key: Hashable, cost: float = 1.0, now: Optional[float] = None) -> bool:
+        """Take ``cost`` tokens from the key's bucket; False if there are not enough."""
+        if now is None:
+            now = time.monotonic()
+        slot = self._slot(key, now)
+        tokens = self._refill(slot, now)
+        if tokens >= cost:
+            self._tokens[slot] = tokens - cost
+            self.allowed += 1
+            return True
+        self.limited += 1
+        return False
+
+    def retry_after(self, key: Hashable, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Seconds until ``cost`` tokens are available, without consuming any."""
+        if now is None:
+            now = time.monotonic()
+        slot = self._slots.get(key)
+        if slot is None:
+            return 0.0
+        tokens = self._refill(slot, now)
+        return 0.0 if tokens >= cost else (cost - tokens) / self.rate
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Recycle slots whose buckets have refilled to the burst size."""
+        if now is None:
+            now = time.monotonic()
+        self._last_sweep = now
+        full_after = self.burst / self.rate
+        reclaimed = 0
+        for key, slot in list(self._slots.items()):
+            if now - self._stamps[slot] >= full_after:
+                del self._slots[key]
+                self._keys[slot] = None
+                self._free.append(slot)
+                reclaimed += 1
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    def get_metrics(self) -> Dict:
+        return {
+            "tracked_keys": len(self._slots),
+            "allocated_slots": len(self._keys),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "reclaimed": self.reclaimed,
+        }
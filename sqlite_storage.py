@@ -0,0 +1,470 @@
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+
+from db_pool import SQLiteConnectionManager
+from migrations import apply_migrations, warning_partition_ddl
+from storage import (StorageBackend, StorageError, ModerationEvent, partition_end, user_stats_deltas,
+                     utc_timestamp, warning_partition)
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(StorageBackend):
+    """The bot's original storage: one SQLite file, plus one file per sharded chat.
+
+    Chats listed in shard_chats keep their user_levels rows in their own
+    database under shard_dir, so a very active group's writes never contend
+    with everyone else's.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_name: str, cache_size_kb: int = 8192, busy_timeout_ms: int = 5000,
+                 mmap_size: int = 0, shard_chats=(), shard_dir: str = "shards"):
+        self.db_name = db_name
+        self._pool_settings = dict(cache_size_kb=cache_size_kb, busy_timeout_ms=busy_timeout_ms,
+                                   mmap_size=mmap_size)
+        self.pool = self._open_pool(db_name)
+        # Chats whose level tables live in their own SQLite file
+        self.shards: Dict[int, SQLiteConnectionManager] = {}
+        # Warning partitions this process has created or seen created
+        self._known_partitions = set()
+        try:
+            with self.pool.writer() as conn:
+                apply_migrations(conn)
+            logger.info("Database initialized successfully")
+        except sqlite3.Error as e:
+            logger.error(f"Database initialization error: {e}")
+        self._init_shards(shard_chats, shard_dir)
+
+    @staticmethod
+    @contextmanager
+    def _errors():
+        try:
+            yield
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def _open_pool(self, db_name: str) -> SQLiteConnectionManager:
+        return SQLiteConnectionManager(db_name, **self._pool_settings)
+
+    def _init_shards(self, shard_chats, shard_dir: str):
+        """Open one database file per sharded chat and move its levels there."""
+        if not shard_chats:
+            return
+
+        os.makedirs(shard_dir, exist_ok=True)
+        for chat_id in shard_chats:
+            try:
+                pool = self._open_pool(os.path.join(shard_dir, f"chat_{chat_id}.db"))
+                with pool.writer() as conn:
+                    apply_migrations(conn)
+                self.shards[chat_id] = pool
+                self._move_chat_to_shard(chat_id, pool)
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Error opening shard for chat {chat_id}, keeping it in the main database: {e}")
+
+    def _move_chat_to_shard(self, chat_id: int, shard: SQLiteConnectionManager):
+        with self.pool.reader() as conn:
+            rows = [tuple(row) for row in conn.execute('''
+                SELECT chat_id, user_id, username, first_name, xp, level,
+                messages_count, last_message_time, created_at
+                FROM user_levels WHERE chat_id=?
+            ''', (chat_id,))]
+        if not rows:
+            return
+
+        # Copy first, then delete: a crash in between leaves duplicates that
+        # the next startup resolves in favour of the shard.
+        with shard.writer() as conn:
+            conn.executemany('''
+                INSERT OR IGNORE INTO user_levels
+                (chat_id, user_id, username, first_name, xp, level,
+                messages_count, last_message_time, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        with self.pool.writer() as conn:
+            conn.execute('DELETE FROM user_levels WHERE chat_id=?', (chat_id,))
+        logger.info(f"Moved {len(rows)} level rows for chat {chat_id} to its shard")
+
+    def _level_pool(self, chat_id: int) -> SQLiteConnectionManager:
+        return self.shards.get(chat_id, self.pool)
+
+    def _level_pools(self) -> List[SQLiteConnectionManager]:
+        return [self.pool, *self.shards.values()]
+
+    # === LEVELS ===
+    def load_level_scores(self):
+        with self._errors():
+            scores = []
+            for pool in self._level_pools():
+                with pool.reader() as conn:
+                    scores.extend(tuple(row) for row in conn.execute('SELECT chat_id, user_id, xp FROM user_levels'))
+            return scores
+
+    def get_level(self, chat_id, user_id):
+        with self._errors():
+            with self._level_pool(chat_id).reader() as conn:
+                row = conn.execute('SELECT * FROM user_levels WHERE chat_id=? AND user_id=?',
+                                   (chat_id, user_id)).fetchone()
+            return dict(row) if row else None
+
+    def save_levels(self, rows):
+        """One transaction per database file; a failing file leaves its rows unsaved."""
+        by_pool: Dict[int, List] = {}
+        for row in rows:
+            by_pool.setdefault(row[0] if row[0] in self.shards else None, []).append(row)
+
+        saved = []
+        for shard_chat, pool_rows in by_pool.items():
+            pool = self.shards[shard_chat] if shard_chat is not None else self.pool
+            try:
+                with pool.writer() as conn:
+                    conn.executemany('''
+                        INSERT INTO user_levels
+                        (chat_id, user_id, username, first_name, xp, level, messages_count, last_message_time)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                        xp=excluded.xp, level=excluded.level, username=excluded.username,
+                        first_name=excluded.first_name,
+                        messages_count=messages_count+excluded.messages_count,
+                        last_message_time=excluded.last_message_time
+                    ''', pool_rows)
+                saved.extend((row[0], row[1]) for row in pool_rows)
+            except sqlite3.Error as e:
+                if len(by_pool) == 1:
+                    raise StorageError(str(e)) from e
+                logger.error(f"Error saving {len(pool_rows)} level rows: {e}")
+        return saved
+
+    def move_level(self, user_id, from_chat_id, to_chat_id):
+        source, target = self._level_pool(from_chat_id), self._level_pool(to_chat_id)
+        with self._errors():
+            with source.writer() as conn:
+                if source is target:
+                    return conn.execute('''
+                        UPDATE OR IGNORE user_levels SET chat_id=? WHERE chat_id=? AND user_id=?
+                    ''', (to_chat_id, from_chat_id, user_id)).rowcount == 1
+                # A no-op write takes the source file's write lock first, so a
+                # concurrent move of the same row waits and then finds it gone
+                if conn.execute('''
+                    UPDATE user_levels SET chat_id=chat_id WHERE chat_id=? AND user_id=?
+                ''', (from_chat_id, user_id)).rowcount != 1:
+                    return False
+                row = conn.execute('SELECT * FROM user_levels WHERE chat_id=? AND user_id=?',
+                                   (from_chat_id, user_id)).fetchone()
+                # A crash between the two commits leaves both rows, like _move_chat_to_shard
+                with target.writer() as target_conn:
+                    moved = target_conn.execute('''
+                        INSERT OR IGNORE INTO user_levels
+                        (chat_id, user_id, username, first_name, xp, level,
+                        messages_count, last_message_time, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (to_chat_id, user_id, row['username'], row['first_name'], row['xp'], row['level'],
+                          row['messages_count'], row['last_message_time'], row['created_at'])).rowcount == 1
+                if moved:
+                    conn.execute('DELETE FROM user_levels WHERE chat_id=? AND user_id=?', (from_chat_id, user_id))
+                return moved
+
+    def top_levels(self, chat_id, limit):
+        with self._errors():
+            with self._level_pool(chat_id).reader() as conn:
+                rows = conn.execute('''
+                    SELECT user_id, username, first_name, level, xp, messages_count
+                    FROM user_levels
+                    WHERE chat_id=?
+                    ORDER BY level DESC, xp DESC
+                    LIMIT ?
+                ''', (chat_id, limit)).fetchall()
+            return [dict(row) for row in rows]
+
+    def recompute_levels(self, levels_for_xp):
+        total = changed_total = 0
+        with self._errors():
+            for pool in self._level_pools():
+                with pool.writer() as conn:
+                    rows = conn.execute('SELECT chat_id, user_id, level, xp FROM user_levels').fetchall()
+                    levels = levels_for_xp(row['xp'] for row in rows)
+                    changed = [
+                        (level, row['chat_id'], row['user_id'])
+                        for row, level in zip(rows, levels) if level != row['level']
+                    ]
+                    conn.executemany('UPDATE user_levels SET level=? WHERE chat_id=? AND user_id=?', changed)
+                total += len(rows)
+                changed_total += len(changed)
+        return total, changed_total
+
+    def get_setting(self, key):
+        with self._errors():
+            with self.pool.reader() as conn:
+                row = conn.execute('SELECT value FROM bot_settings WHERE key=?', (key,)).fetchone()
+            return row['value'] if row else None
+
+    def set_setting(self, key, value):
+        with self._errors():
+            with self.pool.writer() as conn:
+                conn.execute('''
+                    INSERT INTO bot_settings (key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value=excluded.value
+                ''', (key, value))
+
+    # === WARNINGS ===
+    @staticmethod
+    def _partition_names(conn) -> List[str]:
+        """Warning partitions, newest first."""
+        return [row['name'] for row in conn.execute('SELECT name FROM warning_partitions ORDER BY name DESC')]
+
+    def add_warning(self, user_id, chat_id, warned_by, reason):
+        created_at = utc_timestamp()
+        partition = warning_partition(created_at)
+        with self._errors():
+            with self.pool.writer() as conn:
+                if partition not in self._known_partitions:
+                    for statement in warning_partition_ddl(partition):
+                        conn.execute(statement)
+                    conn.execute('INSERT OR IGNORE INTO warning_partitions (name) VALUES (?)', (partition,))
+                conn.execute('UPDATE warning_ids SET last_id=last_id+1')
+                warning_id = conn.execute('SELECT last_id FROM warning_ids').fetchone()[0]
+                conn.execute(f'''
+                    INSERT INTO {partition} (id, user_id, chat_id, warned_by, reason, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (warning_id, user_id, chat_id, warned_by, reason, created_at))
+                row = conn.execute('SELECT active FROM warning_counts WHERE chat_id=? AND user_id=?',
+                                   (chat_id, user_id)).fetchone()
+                conn.execute('''
+                    INSERT INTO warning_counts (chat_id, user_id, active, lifetime) VALUES (?, ?, 1, 1)
+                    ON CONFLICT(chat_id, user_id) DO UPDATE SET active=active+1, lifetime=lifetime+1
+                ''', (chat_id, user_id))
+                conn.execute('''
+                    INSERT INTO chat_warning_counts (chat_id, users, warnings, lifetime) VALUES (?, ?, 1, 1)
+                    ON CONFLICT(chat_id) DO UPDATE SET
+                    users=users+excluded.users, warnings=warnings+1, lifetime=lifetime+1
+                ''', (chat_id, 0 if row and row['active'] else 1))
+                self._write_moderation(conn, [ModerationEvent("warn", chat_id, user_id, warned_by, reason)])
+            self._known_partitions.add(partition)
+
+    def count_warnings(self, user_id, chat_id=None):
+        with self._errors():
+            with self.pool.reader() as conn:
+                if chat_id is None:
+                    row = conn.execute('SELECT SUM(active) as count FROM warning_counts WHERE user_id=?',
+                                       (user_id,)).fetchone()
+                else:
+                    row = conn.execute('SELECT active as count FROM warning_counts WHERE chat_id=? AND user_id=?',
+                                       (chat_id, user_id)).fetchone()
+            return (row['count'] or 0) if row else 0
+
+    def list_warnings(self, user_id, chat_id):
+        with self._errors():
+            with self.pool.reader() as conn:
+                row = conn.execute('SELECT active FROM warning_counts WHERE chat_id=? AND user_id=?',
+                                   (chat_id, user_id)).fetchone()
+                if not row or not row['active']:
+                    return []
+                partitions = self._partition_names(conn)
+                if not partitions:
+                    return []
+                union = ' UNION ALL '.join(
+                    f'SELECT * FROM {name} WHERE chat_id=? AND user_id=?' for name in partitions
+                )
+                rows = conn.execute(f'{union} ORDER BY created_at DESC, id DESC',
+                                    (chat_id, user_id) * len(partitions)).fetchall()
+            return [dict(row) for row in rows]
+
+    def clear_warnings(self, user_id, chat_id):
+        with self._errors():
+            with self.pool.writer() as conn:
+                for name in self._partition_names(conn):
+                    conn.execute(f'DELETE FROM {name} WHERE chat_id=? AND user_id=?', (chat_id, user_id))
+                row = conn.execute('SELECT active FROM warning_counts WHERE chat_id=? AND user_id=?',
+                                   (chat_id, user_id)).fetchone()
+                if row and row['active']:
+                    conn.execute('UPDATE warning_counts SET active=0 WHERE chat_id=? AND user_id=?',
+                                 (chat_id, user_id))
+                    conn.execute('UPDATE chat_warning_counts SET users=users-1, warnings=warnings-? WHERE chat_id=?',
+                                 (row['active'], chat_id))
+
+    def chat_warning_stats(self, chat_id):
+        with self._errors():
+            with self.pool.reader() as conn:
+                row = conn.execute('SELECT users, warnings, lifetime FROM chat_warning_counts WHERE chat_id=?',
+                                   (chat_id,)).fetchone()
+            users, warnings, lifetime = tuple(row) if row else (0, 0, 0)
+            return {"total_users": users, "total_warnings": warnings, "lifetime_warnings": lifetime}
+
+    @staticmethod
+    def _drop_partition(conn, name: str):
+        """Take a partition's rows out of the stored counters, then drop the table."""
+        rows = conn.execute(f'SELECT chat_id, user_id, COUNT(*) as n FROM {name} GROUP BY chat_id, user_id').fetchall()
+        conn.executemany('UPDATE warning_counts SET active=MAX(active-?, 0) WHERE chat_id=? AND user_id=?',
+                         [(row['n'], row['chat_id'], row['user_id']) for row in rows])
+        conn.executemany('''
+            UPDATE chat_warning_counts SET
+            users=(SELECT COUNT(*) FROM warning_counts w WHERE w.chat_id=chat_warning_counts.chat_id AND w.active>0),
+            warnings=(SELECT COALESCE(SUM(active), 0) FROM warning_counts w WHERE w.chat_id=chat_warning_counts.chat_id)
+            WHERE chat_id=?
+        ''', [(chat_id,) for chat_id in {row['chat_id'] for row in rows}])
+        conn.execute(f'DROP TABLE IF EXISTS {name}')
+        conn.execute('DELETE FROM warning_partitions WHERE name=?', (name,))
+
+    # === MUTES ===
+    def add_mute(self, user_id, chat_id, muted_by, duration_hours, unmute_time):
+        with self._errors():
+            with self.pool.writer() as conn:
+                conn.execute('''
+                    INSERT INTO mutes (user_id, chat_id, muted_by, duration_hours, unmute_time)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, chat_id, muted_by, duration_hours, unmute_time))
+                self._write_moderation(conn, [
+                    ModerationEvent("mute", chat_id, user_id, muted_by, None, duration_hours)
+                ])
+
+    def remove_mute(self, user_id, chat_id):
+        with self._errors():
+            with self.pool.writer() as conn:
+                conn.execute('DELETE FROM mutes WHERE user_id=? AND chat_id=?', (user_id, chat_id))
+
+    def pending_mutes(self, now):
+        with self._errors():
+            with self.pool.reader() as conn:
+                rows = conn.execute(
+                    'SELECT chat_id, user_id, unmute_time FROM mutes WHERE unmute_time > ?', (now,)
+                ).fetchall()
+        try:
+            return [(row['chat_id'], row['user_id'], datetime.fromisoformat(row['unmute_time'])) for row in rows]
+        except ValueError as e:
+            raise StorageError(f"Bad unmute_time: {e}") from e
+
+    def expire_mutes(self, due):
+        with self._errors():
+            with self.pool.writer() as conn:
+                conn.executemany(
+                    'DELETE FROM mutes WHERE user_id=? AND chat_id=? AND unmute_time<=?',
+                    [(user_id, chat_id, unmute_time) for chat_id, user_id, unmute_time in due]
+                )
+
+    # === MODERATION ===
+    @staticmethod
+    def _write_moderation(conn, events):
+        """Log events and UPSERT each user's counters once, on the caller's transaction."""
+        now = utc_timestamp()
+        conn.executemany('''
+            INSERT INTO moderation_events (chat_id, user_id, action, actor_id, reason, duration_hours, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(e.chat_id, e.user_id, e.action, e.actor_id, e.reason, e.duration_hours, now) for e in events])
+        conn.executemany('''
+            INSERT INTO user_stats
+            (chat_id, user_id, warnings_count, mutes_count, kicks_count, bans_count, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, user_id) DO UPDATE SET
+            warnings_count=warnings_count+excluded.warnings_count,
+            mutes_count=mutes_count+excluded.mutes_count,
+            kicks_count=kicks_count+excluded.kicks_count,
+            bans_count=bans_count+excluded.bans_count,
+            last_updated=excluded.last_updated
+        ''', user_stats_deltas(events, now))
+
+    def record_moderation(self, events):
+        with self._errors():
+            with self.pool.writer() as conn:
+                self._write_moderation(conn, events)
+
+    def list_moderation(self, chat_id, user_id=None, limit=20):
+        with self._errors():
+            with self.pool.reader() as conn:
+                if user_id is None:
+                    rows = conn.execute('SELECT * FROM moderation_events WHERE chat_id=? ORDER BY id DESC LIMIT ?',
+                                        (chat_id, limit)).fetchall()
+                else:
+                    rows = conn.execute('''
+                        SELECT * FROM moderation_events WHERE chat_id=? AND user_id=? ORDER BY id DESC LIMIT ?
+                    ''', (chat_id, user_id, limit)).fetchall()
+            return [dict(row) for row in rows]
+
+    def get_user_stats(self, chat_id, user_id):
+        with self._errors():
+            with self.pool.reader() as conn:
+                row = conn.execute('SELECT * FROM user_stats WHERE chat_id=? AND user_id=?',
+                                   (chat_id, user_id)).fetchone()
+            return dict(row) if row else None
+
+    # === IDENTITIES AND MEDIA ===
+    def load_identities(self):
+        with self._errors():
+            with self.pool.reader() as conn:
+                return [tuple(row) for row in conn.execute('SELECT user_id, username, first_name FROM user_identities')]
+
+    def save_identity(self, user_id, username, first_name):
+        username_lc = username.lower() if username else None
+        with self._errors():
+            with self.pool.writer() as conn:
+                if username_lc:
+                    # Usernames are unique on Telegram; whoever had it before gave it up
+                    conn.execute('''
+                        UPDATE user_identities SET username=NULL, username_lc=NULL
+                        WHERE username_lc=? AND user_id!=?
+                    ''', (username_lc, user_id))
+                conn.execute('''
+                    INSERT INTO user_identities (user_id, username, username_lc, first_name, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                    username=excluded.username, username_lc=excluded.username_lc,
+                    first_name=excluded.first_name, updated_at=excluded.updated_at
+                ''', (user_id, username, username_lc, first_name, datetime.now()))
+
+    def find_identity(self, username_lc):
+        with self._errors():
+            with self.pool.reader() as conn:
+                row = conn.execute(
+                    'SELECT user_id, username, first_name FROM user_identities WHERE username_lc=?',
+                    (username_lc,)
+                ).fetchone()
+            return tuple(row) if row else None
+
+    def load_media_cache(self):
+        with self._errors():
+            with self.pool.reader() as conn:
+                return {row['url']: row['file_id'] for row in conn.execute('SELECT url, file_id FROM media_cache')}
+
+    def save_media_file_id(self, url, file_id):
+        with self._errors():
+            with self.pool.writer() as conn:
+                conn.execute('''
+                    INSERT INTO media_cache (url, file_id, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(url) DO UPDATE SET file_id=excluded.file_id, updated_at=excluded.updated_at
+                ''', (url, file_id, datetime.now()))
+
+    def forget_media_file_id(self, url):
+        with self._errors():
+            with self.pool.writer() as conn:
+                conn.execute('DELETE FROM media_cache WHERE url=?', (url,))
+
+    # === MAINTENANCE ===
+    def cleanup(self, warnings_before, mutes_before):
+        """One short transaction per dropped month instead of one large DELETE."""
+        with self._errors():
+            with self.pool.reader() as conn:
+                expired = [name for name in self._partition_names(conn) if partition_end(name) <= warnings_before]
+            for name in expired:
+                with self.pool.writer() as conn:
+                    self._drop_partition(conn, name)
+                self._known_partitions.discard(name)
+                logger.info(f"Dropped warning partition {name}")
+            with self.pool.writer() as conn:
+                conn.execute('DELETE FROM mutes WHERE unmute_time < ?', (mutes_before,))
+            return len(expired)
+
+    def get_metrics(self):
+        """Connection reuse and lock wait statistics."""
+        metrics = self.pool.get_metrics()
+        if self.shards:
+            metrics["shards"] = {chat_id: pool.get_metrics() for chat_id, pool in self.shards.items()}
+        return metrics
+
+    def close(self):
+        for pool in self._level_pools():
+            pool.close()
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import time
+from typing import Dict, Iterable, Optional
+
+
+class JSONSnapshot:
+    """Pre-serialized JSON document with a content-hash ETag.
+
+    A background task rebuilds the payload on an interval and calls
+    ``update``; requests only read ``body`` and ``etag``, so serving it costs
+    no queries and no serialization. The ETag only changes when the content
+    does: fields passed as ``volatile`` (uptime, operational counters) are
+    refreshed in the body but left out of the hash, so the tag is weak.
+    """
+
+    __slots__ = ("body", "etag", "updated_at", "refreshes", "changes")
+
+    def __init__(self):
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.updated_at: Optional[float] = None
+        self.refreshes = 0
+        self.changes = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.body is not None
+
+    def update(self, payload: Dict, volatile: Iterable[str] = ()) -> bool:
+        """Replace the document; returns True if its non-volatile content changed."""
+        volatile = set(volatile)
+        stable = {key: value for key, value in payload.items() if key not in volatile}
+        digest = hashlib.blake2b(
+            json.dumps(stable, separators=(",", ":"), default=str, sort_keys=True).encode(),
+            digest_size=16
+        ).hexdigest()
+        self.body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        self.refreshes += 1
+        self.updated_at = time.time()
+        etag = ('W/"' if volatile else '"') + digest + '"'
+        if etag == self.etag:
+            return False
+        self.etag = etag
+        self.changes += 1
+        return True
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header names the current version."""
+        if not if_none_match or self.etag is None:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            # If-None-Match uses the weak comparison
+            if tag == "*" or tag.removeprefix("W/") == self.etag.removeprefix("W/"):
+                return True
+        return False
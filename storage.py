@@ -0,0 +1,501 @@
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# (chat_id, user_id, username, first_name, xp, level, messages_count_delta, last_message_time)
+LevelRow = Tuple[int, int, Optional[str], Optional[str], int, int, int, Optional[datetime]]
+
+LEVEL_COLUMNS = ("chat_id", "user_id", "username", "first_name", "xp", "level",
+                 "messages_count", "last_message_time", "created_at")
+WARNING_COLUMNS = ("id", "user_id", "chat_id", "warned_by", "reason", "created_at")
+USER_STATS_COLUMNS = ("chat_id", "user_id", "warnings_count", "mutes_count", "kicks_count", "bans_count", "last_updated")
+MODERATION_EVENT_COLUMNS = ("id", "chat_id", "user_id", "action", "actor_id", "reason", "duration_hours",
+                            "created_at")
+
+# Moderation action -> the user_stats counter it increments
+MODERATION_COUNTERS = {"warn": "warnings_count", "mute": "mutes_count", "kick": "kicks_count", "ban": "bans_count"}
+
+
+class ModerationEvent(NamedTuple):
+    action: str  # a key of MODERATION_COUNTERS
+    chat_id: int
+    user_id: int
+    actor_id: Optional[int]
+    reason: Optional[str] = None
+    duration_hours: Optional[int] = None
+
+
+def user_stats_deltas(events: Sequence[ModerationEvent], updated_at) -> List[tuple]:
+    """One (chat_id, user_id, warnings, mutes, kicks, bans, updated_at) UPSERT row per chat member in events."""
+    deltas: Dict[Tuple[int, int], List[int]] = {}
+    columns = list(MODERATION_COUNTERS)
+    for event in events:
+        deltas.setdefault((event.chat_id, event.user_id), [0] * len(columns))[columns.index(event.action)] += 1
+    return [(chat_id, user_id, *counts, updated_at) for (chat_id, user_id), counts in deltas.items()]
+
+
+class StorageError(Exception):
+    """A storage driver failed; wraps the driver's own exception."""
+
+
+def utc_timestamp() -> str:
+    """Now in the 'YYYY-MM-DD HH:MM:SS' UTC form SQLite's CURRENT_TIMESTAMP uses."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def warning_partition(created_at: str) -> str:
+    """Name of the monthly table holding a warning created at a utc_timestamp()."""
+    return f"warnings_{created_at[:4]}{created_at[5:7]}"
+
+
+def partition_end(name: str) -> datetime:
+    """First moment (UTC) after a warning partition's month."""
+    year, month = int(name[-6:-2]), int(name[-2:])
+    return datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+class StorageBackend:
+    """Persistence for levels, warnings, mutes, stats, identities and cached media.
+
+    AnimeBotDatabase keeps the in-memory indexes and caches and calls these
+    methods from its executor threads, so drivers are synchronous and must
+    be thread-safe. Every method raises StorageError on failure. Timestamps
+    are returned as 'YYYY-MM-DD HH:MM:SS' strings, except mute times, which
+    are datetimes. benchmarks/storage_conformance.py checks a driver against
+    this contract.
+    """
+
+    name = "abstract"
+
+    # === LEVELS ===
+    def load_level_scores(self) -> Iterable[Tuple[int, int, int]]:
+        """(chat_id, user_id, xp) for every stored level row."""
+        raise NotImplementedError
+
+    def get_level(self, chat_id: int, user_id: int) -> Optional[Dict]:
+        """The full level row (LEVEL_COLUMNS) or None."""
+        raise NotImplementedError
+
+    def save_levels(self, rows: Sequence[LevelRow]) -> List[Tuple[int, int]]:
+        """Upsert level rows, adding messages_count to the stored count.
+
+        Returns the (chat_id, user_id) keys written. A driver that stores
+        chats separately may write some and log the rest, which then stay
+        buffered for the next flush.
+        """
+        raise NotImplementedError
+
+    def move_level(self, user_id: int, from_chat_id: int, to_chat_id: int) -> bool:
+        """Re-key a user's level row to another chat.
+
+        Returns False if there was no row to move or the target chat already
+        has one. Atomic, so when several processes move the same row only one
+        of them gets True.
+        """
+        raise NotImplementedError
+
+    def top_levels(self, chat_id: int, limit: int) -> List[Dict]:
+        """A chat's rows ordered by level then XP, highest first."""
+        raise NotImplementedError
+
+    def recompute_levels(self, levels_for_xp: Callable[[Iterable[int]], List[int]]) -> Tuple[int, int]:
+        """Rewrite every stored level from its XP; returns (rows, rows changed)."""
+        raise NotImplementedError
+
+    def get_setting(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set_setting(self, key: str, value: str):
+        raise NotImplementedError
+
+    # === WARNINGS ===
+    # Warnings live in one partition per month (warning_partition()) and
+    # are counted per (chat, user) and per chat as they are written, so
+    # counts never scan rows and cleanup drops whole months. "Stored"
+    # warnings are those in partitions not yet dropped and not cleared;
+    # "lifetime" counts keep every warning ever issued.
+    def add_warning(self, user_id: int, chat_id: int, warned_by: int, reason: str):
+        """Store a warning and bump its counters in the same transaction.
+
+        Warning ids come from one sequence shared by every partition, so
+        they never repeat across months.
+        """
+        raise NotImplementedError
+
+    def count_warnings(self, user_id: int, chat_id: Optional[int] = None) -> int:
+        """Stored warnings for a user in one chat, or in every chat, from the counters."""
+        raise NotImplementedError
+
+    def list_warnings(self, user_id: int, chat_id: int) -> List[Dict]:
+        """A user's stored warnings in a chat (WARNING_COLUMNS), newest first."""
+        raise NotImplementedError
+
+    def clear_warnings(self, user_id: int, chat_id: int):
+        raise NotImplementedError
+
+    def chat_warning_stats(self, chat_id: int) -> Dict[str, int]:
+        """A chat's counters: total_users and total_warnings stored, lifetime_warnings issued."""
+        raise NotImplementedError
+
+    # === MUTES ===
+    def add_mute(self, user_id: int, chat_id: int, muted_by: int, duration_hours: int, unmute_time: datetime):
+        raise NotImplementedError
+
+    def remove_mute(self, user_id: int, chat_id: int):
+        raise NotImplementedError
+
+    def pending_mutes(self, now: datetime) -> List[Tuple[int, int, datetime]]:
+        """(chat_id, user_id, unmute_time) for every mute record ending after now."""
+        raise NotImplementedError
+
+    def expire_mutes(self, due: Sequence[Tuple[int, int, datetime]]):
+        """Delete each (chat_id, user_id) mute record ending at or before the given time."""
+        raise NotImplementedError
+
+    # === MODERATION ===
+    # add_warning and add_mute also log a "warn"/"mute" event; every event
+    # bumps the user's user_stats counter for that chat in the transaction
+    # that writes it.
+    def record_moderation(self, events: Sequence[ModerationEvent]):
+        """Log actions that have no record of their own (kicks, bans) in one transaction."""
+        raise NotImplementedError
+
+    def list_moderation(self, chat_id: int, user_id: Optional[int] = None, limit: int = 20) -> List[Dict]:
+        """A chat's moderation events (MODERATION_EVENT_COLUMNS), optionally for one user, newest first."""
+        raise NotImplementedError
+
+    def get_user_stats(self, chat_id: int, user_id: int) -> Optional[Dict]:
+        """The user's moderation counters in a chat (USER_STATS_COLUMNS) or None."""
+        raise NotImplementedError
+
+    # === IDENTITIES AND MEDIA ===
+    def load_identities(self) -> List[Tuple[int, Optional[str], Optional[str]]]:
+        raise NotImplementedError
+
+    def save_identity(self, user_id: int, username: Optional[str], first_name: Optional[str]):
+        """Upsert a user; a username moves away from whoever held it before."""
+        raise NotImplementedError
+
+    def find_identity(self, username_lc: str) -> Optional[Tuple[int, Optional[str], Optional[str]]]:
+        raise NotImplementedError
+
+    def load_media_cache(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def save_media_file_id(self, url: str, file_id: str):
+        raise NotImplementedError
+
+    def forget_media_file_id(self, url: str):
+        raise NotImplementedError
+
+    # === MAINTENANCE ===
+    def cleanup(self, warnings_before: datetime, mutes_before: datetime) -> int:
+        """Drop warning partitions whose month ended before warnings_before and
+        delete mutes ending before mutes_before; returns the partitions dropped.
+
+        warnings_before is a timezone-aware UTC datetime, since partitions
+        are UTC months; mutes_before is naive local time like unmute_time.
+        """
+        raise NotImplementedError
+
+    def get_metrics(self) -> Dict:
+        """Driver statistics; always includes 'queries' and 'write_queries'."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStorage(StorageBackend):
+    """Dict-backed driver for tests and benchmarks; nothing survives close()."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._levels: Dict[Tuple[int, int], Dict] = {}
+        # partition name -> its warnings, oldest first
+        self._partitions: Dict[str, List[Dict]] = {}
+        self._warning_ids = 0
+        # (chat_id, user_id) -> [stored, lifetime]; chat_id -> [users, stored, lifetime]
+        self._warning_counts: Dict[Tuple[int, int], List[int]] = {}
+        self._chat_warning_counts: Dict[int, List[int]] = {}
+        self._mutes: List[Dict] = []
+        self._user_stats: Dict[Tuple[int, int], Dict] = {}
+        self._moderation: List[Dict] = []
+        self._identities: Dict[int, Tuple[int, Optional[str], Optional[str]]] = {}
+        self._media: Dict[str, str] = {}
+        self._settings: Dict[str, str] = {}
+        self._queries = 0
+        self._write_queries = 0
+
+    def _count(self, write: bool = False):
+        self._queries += 1
+        if write:
+            self._write_queries += 1
+
+    def _write_moderation(self, events):
+        """Log events and bump their counters; the caller holds the lock."""
+        now = utc_timestamp()
+        for event in events:
+            self._moderation.append({"id": len(self._moderation) + 1, **event._asdict(), "created_at": now})
+        for chat_id, user_id, *counts, updated_at in user_stats_deltas(events, now):
+            row = self._user_stats.setdefault((chat_id, user_id), {
+                "chat_id": chat_id, "user_id": user_id, **dict.fromkeys(MODERATION_COUNTERS.values(), 0)})
+            for column, delta in zip(MODERATION_COUNTERS.values(), counts):
+                row[column] += delta
+            row["last_updated"] = updated_at
+
+    # === LEVELS ===
+    def load_level_scores(self):
+        with self._lock:
+            self._count()
+            return [(row["chat_id"], row["user_id"], row["xp"]) for row in self._levels.values()]
+
+    def get_level(self, chat_id, user_id):
+        with self._lock:
+            self._count()
+            row = self._levels.get((chat_id, user_id))
+            return dict(row) if row else None
+
+    def save_levels(self, rows):
+        with self._lock:
+            self._count(write=True)
+            for chat_id, user_id, username, first_name, xp, level, messages, last_message_time in rows:
+                row = self._levels.get((chat_id, user_id))
+                if row is None:
+                    row = self._levels[(chat_id, user_id)] = {
+                        "chat_id": chat_id, "user_id": user_id, "messages_count": 0,
+                        "created_at": utc_timestamp(),
+                    }
+                row.update(username=username, first_name=first_name, xp=xp, level=level,
+                           messages_count=row["messages_count"] + messages,
+                           last_message_time=None if last_message_time is None else str(last_message_time))
+            return [(row[0], row[1]) for row in rows]
+
+    def move_level(self, user_id, from_chat_id, to_chat_id):
+        with self._lock:
+            self._count(write=True)
+            if (to_chat_id, user_id) in self._levels:
+                return False
+            row = self._levels.pop((from_chat_id, user_id), None)
+            if row is None:
+                return False
+            row["chat_id"] = to_chat_id
+            self._levels[(to_chat_id, user_id)] = row
+            return True
+
+    def top_levels(self, chat_id, limit):
+        with self._lock:
+            self._count()
+            rows = [row for row in self._levels.values() if row["chat_id"] == chat_id]
+        rows.sort(key=lambda row: (row["level"], row["xp"]), reverse=True)
+        return [{key: row[key] for key in ("user_id", "username", "first_name", "level", "xp", "messages_count")}
+                for row in rows[:limit]]
+
+    def recompute_levels(self, levels_for_xp):
+        with self._lock:
+            self._count(write=True)
+            rows = list(self._levels.values())
+            changed = 0
+            for row, level in zip(rows, levels_for_xp(row["xp"] for row in rows)):
+                if level != row["level"]:
+                    row["level"] = level
+                    changed += 1
+            return len(rows), changed
+
+    def get_setting(self, key):
+        with self._lock:
+            self._count()
+            return self._settings.get(key)
+
+    def set_setting(self, key, value):
+        with self._lock:
+            self._count(write=True)
+            self._settings[key] = value
+
+    # === WARNINGS ===
+    def add_warning(self, user_id, chat_id, warned_by, reason):
+        created_at = utc_timestamp()
+        with self._lock:
+            self._count(write=True)
+            self._warning_ids += 1
+            self._partitions.setdefault(warning_partition(created_at), []).append({
+                "id": self._warning_ids, "user_id": user_id, "chat_id": chat_id,
+                "warned_by": warned_by, "reason": reason, "created_at": created_at})
+            counts = self._warning_counts.setdefault((chat_id, user_id), [0, 0])
+            chat_counts = self._chat_warning_counts.setdefault(chat_id, [0, 0, 0])
+            chat_counts[0] += counts[0] == 0
+            counts[0] += 1
+            counts[1] += 1
+            chat_counts[1] += 1
+            chat_counts[2] += 1
+            self._write_moderation([ModerationEvent("warn", chat_id, user_id, warned_by, reason)])
+
+    def count_warnings(self, user_id, chat_id=None):
+        with self._lock:
+            self._count()
+            if chat_id is not None:
+                return self._warning_counts.get((chat_id, user_id), [0])[0]
+            return sum(counts[0] for (_, user), counts in self._warning_counts.items() if user == user_id)
+
+    def list_warnings(self, user_id, chat_id):
+        with self._lock:
+            self._count()
+            rows = [dict(w) for name in sorted(self._partitions, reverse=True)
+                    for w in reversed(self._partitions[name])
+                    if w["user_id"] == user_id and w["chat_id"] == chat_id]
+        return rows
+
+    def clear_warnings(self, user_id, chat_id):
+        with self._lock:
+            self._count(write=True)
+            for name, rows in self._partitions.items():
+                self._partitions[name] = [w for w in rows if not (w["user_id"] == user_id and w["chat_id"] == chat_id)]
+            counts = self._warning_counts.get((chat_id, user_id))
+            if counts and counts[0]:
+                chat_counts = self._chat_warning_counts[chat_id]
+                chat_counts[0] -= 1
+                chat_counts[1] -= counts[0]
+                counts[0] = 0
+
+    def chat_warning_stats(self, chat_id):
+        with self._lock:
+            self._count()
+            users, warnings, lifetime = self._chat_warning_counts.get(chat_id, (0, 0, 0))
+            return {"total_users": users, "total_warnings": warnings, "lifetime_warnings": lifetime}
+
+    # === MUTES ===
+    def add_mute(self, user_id, chat_id, muted_by, duration_hours, unmute_time):
+        with self._lock:
+            self._count(write=True)
+            self._mutes.append({"user_id": user_id, "chat_id": chat_id, "muted_by": muted_by,
+                                "duration_hours": duration_hours, "unmute_time": unmute_time})
+            self._write_moderation([ModerationEvent("mute", chat_id, user_id, muted_by, None, duration_hours)])
+
+    def remove_mute(self, user_id, chat_id):
+        with self._lock:
+            self._count(write=True)
+            self._mutes = [m for m in self._mutes if not (m["user_id"] == user_id and m["chat_id"] == chat_id)]
+
+    def pending_mutes(self, now):
+        with self._lock:
+            self._count()
+            return [(m["chat_id"], m["user_id"], m["unmute_time"]) for m in self._mutes if m["unmute_time"] > now]
+
+    def expire_mutes(self, due):
+        deadlines = {(chat_id, user_id): unmute_time for chat_id, user_id, unmute_time in due}
+        with self._lock:
+            self._count(write=True)
+            self._mutes = [
+                m for m in self._mutes
+                if not ((m["chat_id"], m["user_id"]) in deadlines
+                        and m["unmute_time"] <= deadlines[(m["chat_id"], m["user_id"])])
+            ]
+
+    # === MODERATION ===
+    def record_moderation(self, events):
+        with self._lock:
+            self._count(write=True)
+            self._write_moderation(events)
+
+    def list_moderation(self, chat_id, user_id=None, limit=20):
+        with self._lock:
+            self._count()
+            rows = [dict(e) for e in reversed(self._moderation)
+                    if e["chat_id"] == chat_id and (user_id is None or e["user_id"] == user_id)]
+        return rows[:limit]
+
+    def get_user_stats(self, chat_id, user_id):
+        with self._lock:
+            self._count()
+            row = self._user_stats.get((chat_id, user_id))
+            return dict(row) if row else None
+
+    # === IDENTITIES AND MEDIA ===
+    def load_identities(self):
+        with self._lock:
+            self._count()
+            return list(self._identities.values())
+
+    def save_identity(self, user_id, username, first_name):
+        username_lc = username.lower() if username else None
+        with self._lock:
+            self._count(write=True)
+            if username_lc:
+                for other_id, (_, other_username, other_first_name) in list(self._identities.items()):
+                    if other_id != user_id and other_username and other_username.lower() == username_lc:
+                        self._identities[other_id] = (other_id, None, other_first_name)
+            self._identities[user_id] = (user_id, username, first_name)
+
+    def find_identity(self, username_lc):
+        with self._lock:
+            self._count()
+            for identity in self._identities.values():
+                if identity[1] and identity[1].lower() == username_lc:
+                    return identity
+            return None
+
+    def load_media_cache(self):
+        with self._lock:
+            self._count()
+            return dict(self._media)
+
+    def save_media_file_id(self, url, file_id):
+        with self._lock:
+            self._count(write=True)
+            self._media[url] = file_id
+
+    def forget_media_file_id(self, url):
+        with self._lock:
+            self._count(write=True)
+            self._media.pop(url, None)
+
+    # === MAINTENANCE ===
+    def cleanup(self, warnings_before, mutes_before):
+        with self._lock:
+            self._count(write=True)
+            expired = [name for name in self._partitions if partition_end(name) <= warnings_before]
+            for name in expired:
+                for w in self._partitions.pop(name):
+                    counts = self._warning_counts[(w["chat_id"], w["user_id"])]
+                    chat_counts = self._chat_warning_counts[w["chat_id"]]
+                    counts[0] -= 1
+                    chat_counts[1] -= 1
+                    chat_counts[0] -= counts[0] == 0
+            self._mutes = [m for m in self._mutes if m["unmute_time"] >= mutes_before]
+            return len(expired)
+
+    def get_metrics(self):
+        with self._lock:
+            return {"queries": self._queries, "write_queries": self._write_queries,
+                    "levels": len(self._levels), "warning_partitions": len(self._partitions),
+                    "moderation_events": len(self._moderation),
+                    "warnings": sum(len(rows) for rows in self._partitions.values()), "mutes": len(self._mutes)}
+
+
+def open_storage(config, db_name: Optional[str] = None) -> StorageBackend:
+    """Open the driver named by config.STORAGE_CONFIG['BACKEND']."""
+    storage_config = config.STORAGE_CONFIG
+    backend = storage_config["BACKEND"]
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        database_config = config.DATABASE_CONFIG
+        return SQLiteStorage(
+            db_name or config.DATABASE_NAME,
+            cache_size_kb=database_config["CACHE_SIZE_KB"],
+            busy_timeout_ms=database_config["BUSY_TIMEOUT_MS"],
+            mmap_size=database_config["MMAP_SIZE"],
+            shard_chats=database_config["SHARD_CHATS"],
+            shard_dir=database_config["SHARD_DIR"]
+        )
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "postgres":
+        from postgres_storage import PostgresStorage
+        return PostgresStorage(
+            storage_config["POSTGRES_DSN"],
+            min_size=storage_config["POSTGRES_MIN_POOL"],
+            max_size=storage_config["POSTGRES_MAX_POOL"]
+        )
+    raise ValueError(f"Unknown storage backend {backend!r}")
@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class ExpiringTimestamps:
+    """Bounded key -> last-seen timestamp map that forgets idle keys.
+
+    Keys are kept in last-touched order, so every entry older than ``ttl``
+    sits at the front and is evicted in amortized O(1) on each write. If more
+    than ``max_size`` keys are live at once, the least recently touched go
+    first. Timestamps come from ``time.monotonic()``.
+    """
+
+    __slots__ = ("ttl", "max_size", "_entries", "expired", "evicted")
+
+    def __init__(self, ttl: float, max_size: int = 100_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Optional[float]:
+        """Timestamp of the last touch, or None if unknown or older than ttl."""
+        stamp = self._entries.get(key)
+        if stamp is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        if now - stamp >= self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            return None
+        return stamp
+
+    def touch(self, key: Hashable, now: Optional[float] = None):
+        if now is None:
+            now = time.monotonic()
+        entries = self._entries
+        entries[key] = now
+        entries.move_to_end(key)
+        self._evict(now)
+
+    def _evict(self, now: float):
+        entries = self._entries
+        cutoff = now - self.ttl
+        while entries:
+            key, stamp = next(iter(entries.items()))
+            if stamp > cutoff:
+                break
+            del entries[key]
+            self.expired += 1
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+            self.evicted += 1
+
+    def get_metrics(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Dict
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Handles up to ``max_concurrent_updates`` updates at once, but one at a time per chat.
+
+    Concurrency lets updates keep flowing while Bot API sends wait in the
+    outbound queue, but handlers read then write shared per-chat state (two
+    /warn for one user must not both see the old count), so updates of the
+    same chat run in arrival order. asyncio.Lock wakes waiters FIFO. Updates
+    without a chat run unordered. An update waiting for its chat holds one
+    of the concurrency slots.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # chat_id -> updates holding or waiting for its lock
+        self._users: Dict[int, int] = {}
+        self.waits = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            await coroutine
+            return
+
+        chat_id = chat.id
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        self._users[chat_id] = self._users.get(chat_id, 0) + 1
+        if lock.locked():
+            self.waits += 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            self._users[chat_id] -= 1
+            if not self._users[chat_id]:
+                del self._users[chat_id]
+                del self._locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def get_metrics(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent_updates,
+            "chats_in_flight": len(self._locks),
+            "waits": self.waits,
+        }
@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import registry
+from stats_snapshot import JSONSnapshot
+
+logger = logging.getLogger(__name__)
+
+ROUTED_UPDATES = registry.counter(
+    "bot_router_updates_total", "Updates handed to a worker process", "worker")
+REJECTED_UPDATES = registry.counter(
+    "bot_router_rejected_total", "Updates refused because a worker's queue was full", "worker")
+
+# Largest number of updates moved from a worker's inbox to its event loop at once
+DELIVERY_BATCH = 256
+
+
+def update_chat_id(update: Dict) -> Optional[int]:
+    """The chat an update belongs to, read from its raw JSON.
+
+    Updates without a chat (inline queries, polls) fall back to the sender,
+    whose id is also their private chat's id.
+    """
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        sender = value.get("from") or value.get("user")
+        if sender:
+            return sender.get("id")
+    return None
+
+
+def shard_for(chat_id: Optional[int], workers: int) -> int:
+    """Worker index that owns a chat; stable across restarts."""
+    return chat_id % workers if chat_id is not None else 0
+
+
+def apply_overrides(target, overrides: Dict[str, Any]):
+    """Set config attributes in a worker, merging into dict settings."""
+    for name, value in overrides.items():
+        current = getattr(target, name, None)
+        if isinstance(current, dict) and isinstance(value, dict):
+            current.update(value)
+        else:
+            setattr(target, name, value)
+
+
+def pump_inbox(inbox, loop: asyncio.AbstractEventLoop, deliver: Callable[[List[Dict]], None],
+               on_stop: Callable[[], None]):
+    """Blocking loop for a worker thread: hand queued updates to the event loop in batches.
+
+    A ``None`` in the inbox is the front process asking the worker to stop.
+    """
+    while True:
+        batch = [inbox.get()]
+        while batch[-1] is not None and len(batch) < DELIVERY_BATCH:
+            try:
+                batch.append(inbox.get_nowait())
+            except queue.Empty:
+                break
+        stop = batch[-1] is None
+        if stop:
+            batch.pop()
+        if batch:
+            loop.call_soon_threadsafe(deliver, batch)
+        if stop:
+            loop.call_soon_threadsafe(on_stop)
+            return
+
+
+def _worker_main(index: int, count: int, inbox, reports, base_url: Optional[str],
+                 overrides: Dict[str, Any]):
+    # Ctrl+C reaches the whole process group; the front process decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from config import config
+    apply_overrides(config, overrides)
+
+    import bot
+    try:
+        asyncio.run(bot.run_worker(index, count, inbox, reports, base_url))
+    except Exception as e:
+        logger.error(f"Worker {index} crashed: {e}")
+        raise
+
+
+class ChatRouter:
+    """Front-process side of scale-out mode: one worker process per shard of chats.
+
+    Every update for a chat goes to the same worker (``chat_id % workers``),
+    so per-chat state such as rank indexes, cooldowns, anti-spam buckets,
+    admin caches and pending mutes stays in one process and needs no
+    coordination. Workers share the SQLite files and report their stats
+    back here, where they are merged into the /stats snapshot.
+    """
+
+    def __init__(self, workers: int, queue_size: int = 10000, base_url: Optional[str] = None,
+                 overrides: Optional[Dict[str, Any]] = None):
+        # spawn, not fork: the front process already runs threads and an event loop
+        self._context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.base_url = base_url
+        self.overrides = overrides or {}
+        self.inboxes = [self._context.Queue(queue_size) for _ in range(workers)]
+        self.reports = self._context.Queue()
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        # worker index -> its latest report
+        self.latest: Dict[int, Dict] = {}
+        self.stats_snapshot = JSONSnapshot()
+        self.restarts = 0
+        self.started_at = time.time()
+        self._stopping = False
+        registry.gauge("bot_router_queue_depth", "Updates waiting for any worker",
+                       lambda: sum(inbox.qsize() for inbox in self.inboxes))
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.workers, self.inboxes[index], self.reports, self.base_url, self.overrides),
+            name=f"bot-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def dispatch(self, update: Dict) -> bool:
+        """Queue a raw update for the worker owning its chat; False if that worker is backed up."""
+        index = shard_for(update_chat_id(update), self.workers)
+        try:
+            self.inboxes[index].put_nowait(update)
+        except queue.Full:
+            REJECTED_UPDATES.inc(index)
+            return False
+        ROUTED_UPDATES.inc(index)
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Ask every worker to finish and wait for it; blocking."""
+        self._stopping = True
+        for inbox in self.inboxes:
+            try:
+                inbox.put(None, timeout=1)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in time, terminating it")
+                process.terminate()
+                process.join(1)
+
+    def check_workers(self):
+        """Restart any worker that died; its queued updates are still in its inbox."""
+        if self._stopping:
+            return
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting it")
+                self.restarts += 1
+                self.latest.pop(index, None)
+                self._spawn(index)
+
+    def _next_report(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.reports.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def run_report_collector(self, interval: float):
+        """Collect worker reports, keep the merged /stats snapshot fresh and restart dead workers."""
+        last_merge = 0.0
+        while True:
+            try:
+                report = await asyncio.to_thread(self._next_report, interval)
+                if report is not None:
+                    self.latest[report["worker"]] = report
+                self.check_workers()
+                if time.monotonic() - last_merge >= interval and self.latest:
+                    self.stats_snapshot.update(self.merge_stats(), ("router", "workers"))
+                    last_merge = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error collecting worker reports: {e}")
+                await asyncio.sleep(interval)
+
+    def processed(self) -> int:
+        """Updates the workers have handled, as of their latest reports."""
+        return sum(report["processed"] for report in self.latest.values())
+
+    def merge_stats(self) -> Dict:
+        """One /stats document from every worker's partial view."""
+        reports = [self.latest[index] for index in sorted(self.latest)]
+        stats = [report["stats"] for report in reports]
+        # Users active in chats of several workers, or with an unclaimed
+        # pre-per-chat level, are in more than one worker's top list
+        top_users: Dict[int, Dict] = {}
+        for user in (user for s in stats for user in s["top_users"]):
+            current = top_users.get(user["user_id"])
+            if current is None or (user["level"], user["xp"]) > (current["level"], current["xp"]):
+                top_users[user["user_id"]] = user
+        # The counters are one chat's, not totals; report them from the worker owning that chat
+        chat_id = stats[0]["counters_chat_id"]
+        owner = self.latest.get(shard_for(chat_id, self.workers), reports[0])["stats"]
+        return {
+            "status": "ok",
+            "total_users": sum(s["total_users"] for s in stats),
+            "top_users": heapq.nlargest(5, top_users.values(), key=lambda user: (user["level"], user["xp"])),
+            "counters_chat_id": chat_id,
+            "warnings_issued": owner["warnings_issued"],
+            "active_warnings": owner["active_warnings"],
+            "active_mutes": owner["active_mutes"],
+            "router": self.get_metrics(),
+            "workers": {
+                report["worker"]: {key: value for key, value in report["stats"].items()
+                                   if key not in ("status", "total_users", "top_users")}
+                for report in reports
+            }
+        }
+
+    def get_metrics(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for process in self.processes if process is not None and process.is_alive()),
+            "restarts": self.restarts,
+            "routed": {index: ROUTED_UPDATES.value(index) for index in range(self.workers)},
+            "rejected": {index: REJECTED_UPDATES.value(index) for index in range(self.workers)},
+            "processed": {index: report["processed"] for index, report in self.latest.items()},
+        }
@@ -0,0 +1,109 @@
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (chat_id, user_id)
+XPKey = Tuple[int, int]
+
+
+class PendingXP:
+    """Buffered running totals for one user in one chat since the last flush."""
+
+    __slots__ = ("level", "xp", "messages_count", "messages", "username", "first_name", "last_message_time")
+
+    def __init__(self, level: int, xp: int, messages_count: int = 0):
+        self.level = level
+        self.xp = xp
+        self.messages_count = messages_count
+        # Messages counted since the last flush
+        self.messages = 0
+        self.username = ""
+        self.first_name = ""
+        self.last_message_time: Optional[datetime] = None
+
+
+class XPAccumulator:
+    """In-memory write-behind buffer for user_levels.
+
+    Entries hold absolute XP/level totals (so level-ups are detected
+    immediately) plus the number of messages counted since the last flush.
+    Callers are responsible for locking; AnimeBotDatabase serializes access.
+    """
+
+    def __init__(self, max_pending: int = 500):
+        self.max_pending = max_pending
+        self._pending: Dict[XPKey, PendingXP] = {}
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.updates_buffered = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, key: XPKey):
+        return key in self._pending
+
+    def get(self, key: XPKey) -> Optional[PendingXP]:
+        return self._pending.get(key)
+
+    def add(self, key: XPKey, username: str, first_name: str, xp: int,
+            load_totals: Callable[[XPKey], Tuple[int, int, int]],
+            calculate_level: Callable[[int], int]) -> Tuple[int, int, bool]:
+        """Buffer an XP gain and return (level, xp, leveled_up) from the new totals.
+
+        ``load_totals`` returns the persisted (level, xp, messages_count) and
+        is only called for keys not already buffered.
+        """
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = PendingXP(*load_totals(key))
+            self._pending[key] = entry
+
+        previous_level = entry.level
+        entry.xp += xp
+        entry.level = calculate_level(entry.xp)
+        entry.messages += 1
+        entry.messages_count += 1
+        entry.username = username
+        entry.first_name = first_name
+        entry.last_message_time = datetime.now()
+        self.updates_buffered += 1
+        return entry.level, entry.xp, entry.level > previous_level
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._pending) >= self.max_pending
+
+    def snapshot(self) -> Tuple[List[tuple], Dict[XPKey, int]]:
+        """UPSERT rows for every pending entry, plus the message counts they cover.
+
+        Entries stay buffered until mark_flushed(), so the lock can be
+        released while the rows are written.
+        """
+        rows = []
+        covered = {}
+        for (chat_id, user_id), e in self._pending.items():
+            rows.append((chat_id, user_id, e.username, e.first_name, e.xp, e.level,
+                         e.messages, e.last_message_time))
+            covered[(chat_id, user_id)] = e.messages
+        return rows, covered
+
+    def mark_flushed(self, covered: Dict[XPKey, int]):
+        """Drop entries whose snapshot was committed and that have not changed since."""
+        for key, messages in covered.items():
+            entry = self._pending.get(key)
+            if entry is None:
+                continue
+            entry.messages -= messages
+            if entry.messages <= 0:
+                del self._pending[key]
+        if covered:
+            self.flushes += 1
+            self.rows_flushed += len(covered)
+
+    def get_metrics(self) -> Dict:
+        return {
+            "pending_users": len(self._pending),
+            "updates_buffered": self.updates_buffered,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+        }